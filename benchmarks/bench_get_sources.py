@@ -0,0 +1,110 @@
+"""
+Micro-benchmark of get_sources against the row-by-row implementation it replaced.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_get_sources.py --rows 20000
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import app
+from app import get_sources, is_valid_url, parse_source_url
+from titles import TitleIndex
+
+ORIGIN_URL = "https://example.com/model_card.pdf"
+SOURCE_TEMPLATES = [
+    "https://arxiv.org/abs/{id}",
+    "https://arxiv.org/pdf/{id}",
+    "https://arxiv.org/{id}",
+    "https://aclanthology.org/D17-{n}",
+    "https://example.com/papers/{n}.pdf",
+    "Beyond the imitation game: paper {n}",
+    "-",
+]
+
+
+def make_input(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    sources = []
+    for i in range(rows):
+        template = rng.choice(SOURCE_TEMPLATES)
+        sources.append(template.format(id=f"{2000 + i % 500}.{i:05d}", n=i))
+    return pd.DataFrame(
+        {
+            "name": [f"benchmark-{i}" for i in range(rows)],
+            "test_type": "5-shot",
+            "Model A": "86.8%",
+            "source": sources,
+        }
+    )
+
+
+def row_by_row_get_sources(input_df, source_type, origin_url):
+    """The previous implementation: pydantic validation and rewriting per row"""
+    df = input_df.copy()
+    df = df.replace("-", None)
+    df = df.dropna(subset="source")
+    df = df[df["source"].apply(is_valid_url)]
+    return pd.DataFrame(
+        {
+            "name": df["name"],
+            "url": df["source"].apply(lambda x: parse_source_url(x)),
+            "origin_url": origin_url,
+            "crawled_timestamp": None,
+            "added_timestamp": pd.Timestamp.now(),
+            "type": source_type,
+            "success": None,
+            "cost": None,
+        }
+    ).reset_index(drop=True)
+
+
+def best_of(fn, repeat: int) -> tuple[float, pd.DataFrame]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Measure the code, not the log handlers
+    app.logger.setLevel(logging.WARNING)
+    input_df = make_input(args.rows)
+
+    old_time, old_df = best_of(
+        lambda: row_by_row_get_sources(input_df, "benchmark", ORIGIN_URL), args.repeat
+    )
+    # The row-by-row version drops paper titles, an empty index does the same
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        resolver = TitleIndex(Path(tmp_dir) / "titles.db")
+        new_time, new_df = best_of(
+            lambda: get_sources(input_df, "benchmark", ORIGIN_URL, resolver),
+            args.repeat,
+        )
+
+    cols = [col for col in old_df.columns if col != "added_timestamp"]
+    pd.testing.assert_frame_equal(new_df[cols], old_df[cols])
+
+    print(f"rows:        {args.rows}")
+    print(f"row-by-row:  {old_time * 1000:.1f} ms")
+    print(f"vectorized:  {new_time * 1000:.1f} ms")
+    print(f"speedup:     {old_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
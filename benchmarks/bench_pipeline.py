@@ -0,0 +1,437 @@
+"""
+End-to-end benchmark of the crawl pipeline against local stand-ins.
+
+Synthetic model-card PDFs of varying size and table count are served by a local
+HTTP server, next to a fake Messages API that streams each card's table back
+with a configurable latency. Every crawl mode runs in a fresh process that
+reports documents per second, p50/p99 latency per stage (from the metrics
+spans) and peak RSS.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py \
+        --output benchmarks/baseline.json
+    PYTHONPATH=src python benchmarks/bench_pipeline.py \
+        --compare benchmarks/baseline.json
+"""
+
+import argparse
+import base64
+import json
+import platform
+import random
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from pathlib import Path
+
+MODES = ["sequential", "concurrent"]
+STAGES = [
+    "download",
+    "preprocess",
+    "encode",
+    "completion",
+    "parse",
+    "results",
+    "sources",
+    "store",
+]
+# Relative change of throughput or peak RSS reported as a regression
+REGRESSION_TOLERANCE = 0.2
+
+MODEL_NAMES = ["Model A", "Model B", "Model C", "Model D", "Model E", "Model F"]
+TEST_TYPES = ["0-shot", "5-shot", "0-shot CoT", "25-shot", "Pass@1"]
+FILLER_WORDS = (
+    "the model is evaluated on a broad set of tasks covering reasoning coding "
+    "and knowledge with results reported against strong baselines"
+).split()
+CARD_MARKER = re.compile(rb"Card (\d+) table")
+
+
+@dataclass
+class Config:
+    documents: int = 24
+    workers: int = 4
+    seed: int = 0
+    min_pages: int = 2
+    max_pages: int = 12
+    max_tables: int = 3
+    rows: int = 12
+    # Fake API: time to first token and streaming speed of the completion
+    ttft: float = 0.2
+    chars_per_second: float = 4000.0
+    # Fake file server: time to first byte of every download
+    download_latency: float = 0.02
+
+
+def pdf_string(text: str) -> str:
+    return "(" + re.sub(r"([\\()])", r"\\\1", text) + ")"
+
+
+def make_pdf(pages: list[list[str]]) -> bytes:
+    """Returns a minimal PDF with one text line per entry of each page"""
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, lines in zip(page_ids, pages):
+        page = (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792]"
+            f" /Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        )
+        objects.append(page.encode())
+        text = " ".join(f"{pdf_string(line)} '" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 40 770 Td {text} ET".encode("latin-1")
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
+
+
+def make_card(index: int, config: Config, rng: random.Random) -> tuple[bytes, str]:
+    """Returns a synthetic model card and the CSV completion of its main table"""
+    models = MODEL_NAMES[: rng.randint(3, len(MODEL_NAMES))]
+    pages = []
+    for _ in range(rng.randint(config.min_pages, config.max_pages)):
+        pages.append([" ".join(rng.choices(FILLER_WORDS, k=14)) for _ in range(60)])
+
+    csv_rows = []
+    for table in range(rng.randint(1, config.max_tables)):
+        lines = [f"Card {index} table {table}", "Benchmark " + " ".join(models)]
+        for row in range(config.rows):
+            name = f"Bench-{index}-{table}-{row}"
+            test_type = rng.choice(TEST_TYPES)
+            scores = [f"{rng.uniform(20, 95):.1f}%" for _ in models]
+            lines.append(f"{name} {test_type.replace(' ', '-')} {' '.join(scores)}")
+            if table == 0:
+                source = f"https://arxiv.org/abs/{2000 + index % 500}.{row:05d}"
+                csv_rows.append(",".join([name, test_type, *scores, source]))
+        pages.insert(rng.randint(0, len(pages)), lines)
+    pages.append([f"[{i}] A. Author. Paper {i}. arXiv, 2024." for i in range(1, 30)])
+
+    completion = "\n".join(
+        [",".join(["name", "test_type", *models, "source"])] + csv_rows
+    )
+    return make_pdf(pages), completion
+
+
+def sse_events(text: str, input_tokens: int) -> list[bytes]:
+    """Returns the server-sent events of a streamed Messages API response"""
+    message = {
+        "id": "msg_bench",
+        "type": "message",
+        "role": "assistant",
+        "model": "claude-bench",
+        "content": [],
+        "stop_reason": None,
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+    }
+    events = [
+        ("message_start", {"type": "message_start", "message": message}),
+        (
+            "content_block_start",
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            },
+        ),
+    ]
+    for i in range(0, len(text), 64):
+        delta = {"type": "text_delta", "text": text[i : i + 64]}
+        events.append(
+            (
+                "content_block_delta",
+                {"type": "content_block_delta", "index": 0, "delta": delta},
+            )
+        )
+    events += [
+        ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        (
+            "message_delta",
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": len(text) // 4},
+            },
+        ),
+        ("message_stop", {"type": "message_stop"}),
+    ]
+    return [
+        f"event: {name}\ndata: {json.dumps(data)}\n\n".encode() for name, data in events
+    ]
+
+
+class StandInServer:
+    """Serves the synthetic cards at /cards/<i>.pdf and a fake Messages API"""
+
+    def __init__(self, config: Config):
+        rng = random.Random(config.seed)
+        self.config = config
+        self.cards = [make_card(i, config, rng) for i in range(config.documents)]
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def card_urls(self) -> list[str]:
+        return [f"{self.base_url}/cards/{i}.pdf" for i in range(len(self.cards))]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                match = re.fullmatch(r"/cards/(\d+)\.pdf", self.path)
+                if match is None or int(match[1]) >= len(server.cards):
+                    self.send_error(404)
+                    return
+                time.sleep(server.config.download_latency)
+                body = server.cards[int(match[1])][0]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/pdf")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                payload = json.loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                document = payload["messages"][0]["content"][0]["source"]["data"]
+                match = CARD_MARKER.search(base64.b64decode(document))
+                completion = server.cards[int(match[1]) if match else 0][1]
+                chunks = sse_events(completion, len(document) // 60)
+                # Time to first token, then the text streams at a fixed speed
+                time.sleep(server.config.ttft)
+                delay = len(completion) / server.config.chars_per_second / len(chunks)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+                    time.sleep(delay)
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "StandInServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+
+
+def percentile(values: list[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def run_mode(mode: str, config: Config, base_url: str, urls: list[str]) -> dict:
+    """Crawls every card in this process and returns the measurements"""
+    from logger import configure_logging
+
+    # Measure the pipeline, not the log output
+    configure_logging("warning")
+
+    from anthropic import Anthropic
+
+    import app
+    import cache
+    import downloader
+    import engines
+    import llm
+    import metrics
+    import results
+    import store
+    import titles
+
+    work_dir = Path(tempfile.mkdtemp(prefix=f"bench-{mode}-"))
+    cache._default_pdf_cache = cache.PdfCache(work_dir / "pdfs")
+    cache._default_completion_cache = cache.CompletionCache(work_dir / "completions.db")
+    store._default_source_store = store.SourceStore(
+        work_dir / "sources.db", csv_path=None
+    )
+    results._default_results_store = results.ResultsStore(work_dir / "results")
+    titles._default_title_index = titles.TitleIndex(work_dir / "titles.db")
+    metrics._default_metrics = metrics.Metrics(work_dir / "metrics.jsonl")
+    # Every card comes from the one stand-in host, which needs no politeness
+    downloader._default_downloader = downloader.Downloader(
+        per_host=config.workers, requests_per_minute=60_000, host_rpm={}
+    )
+    llm._client = Anthropic(api_key="bench", base_url=base_url, max_retries=0)
+    engines.EXTRACTION_ENGINES = ["llm"]
+    app.benchmark_sources_path = work_dir / "benchmark_sources.csv"
+
+    document_seconds = []
+    crawl_model_url = app.crawl_model_url
+
+    def timed_crawl(url: str):
+        start = time.perf_counter()
+        try:
+            return crawl_model_url(url)
+        finally:
+            document_seconds.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    if mode == "sequential":
+        for url in urls:
+            timed_crawl(url)
+    else:
+        sources_path = work_dir / "model_sources.csv"
+        sources_path.write_text(
+            "name,url,origin_url,crawled_timestamp,added_timestamp,type,success,cost\n"
+            + "".join(f"card-{i},{url},,,,model,,\n" for i, url in enumerate(urls))
+        )
+        app.crawl_model_url = timed_crawl
+        app.main(str(sources_path), max_workers=config.workers, max_depth=0)
+    elapsed = time.perf_counter() - start
+
+    spans: dict[str, list[float]] = {}
+    with open(work_dir / "metrics.jsonl") as f:
+        for line in f:
+            span = json.loads(line)
+            spans.setdefault(span["stage"], []).append(span["seconds"])
+    latencies = {"document": document_seconds, **spans}
+    return {
+        "documents": len(document_seconds),
+        "seconds": round(elapsed, 3),
+        "docs_per_second": round(len(document_seconds) / elapsed, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "latency_ms": {
+            stage: {
+                "count": len(values),
+                "p50": round(percentile(values, 50) * 1000, 2),
+                "p99": round(percentile(values, 99) * 1000, 2),
+            }
+            for stage, values in latencies.items()
+            if stage == "document" or stage in STAGES
+        },
+    }
+
+
+def run(config: Config, modes: list[str]) -> dict:
+    report = {
+        "config": asdict(config),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "modes": {},
+    }
+    with StandInServer(config) as server:
+        sizes = [len(card) for card, _ in server.cards]
+        report["card_bytes"] = {
+            "min": min(sizes),
+            "max": max(sizes),
+            "total": sum(sizes),
+        }
+        for mode in modes:
+            # A fresh process per mode, so peak RSS and caches are its own
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                report["modes"][mode] = pool.submit(
+                    run_mode, mode, config, server.base_url, server.card_urls()
+                ).result()
+    return report
+
+
+def compare(
+    report: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE
+) -> list[str]:
+    """Returns the regressions of a report against a baseline"""
+    regressions = []
+    for mode, current in report["modes"].items():
+        previous = baseline["modes"].get(mode)
+        if previous is None:
+            continue
+        if current["docs_per_second"] < previous["docs_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{mode}: {current['docs_per_second']} docs/s, "
+                f"baseline {previous['docs_per_second']}"
+            )
+        if current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{mode}: peak RSS {current['peak_rss_mb']} MB, "
+                f"baseline {previous['peak_rss_mb']}"
+            )
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    for mode, result in report["modes"].items():
+        print(
+            f"{mode}: {result['documents']} documents in {result['seconds']:.2f}s, "
+            f"{result['docs_per_second']:.2f} docs/s, "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+        for stage, latency in result["latency_ms"].items():
+            print(
+                f"  {stage:<11} n={latency['count']:<4} p50 {latency['p50']:>8.2f} ms"
+                f"  p99 {latency['p99']:>8.2f} ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    defaults = Config()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}", type=type(value), default=value
+        )
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    args = parser.parse_args()
+
+    config = Config(**{name: getattr(args, name) for name in asdict(defaults)})
+    report = run(config, args.modes)
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,131 @@
+import logging
 from datetime import datetime
 from io import StringIO
+from typing import Optional
 
+import numpy as np
 import pandas as pd
+import pyarrow.compute as pc
 from pydantic import HttpUrl, ValidationError
 
 import utils
-from constants import benchmark_results_path, benchmark_sources_path, model_sources_path
-from llm import get_completion
-from logger import get_logger
+from batch import extract_batch
+from constants import benchmark_sources_path, model_sources_path
+from engines import extract_benchmarks
+from frontier import CRAWL_MAX_DEPTH, Frontier
+from logger import SAMPLED, get_logger
+from metrics import METRICS_PORT, get_metrics
+from preprocess import Preprocessed, get_preprocessor
+from results import get_results_store
+from scheduler import (
+    CRAWL_WORKERS,
+    METADATA_COLS,
+    TIMESTAMP_FORMAT,
+    crawl_frontier,
+    pending_rows,
+    save_metadata,
+)
+from store import get_source_store
+from titles import TitleIndex, get_title_index
+from urls import canonical_url, canonicalize_urls, paper_key, string_array
 
 logger = get_logger(__name__)
 
+# Well-formed http(s) URLs that pydantic's HttpUrl always accepts: plain DNS
+# host names (ending in a non-numeric label, no punycode), an optional valid
+# port, and printable ASCII after the host. The patterns run in Arrow's RE2
+# kernels, which have no lookarounds, so punycode hosts are a pattern of their
+# own, and a final newline is allowed the way Python's `$` allows it
+_HOST_LABEL = r"[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?"
+_PORT = (
+    r"(?:[1-9][0-9]{0,3}|[1-5][0-9]{4}|6[0-4][0-9]{3}|65[0-4][0-9]{2}"
+    r"|655[0-2][0-9]|6553[0-5])"
+)
+SIMPLE_URL_PATTERN = (
+    rf"(?i)^https?://(?:{_HOST_LABEL}\.)*[a-z][a-z0-9-]{{0,62}}"
+    rf"(?::{_PORT})?(?:[/?#][!-~]*)?\n?$"
+)
+PUNYCODE_HOST_PATTERN = r"(?i)^https?://(?:[^/?#:]*\.)?xn--"
+SIMPLE_URL_MAX_LENGTH = 2000
+# Strings that cannot be http(s) URLs: no http(s) scheme after the leading
+# whitespace the URL parser strips, and no tabs or newlines it would remove
+HTTP_SCHEME_PATTERN = r"(?i)^[\x00-\x20]*https?:"
+PLAIN_TEXT_PATTERN = r"^[^\t\n\r]*\n?$"
+
+
+class _InvalidUrls(list):
+    def __str__(self) -> str:
+        return "\n".join(f"- {url}" for url in self)
+
 
 def is_valid_url(s: str) -> bool:
     try:
         HttpUrl(s)
-        logger.debug(f"Valid URL found: {s}")
+        logger.debug("Valid URL found: %s", s, extra=SAMPLED)
         return True
     except ValidationError:
-        logger.debug(f"Invalid URL found: {s}")
+        logger.debug("Invalid URL found: %s", s, extra=SAMPLED)
         return False
 
 
 def parse_source_url(source: str) -> str:
     """Extract PDF URL from general link"""
-    logger.debug(f"Parsing source URL: {source}")
-    if "arxiv.org" in source:
-        if "/abs/" in source:
-            result = source.replace("/abs/", "/pdf/") + ".pdf"
-            logger.debug(f"Converted arXiv abstract URL to PDF: {result}")
-            return result
-        if "/pdf/" not in source:
-            result = source + ".pdf"
-            logger.debug(f"Added PDF extension to arXiv URL: {result}")
-            return result
-    elif "aclanthology.org" in source:
-        result = source + ".pdf"
-        logger.debug(f"Added PDF extension to ACL URL: {result}")
-        return result
-    logger.debug(f"No URL transformation needed: {source}")
-    return source
+    result = canonical_url(source)
+    logger.debug("Parsed source URL %s to %s", source, result, extra=SAMPLED)
+    return result
 
 
 def get_sources(
-    input_df: pd.DataFrame, source_type: str, origin_url: str
+    input_df: pd.DataFrame,
+    source_type: str,
+    origin_url: str,
+    resolver: Optional[TitleIndex] = None,
 ) -> pd.DataFrame:
     """
     Process input DataFrame to create source tracking DataFrame.
+
+    Sources given as paper titles are first resolved to URLs with the local
+    title index (`resolver`, defaults to the process-wide index); titles it does
+    not know are dropped with the other invalid URLs.
+
+    Validation and URL rewriting are vectorized. Sources that are plainly
+    well-formed URLs or plainly not URLs are classified with Arrow's regex
+    kernels, only the ambiguous remainder goes through `is_valid_url`, so the
+    output is the same as validating every row with pydantic.
     """
     logger.info(f"Processing sources for type: {source_type}")
-    logger.debug(f"Input DataFrame shape: {input_df.shape}")
-
-    df = input_df.copy()
+    logger.debug("Input DataFrame shape: %s", input_df.shape)
 
     # Check input df schema
     required_cols = ["name", "source"]
-    if not all((col in list(df.columns) for col in required_cols)):
-        logger.error(f"Missing required columns. Found: {list(df.columns)}")
+    if not all((col in list(input_df.columns) for col in required_cols)):
+        logger.error(f"Missing required columns. Found: {list(input_df.columns)}")
         raise ValueError(f"DataFrame must contain columns: {required_cols}")
 
     # First remove blank/empty sources
-    initial_rows = len(df)
-    df = df.replace("-", None)
-    df = df.dropna(subset="source")
-    rows_after_blanks = len(df)
+    initial_rows = len(input_df)
+    sources = input_df["source"]
+    has_source = sources.notna() & (sources != "-")
+    sources = sources[has_source]
+    rows_after_blanks = len(sources)
     logger.info(f"Removed {initial_rows - rows_after_blanks} rows with empty sources")
 
-    # Then filter invalid URLs
-    valid_url_mask = df["source"].apply(is_valid_url)
-    invalid_urls = df[~valid_url_mask]["source"].tolist()
-    df = df[valid_url_mask]
-    final_rows = len(df)
-
+    # Then resolve paper titles and filter invalid URLs
+    resolver = resolver if resolver is not None else get_title_index()
+    is_simple_url, is_title = _classify_sources(sources)
+    sources, is_resolved = _resolve_titles(sources, is_title, resolver)
+    # Resolved titles are URLs from the index, checked like ambiguous sources
+    valid_url_mask = _valid_url_mask(sources, is_simple_url, is_title & ~is_resolved)
+    if logger.isEnabledFor(logging.DEBUG):
+        # The listener joins the list when the record is written
+        invalid_urls = _InvalidUrls(sources[~valid_url_mask].tolist())
+        logger.debug("Invalid URLs were:\n%s", invalid_urls)
+    sources = sources[valid_url_mask]
+    final_rows = len(sources)
     logger.info(f"Filtered {rows_after_blanks - final_rows} invalid URLs")
-    logger.debug("Invalid URLs were:\n" + "\n".join(f"- {url}" for url in invalid_urls))
+
+    names = input_df["name"].loc[sources.index]
+    names = names.where(names != "-", None)
 
     # Get output df
     now = pd.Timestamp.now()
@@ -81,8 +133,8 @@ def get_sources(
     try:
         result_df = pd.DataFrame(
             {
-                "name": df["name"],
-                "url": df["source"].apply(lambda x: parse_source_url(x)),
+                "name": names,
+                "url": canonicalize_urls(sources)["url"],
                 "origin_url": origin_url,
                 "crawled_timestamp": None,
                 "added_timestamp": now,
@@ -98,42 +150,131 @@ def get_sources(
         raise
 
 
-def crawl_model_url(source_url: str) -> None:
-    """Crawl model URL and save source_df and benchmark_results_df"""
+def _classify_sources(sources: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns which sources are plainly valid URLs and which are plainly not URLs.
+
+    Both masks come from Arrow's regex kernels over the whole column. Sources in
+    neither, including values that are not strings, need the per-row check.
+    """
+    text = string_array(sources)
+    is_simple_url = pc.and_(
+        pc.and_not(
+            pc.match_substring_regex(text, SIMPLE_URL_PATTERN),
+            pc.match_substring_regex(text, PUNYCODE_HOST_PATTERN),
+        ),
+        pc.less_equal(pc.utf8_length(text), SIMPLE_URL_MAX_LENGTH),
+    )
+    is_not_url = pc.and_not(
+        pc.match_substring_regex(text, PLAIN_TEXT_PATTERN),
+        pc.match_substring_regex(text, HTTP_SCHEME_PATTERN),
+    )
+    return (
+        is_simple_url.fill_null(False).to_numpy(zero_copy_only=False),
+        is_not_url.fill_null(False).to_numpy(zero_copy_only=False),
+    )
+
+
+def _resolve_titles(
+    sources: pd.Series, is_title: np.ndarray, resolver: TitleIndex
+) -> tuple[pd.Series, np.ndarray]:
+    """
+    Replaces the sources that are not URLs by the URL of the matching paper.
+
+    Returns the new sources and which of them were resolved.
+    """
+    is_resolved = np.zeros(len(sources), dtype=bool)
+    if not is_title.any() or resolver.is_empty():
+        return sources, is_resolved
+    resolved = sources[is_title].map(resolver.resolve)
+    is_resolved[is_title] = resolved.notna().to_numpy(dtype=bool)
+    logger.info(f"Resolved {int(is_resolved.sum())}/{int(is_title.sum())} paper titles")
+    if not is_resolved.any():
+        return sources, is_resolved
+    sources = sources.astype(object).copy()
+    sources[is_resolved] = resolved.dropna().to_numpy()
+    return sources, is_resolved
+
+
+def _valid_url_mask(
+    sources: pd.Series, is_simple_url: np.ndarray, is_not_url: np.ndarray
+) -> pd.Series:
+    """Vectorized is_valid_url over a Series of classified sources"""
+    valid = is_simple_url.copy()
+    ambiguous = ~is_simple_url & ~is_not_url
+    if ambiguous.any():
+        valid[ambiguous] = sources[ambiguous].map(is_valid_url).to_numpy(dtype=bool)
+    return pd.Series(valid, index=sources.index)
+
+
+def crawl_model_url(source_url: str) -> Optional[float]:
+    """Crawl model URL and save source_df and benchmark_results_df.
+
+    Returns the cost of the API requests made for the crawl, None if unknown.
+    """
+    metrics = get_metrics()
+    with metrics.crawl(source_url) as crawl:
+        _crawl_model_url(source_url)
+    logger.info(
+        f"Crawled {source_url} with {crawl.input_tokens} input and "
+        f"{crawl.output_tokens} output tokens"
+    )
+    return crawl.cost
+
+
+def _crawl_model_url(source_url: str) -> None:
     logger.info(f"Downloading source file from {source_url}")
-    source_fpath = utils.download_file(source_url)
+    with get_metrics().span("download") as span:
+        source_fpath = utils.download_file(source_url)
+        span.bytes = source_fpath.stat().st_size
     logger.info(f"Successfully downloaded file from {source_url}")
 
+    # Parsing runs in the preprocessing processes, this thread only waits
+    with get_metrics().span("preprocess"):
+        prepared = get_preprocessor().preprocess(source_fpath)
     try:
-        source_file_base64 = utils.encode_file(source_fpath)
-        logger.info("Successfully encoded source file")
+        _extract_and_save(source_url, prepared)
+    finally:
+        prepared.cleanup()
 
-    except Exception as e:
-        logger.error(f"Failed to encode file {source_fpath}: {e}")
-        raise
 
-    try:
-        completion = get_completion(source_file_base64)
-        logger.info("Successfully got Claude response of benchmark table")
-
-    except Exception as e:
-        logger.error(f"Failed to get completion: {e}")
-        raise
+def _extract_and_save(source_url: str, prepared: Preprocessed) -> None:
+    if paper_key(source_url) is not None and prepared.title is not None:
+        try:
+            get_title_index().add_titles([(prepared.title, canonical_url(source_url))])
+        except Exception as e:
+            logger.warning(f"Failed to index the title of {source_url}: {e}")
+
+    def add_streamed_sources(rows_df: pd.DataFrame) -> None:
+        # Sources of complete rows are stored while the rest of the table streams
+        # in, save_benchmarks adds the full table again, which is a no-op for these
+        added = get_source_store().add_sources(
+            get_sources(rows_df, "benchmark", source_url)
+        )
+        logger.info(f"Added {added} new sources from {len(rows_df)} streamed rows")
 
     try:
-        benchmark_df = pd.read_csv(StringIO(completion))
-        benchmark_df.to_csv(benchmark_results_path, index=False)
-        logger.info(
-            "Successfully loaded Claude response into df and saved benchmark results"
+        benchmark_df = extract_benchmarks(
+            prepared.file_path, on_rows=add_streamed_sources, prepared=prepared
         )
-
     except Exception as e:
-        logger.error(f"Failed to create benchmark DataFrame: {e}")
+        logger.error(f"Failed to extract benchmark table: {e}")
         raise
 
+    save_benchmarks(benchmark_df, source_url)
+
+
+def save_benchmarks(benchmark_df: pd.DataFrame, source_url: str) -> None:
+    """Saves the benchmark results of a document and adds its sources to the store"""
+    metrics = get_metrics()
+    with metrics.span("results", source_url):
+        get_results_store().append(benchmark_df, source_url)
+    logger.info("Successfully saved benchmark results")
+
     try:
         logger.info("Processing sources")
-        source_df = get_sources(benchmark_df, "benchmark", source_url)
+        with metrics.span("sources", source_url):
+            source_df = get_sources(benchmark_df, "benchmark", source_url)
         logger.info("Successfully processed sources")
 
     except Exception as e:
@@ -141,65 +282,96 @@ def crawl_model_url(source_url: str) -> None:
         raise
 
     try:
-        logger.info(f"Appending benchmark_sources {benchmark_sources_path}")
-
-        try:
-            # Try to load existing file
-            existing_df = pd.read_csv(benchmark_sources_path)
-
-            # Filter source_df to only include new URLs
-            new_rows = source_df[~source_df["url"].isin(existing_df["url"])]
-
-            if len(new_rows) > 0:
-                # Append new rows and save
-                updated_df = pd.concat([existing_df, new_rows], ignore_index=True)
-                updated_df.to_csv(benchmark_sources_path, index=False)
-                logger.info(
-                    f"Successfully appended {len(new_rows)} new rows to existing file"
-                )
-            else:
-                logger.info("No new URLs to add, existing file unchanged")
-
-        except FileNotFoundError:
-            # If file doesn't exist, save the new dataframe
-            logger.info(
-                f"No existing file found at {benchmark_sources_path}, creating new file"
-            )
-            source_df.to_csv(benchmark_sources_path, index=False)
-            logger.info("Successfully created new file with results")
+        logger.info("Adding benchmark sources to the source store")
+        with metrics.span("store", source_url):
+            added = get_source_store().add_sources(source_df)
+        logger.info(f"Successfully added {added} new sources")
 
     except Exception as e:
-        # If loading/appending fails for other reasons, overwrite the file
-        logger.warning(f"Error while trying to append: {e}. Overwriting file instead")
-        source_df.to_csv(benchmark_sources_path, index=False)
-        logger.info("Successfully overwrote file with new results")
-
-
-def main(source_df_path: str):
-    """Crawls urls from source_df."""
+        logger.error(f"Failed to add sources: {e}")
+        raise
 
-    full_sources_df = pd.read_csv(source_df_path)
 
-    row_to_crawl = full_sources_df.loc[0]
-    url_to_crawl = row_to_crawl["url"]
-    url_to_crawl = str(url_to_crawl)  # TEMP: gets rid of type warning
+def crawl_batch(source_df_path: str) -> pd.DataFrame:
+    """
+    Crawls every pending url from source_df with Message Batches.
 
-    crawl_model_url(url_to_crawl)
+    For bulk offline runs: the documents are downloaded up front, extracted
+    with batch requests at a lower price than interactive ones, and each result
+    is mapped back to its source row by custom_id.
 
-    # Update the crawled row
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-    full_sources_df.loc[0, "crawled_timestamp"] = current_time
-    full_sources_df.loc[0, "success"] = True
-    full_sources_df.loc[0, "cost"] = 0.1
+    Returns the updated sources DataFrame.
+    """
+    sources_df = pd.read_csv(source_df_path)
+    for col in METADATA_COLS:
+        sources_df[col] = sources_df[col].astype("object")
+
+    to_crawl = pending_rows(sources_df)
+    logger.info(f"Found {len(to_crawl)} pending rows for batch extraction")
+    errors = {}
+    documents = {}
+    for idx in to_crawl:
+        url = str(sources_df.at[idx, "url"])
+        try:
+            documents[f"row-{idx}"] = utils.download_file(url)
+        except Exception as e:
+            errors[idx] = e
+
+    results = extract_batch(documents)
+    costs = {
+        int(custom_id.removeprefix("row-")): cost
+        for custom_id, cost in results.costs.items()
+    }
+    for custom_id, error in results.errors.items():
+        errors[int(custom_id.removeprefix("row-"))] = error
+    for custom_id, completion in results.completions.items():
+        idx = int(custom_id.removeprefix("row-"))
+        try:
+            benchmark_df = pd.read_csv(StringIO(completion))
+            save_benchmarks(benchmark_df, str(sources_df.at[idx, "url"]))
+        except Exception as e:
+            errors[idx] = e
+
+    crawled_timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+    for idx in to_crawl:
+        if idx in errors:
+            logger.error(f"Failed to crawl {sources_df.at[idx, 'url']}: {errors[idx]}")
+        sources_df.at[idx, "crawled_timestamp"] = crawled_timestamp
+        sources_df.at[idx, "success"] = idx not in errors
+        sources_df.at[idx, "cost"] = costs.get(idx)
+
+    save_metadata(sources_df, source_df_path)
+    get_source_store().export_csv(benchmark_sources_path)
+    logger.info(f"Crawled {len(to_crawl) - len(errors)}/{len(to_crawl)} rows in batch")
+    return sources_df
+
+
+def main(
+    source_df_path: str,
+    max_workers: int = CRAWL_WORKERS,
+    max_depth: int = CRAWL_MAX_DEPTH,
+    runner_id: Optional[str] = None,
+):
+    """
+    Crawls the urls of source_df and, recursively, the benchmark sources found.
 
-    # Save the updated dataframe
+    Crawl progress is persisted in the frontier, so an interrupted run resumes
+    where it stopped. Several runners, e.g. on hosts sharing the source store,
+    can run this at the same time: each claims entries under its own
+    `runner_id` lease, and a crashed runner's entries go to the others.
+    """
+    if METRICS_PORT:
+        get_metrics().serve(METRICS_PORT)
+    store = get_source_store()
+    frontier = Frontier(store, max_depth=max_depth, runner_id=runner_id)
+    frontier.seed(pd.read_csv(source_df_path))
+    frontier.discover()
     try:
-        logger.info(f"Updating crawl metadata in {source_df_path}")
-        full_sources_df.to_csv(source_df_path, index=False)
-        logger.info("Successfully updated crawl metadata.")
-    except Exception as e:
-        logger.error(f"Failed to save updated results to {source_df_path}: {e}")
-        raise
+        crawl_frontier(frontier, crawl_model_url, max_workers=max_workers)
+    finally:
+        get_preprocessor().shutdown()
+    frontier.export_metadata(source_df_path)
+    store.export_csv(benchmark_sources_path)
 
 
 if __name__ == "__main__":
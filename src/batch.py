@@ -0,0 +1,265 @@
+import os
+import time
+from dataclasses import dataclass, field
+from io import StringIO
+from pathlib import Path
+from typing import Callable, Mapping, Optional, Sequence
+
+import pandas as pd
+from anthropic import Anthropic
+from anthropic.types.messages import MessageBatch
+
+from cache import get_completion_cache, sha256_file
+from constants import MODEL_NAME
+from engines import encode_document, route_models, validate_benchmark_frame
+from llm import MAX_TOKENS, build_messages, get_client, prompt
+from logger import get_logger
+from metrics import get_metrics
+
+logger = get_logger(__name__)
+
+# The API accepts batches of up to 100,000 requests and 256 MB
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "10000"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "60"))
+# Batches expire after 24 hours
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", str(24 * 3600)))
+
+# Estimate of the JSON request size on top of the base64 document
+REQUEST_OVERHEAD_BYTES = len(prompt) + 1024
+
+
+class BatchTimeoutError(TimeoutError):
+    """Raised when a batch has not ended within the timeout"""
+
+
+@dataclass
+class BatchResults:
+    """Completions, error messages and costs of a batch extraction, by custom_id"""
+
+    completions: dict[str, str] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+    costs: dict[str, Optional[float]] = field(default_factory=dict)
+
+
+def build_request(custom_id: str, source_base64: str, model: str = MODEL_NAME) -> dict:
+    """Returns a Message Batch request for the extraction of a base64 PDF"""
+    return {
+        "custom_id": custom_id,
+        "params": {
+            "model": model,
+            "max_tokens": MAX_TOKENS,
+            "messages": build_messages(source_base64),
+        },
+    }
+
+
+def submit_batch(client: Anthropic, requests: list[dict]) -> str:
+    """Creates a Message Batch and returns its id"""
+    batch = client.messages.batches.create(requests=requests)
+    logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+    return batch.id
+
+
+def wait_for_batch(
+    client: Anthropic,
+    batch_id: str,
+    poll_seconds: float = BATCH_POLL_SECONDS,
+    timeout: float = BATCH_TIMEOUT_SECONDS,
+    sleep: Callable[[float], None] = time.sleep,
+) -> MessageBatch:
+    """
+    Polls a Message Batch until it has ended.
+
+    Raises:
+        BatchTimeoutError: If the batch is still processing after `timeout`
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status == "ended":
+            counts = batch.request_counts
+            logger.info(
+                f"Batch {batch_id} ended: {counts.succeeded} succeeded, "
+                f"{counts.errored} errored, {counts.expired} expired"
+            )
+            return batch
+        if time.monotonic() >= deadline:
+            raise BatchTimeoutError(f"Batch {batch_id} did not end in {timeout}s")
+        logger.debug("Batch %s is %s, waiting", batch_id, batch.processing_status)
+        sleep(poll_seconds)
+
+
+def collect_results(
+    client: Anthropic, batch_id: str, results: BatchResults, model: str = MODEL_NAME
+) -> None:
+    """Adds the results of an ended batch of `model` requests to `results`"""
+    for entry in client.messages.batches.results(batch_id):
+        result = entry.result
+        if result.type == "succeeded":
+            results.completions[entry.custom_id] = result.message.content[0].text
+            results.costs[entry.custom_id] = get_metrics().record_usage(
+                result.message.usage, model, batch=True
+            )
+        elif result.type == "errored":
+            results.errors[entry.custom_id] = str(result.error.error.message)
+        else:
+            results.errors[entry.custom_id] = f"Request {result.type}"
+
+
+def _is_csv(completion: str) -> bool:
+    try:
+        pd.read_csv(StringIO(completion))
+        return True
+    except Exception:
+        return False
+
+
+def _is_valid(completion: str) -> bool:
+    try:
+        return not validate_benchmark_frame(pd.read_csv(StringIO(completion)))
+    except Exception:
+        return False
+
+
+def _add_cost(total: Optional[float], cost: Optional[float]) -> Optional[float]:
+    # Unknown as soon as one of the requests was not priced
+    return None if total is None or cost is None else total + cost
+
+
+def extract_batch(
+    documents: Mapping[str, Path],
+    client: Optional[Anthropic] = None,
+    models: Optional[Sequence[str]] = None,
+    max_requests: int = BATCH_MAX_REQUESTS,
+    max_bytes: int = BATCH_MAX_BYTES,
+    poll_seconds: float = BATCH_POLL_SECONDS,
+    timeout: float = BATCH_TIMEOUT_SECONDS,
+) -> BatchResults:
+    """
+    Extracts the benchmark tables of many PDFs with Message Batches.
+
+    Documents go through the models of the extraction route cheapest first, as
+    with the LLM engines of `extract_benchmarks`: a round of batches per model,
+    the documents whose completion fails validation or whose request failed
+    being sent again with the next model. The last model's completion is kept
+    as long as there is one.
+
+    Args:
+        documents: PDF files by custom_id, which must match `^[a-zA-Z0-9_-]{1,64}$`
+        client: Client to use, defaults to the shared synchronous client
+        models: Models to try in order, defaults to the extraction route
+
+    Returns:
+        The completions and errors by custom_id, and the cost of every round
+    """
+    client = client or get_client()
+    models = list(models or route_models())
+    if not models:
+        raise ValueError("No extraction models configured")
+    results = BatchResults()
+    pending = dict(documents)
+    for i, model in enumerate(models):
+        is_last = i == len(models) - 1
+        attempt = _extract_round(
+            client, pending, model, max_requests, max_bytes, poll_seconds, timeout
+        )
+        escalated = {}
+        for custom_id, file_path in pending.items():
+            if custom_id in attempt.costs:
+                results.costs[custom_id] = _add_cost(
+                    results.costs.get(custom_id, 0.0), attempt.costs[custom_id]
+                )
+            completion = attempt.completions.get(custom_id)
+            if completion is not None and (is_last or _is_valid(completion)):
+                results.completions[custom_id] = completion
+            elif is_last:
+                results.errors[custom_id] = attempt.errors[custom_id]
+            else:
+                escalated[custom_id] = file_path
+        if escalated:
+            logger.info(
+                f"{len(escalated)} documents escalate from {model} to {models[i + 1]}"
+            )
+        pending = escalated
+        if not pending:
+            break
+    return results
+
+
+def _extract_round(
+    client: Anthropic,
+    documents: Mapping[str, Path],
+    model: str,
+    max_requests: int,
+    max_bytes: int,
+    poll_seconds: float,
+    timeout: float,
+) -> BatchResults:
+    """
+    Extracts documents with one model of the route.
+
+    Documents with a cached completion of `model` are not sent. The others are
+    encoded one at a time and packed into batches of at most `max_requests`
+    requests and about `max_bytes`, each batch being submitted as soon as it is
+    full. Once every batch has ended, the completions that parse as CSV are
+    cached under `model`.
+    """
+    completion_cache = get_completion_cache()
+    results = BatchResults()
+    document_sha256s: dict[str, str] = {}
+    submitted: dict[str, list[str]] = {}
+
+    requests: list[dict] = []
+    requests_bytes = 0
+    for custom_id, file_path in documents.items():
+        document_sha256 = sha256_file(file_path)
+        completion = completion_cache.get(document_sha256, prompt, model)
+        if completion is not None:
+            results.completions[custom_id] = completion
+            results.costs[custom_id] = 0.0
+            continue
+
+        try:
+            source_base64 = encode_document(file_path)
+        except Exception as e:
+            results.errors[custom_id] = str(e)
+            continue
+
+        size = len(source_base64) + REQUEST_OVERHEAD_BYTES
+        if requests and (
+            len(requests) >= max_requests or requests_bytes + size > max_bytes
+        ):
+            batch_id = submit_batch(client, requests)
+            submitted[batch_id] = [request["custom_id"] for request in requests]
+            requests, requests_bytes = [], 0
+        requests.append(build_request(custom_id, source_base64, model))
+        requests_bytes += size
+        document_sha256s[custom_id] = document_sha256
+
+    if requests:
+        batch_id = submit_batch(client, requests)
+        submitted[batch_id] = [request["custom_id"] for request in requests]
+    logger.info(
+        f"{len(results.completions)} of {len(documents)} documents were cached for "
+        f"{model}, submitted {len(document_sha256s)} in {len(submitted)} batches"
+    )
+
+    for batch_id, custom_ids in submitted.items():
+        try:
+            wait_for_batch(client, batch_id, poll_seconds, timeout)
+            collect_results(client, batch_id, results, model)
+        except Exception as e:
+            logger.error(f"Failed to get results of batch {batch_id}: {e}")
+            for custom_id in custom_ids:
+                results.errors[custom_id] = str(e)
+            continue
+        for custom_id in custom_ids:
+            if custom_id not in results.completions and custom_id not in results.errors:
+                results.errors[custom_id] = f"No result in batch {batch_id}"
+
+    for custom_id, document_sha256 in document_sha256s.items():
+        completion = results.completions.get(custom_id)
+        if completion is not None and _is_csv(completion):
+            completion_cache.put(document_sha256, prompt, model, completion)
+    return results
@@ -0,0 +1,340 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Union
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from logger import get_logger
+from urls import paper_key
+
+logger = get_logger(__name__)
+
+PDF_CACHE_DIR = Path(
+    os.getenv("PDF_CACHE_DIR", Path.home() / ".cache" / "benchmark-extractor" / "pdfs")
+)
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(2 * 1024**3)))
+COMPLETION_CACHE_PATH = Path(
+    os.getenv(
+        "COMPLETION_CACHE_PATH",
+        Path.home() / ".cache" / "benchmark-extractor" / "completions.sqlite",
+    )
+)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Returns a normalized form of `url` for use as a cache key.
+
+    Lowercases the scheme and host, drops default ports, fragments and empty
+    query parameters, and sorts the remaining query parameters.
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parsed.port}"
+    query = urlencode(sorted(parse_qsl(parsed.query)))
+    return urlunparse((scheme, host, parsed.path or "/", "", query, ""))
+
+
+def cache_key(url: str) -> str:
+    """
+    Returns the key of a URL in the PDF cache.
+
+    Links to a known paper share its paper key, so the abstract page, PDF and
+    versioned links of an arXiv paper are downloaded once. Other URLs are keyed
+    by their normalized form.
+    """
+    return paper_key(url) or normalize_url(url)
+
+
+def sha256_file(file_path: Union[str, Path]) -> str:
+    """Returns the hex SHA-256 digest of a file, reading it in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sha256_text(text: str) -> str:
+    """Returns the hex SHA-256 digest of a string"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class PdfCache:
+    """
+    Persistent content-addressed cache of downloaded files.
+
+    Files are stored once per SHA-256 of their content as `<sha256>/<filename>`
+    under `cache_dir`, and an SQLite index maps URL cache keys to content hashes.
+    When the total size goes over `max_bytes` the least recently used files are
+    evicted.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path] = PDF_CACHE_DIR,
+        max_bytes: int = PDF_CACHE_MAX_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index_path = self.cache_dir / "index.sqlite"
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " sha256 TEXT PRIMARY KEY, filename TEXT NOT NULL,"
+                " size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                " url TEXT PRIMARY KEY, sha256 TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._index_path, timeout=30)
+
+    def _blob_path(self, sha256: str, filename: str) -> Path:
+        return self.cache_dir / sha256 / filename
+
+    def get(self, url: str) -> Optional[Path]:
+        """Returns the cached file for `url`, or None on a miss"""
+        key = cache_key(url)
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT b.sha256, b.filename FROM urls u"
+                " JOIN blobs b ON b.sha256 = u.sha256 WHERE u.url = ?",
+                (key,),
+            ).fetchone()
+            if row is not None:
+                path = self._blob_path(*row)
+                if path.is_file():
+                    conn.execute(
+                        "UPDATE blobs SET last_access = ? WHERE sha256 = ?",
+                        (time.time(), row[0]),
+                    )
+                    self.stats.hits += 1
+                    logger.debug("PDF cache hit for %s: %s", url, path)
+                    return path
+                # File was removed from under the cache, forget about it
+                self._forget(conn, row[0])
+
+        self.stats.misses += 1
+        logger.debug("PDF cache miss for %s", url)
+        return None
+
+    def put_stream(self, url: str, filename: str, chunks: Iterable[bytes]) -> Path:
+        """Stores the content of `chunks` as the cached file for `url`"""
+        tmp_dir = self.cache_dir / "tmp"
+        tmp_dir.mkdir(exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        tmp.write(chunk)
+                        size += len(chunk)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        return self._commit(url, filename, Path(tmp_name), digest.hexdigest(), size)
+
+    def content_sha256(self, url: str) -> Optional[str]:
+        """Returns the SHA-256 of the content last downloaded from `url`, if known"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT sha256 FROM urls WHERE url = ?", (cache_key(url),)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    @property
+    def partial_dir(self) -> Path:
+        """Directory for downloads in progress, on the cache's file system"""
+        return self.cache_dir / "partial"
+
+    def put_file(self, url: str, filename: str, file_path: Union[str, Path]) -> Path:
+        """Moves a downloaded file into the cache as the cached file for `url`"""
+        file_path = Path(file_path)
+        return self._commit(
+            url, filename, file_path, sha256_file(file_path), file_path.stat().st_size
+        )
+
+    def _commit(
+        self, url: str, filename: str, tmp_path: Path, sha256: str, size: int
+    ) -> Path:
+        key = cache_key(url)
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT filename FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+            if row is not None and self._blob_path(sha256, row[0]).is_file():
+                # Same content already cached, possibly under another URL
+                tmp_path.unlink()
+                path = self._blob_path(sha256, row[0])
+            else:
+                path = self._blob_path(sha256, filename)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, path)
+                conn.execute(
+                    "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)",
+                    (sha256, filename, size, time.time()),
+                )
+            conn.execute(
+                "UPDATE blobs SET last_access = ? WHERE sha256 = ?",
+                (time.time(), sha256),
+            )
+            conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (key, sha256))
+            self._evict(conn, keep=sha256)
+        return path
+
+    def _forget(self, conn: sqlite3.Connection, sha256: str) -> None:
+        conn.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+        conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        shutil.rmtree(self.cache_dir / sha256, ignore_errors=True)
+
+    def _evict(self, conn: sqlite3.Connection, keep: str) -> None:
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        if total <= self.max_bytes:
+            return
+        candidates = conn.execute(
+            "SELECT sha256, size FROM blobs WHERE sha256 != ? ORDER BY last_access",
+            (keep,),
+        ).fetchall()
+        for sha256, size in candidates:
+            if total <= self.max_bytes:
+                break
+            self._forget(conn, sha256)
+            total -= size
+            self.stats.evictions += 1
+            logger.debug("Evicted %s (%d bytes) from PDF cache", sha256, size)
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM blobs").fetchone()
+        return count
+
+    def size_bytes(self) -> int:
+        """Returns the total size of the cached files"""
+        with closing(self._connect()) as conn:
+            (total,) = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM blobs"
+            ).fetchone()
+        return total
+
+
+class CompletionCache:
+    """
+    Persistent cache of extraction completions.
+
+    Entries are keyed by the SHA-256 of the document sent to the model, the
+    SHA-256 of the prompt text and the model name, so a change to any of them is
+    a miss. Entries written for an older prompt or model are kept until they are
+    explicitly removed with `purge_stale`.
+    """
+
+    def __init__(self, db_path: Union[str, Path] = COMPLETION_CACHE_PATH):
+        self.db_path = Path(db_path)
+        self.stats = CacheStats()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " document_sha256 TEXT NOT NULL, prompt_sha256 TEXT NOT NULL,"
+                " model TEXT NOT NULL, completion TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " PRIMARY KEY (document_sha256, prompt_sha256, model))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, document_sha256: str, prompt: str, model: str) -> Optional[str]:
+        """Returns the cached completion, or None on a miss"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT completion FROM completions WHERE document_sha256 = ?"
+                " AND prompt_sha256 = ? AND model = ?",
+                (document_sha256, sha256_text(prompt), model),
+            ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return row[0]
+
+    def put(self, document_sha256: str, prompt: str, model: str, completion: str):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                (document_sha256, sha256_text(prompt), model, completion, time.time()),
+            )
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+        return count
+
+    def purge_stale(self, prompt: str, model: Union[str, Sequence[str]]) -> int:
+        """
+        Removes entries produced with a different prompt or with another model
+        than the given one(s).
+
+        Returns the number of removed entries.
+        """
+        models = [model] if isinstance(model, str) else list(model)
+        placeholders = ", ".join("?" * len(models))
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "DELETE FROM completions WHERE prompt_sha256 != ?"
+                f" OR model NOT IN ({placeholders})",
+                (sha256_text(prompt), *models),
+            )
+        self.stats.evictions += cursor.rowcount
+        logger.info(f"Purged {cursor.rowcount} stale completions")
+        return cursor.rowcount
+
+
+_default_pdf_cache: Optional[PdfCache] = None
+_default_completion_cache: Optional[CompletionCache] = None
+
+
+def get_pdf_cache() -> PdfCache:
+    """Returns the process-wide PDF cache, creating it on first use"""
+    global _default_pdf_cache
+    if _default_pdf_cache is None:
+        _default_pdf_cache = PdfCache()
+    return _default_pdf_cache
+
+
+def get_completion_cache() -> CompletionCache:
+    """Returns the process-wide completion cache, creating it on first use"""
+    global _default_completion_cache
+    if _default_completion_cache is None:
+        _default_completion_cache = CompletionCache()
+    return _default_completion_cache
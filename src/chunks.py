@@ -0,0 +1,153 @@
+import os
+import re
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import pandas as pd
+from pypdf import PdfReader
+
+import utils
+from logger import get_logger
+from schema import MISSING_VALUE, REQUIRED_COLUMNS
+
+logger = get_logger(__name__)
+
+# Documents with more pages than this are extracted in page windows, the API
+# accepts at most 100 pages per PDF and long requests are slow
+CHUNK_MIN_PAGES = int(os.getenv("CHUNK_MIN_PAGES", "40"))
+CHUNK_WINDOW_PAGES = int(os.getenv("CHUNK_WINDOW_PAGES", "20"))
+# Pages shared by consecutive windows, so a table split across a window boundary
+# is seen whole by at least one of them
+CHUNK_OVERLAP_PAGES = int(os.getenv("CHUNK_OVERLAP_PAGES", "2"))
+# Windows of a document extracted concurrently
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "4"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def page_windows(total_pages: int, window: int, overlap: int) -> list[list[int]]:
+    """
+    Splits the pages of a document (0-based) into windows of `window` pages.
+
+    Consecutive windows share `overlap` pages and the last window ends on the
+    last page.
+    """
+    if window < 1:
+        raise ValueError(f"window must be at least 1, got {window}")
+    if not 0 <= overlap < window:
+        raise ValueError(f"overlap must be in [0, {window}), got {overlap}")
+
+    windows = []
+    start = 0
+    while start < total_pages:
+        end = min(start + window, total_pages)
+        windows.append(list(range(start, end)))
+        if end == total_pages:
+            break
+        start = end - overlap
+    return windows
+
+
+def plan_windows(
+    file_path: Union[str, Path],
+    min_pages: Optional[int] = None,
+    window: Optional[int] = None,
+    overlap: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> Optional[list[list[int]]]:
+    """
+    Returns the page windows to extract a PDF in, None if it fits one request.
+
+    A PDF is chunked when it has more than `min_pages` pages or is over the
+    `max_bytes` request size limit. Windows are narrowed from `window` pages so
+    that, at the document's average page size, each fits under `max_bytes`.
+    """
+    min_pages = CHUNK_MIN_PAGES if min_pages is None else min_pages
+    window = CHUNK_WINDOW_PAGES if window is None else window
+    overlap = CHUNK_OVERLAP_PAGES if overlap is None else overlap
+    max_bytes = utils.MAX_PDF_BYTES if max_bytes is None else max_bytes
+
+    total_pages = len(PdfReader(file_path).pages)
+    size = Path(file_path).stat().st_size
+    if total_pages <= min_pages and size <= max_bytes:
+        return None
+    if total_pages <= 1:
+        # Nothing to split, the request is sent as is and fails if too large
+        return None
+
+    bytes_per_page = size / total_pages
+    window = max(1, min(window, int(max_bytes // bytes_per_page)))
+    overlap = min(overlap, window - 1)
+    windows = page_windows(total_pages, window, overlap)
+    logger.info(
+        f"Chunking {file_path} ({total_pages} pages, {size} bytes) into "
+        f"{len(windows)} windows of up to {window} pages"
+    )
+    return windows
+
+
+def _clean_label(label: object) -> str:
+    return _WHITESPACE.sub(" ", str(label)).strip()
+
+
+def _label_key(label: object) -> str:
+    return _clean_label(label).casefold()
+
+
+def merge_tables(frames: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Merges the tables extracted from the windows of a document into one.
+
+    Model columns are matched on their name ignoring case and whitespace, the
+    first spelling seen is kept. Rows are matched on their benchmark name and
+    test type the same way, so a benchmark read by two overlapping windows is
+    one row holding, in every column, the first value that is not missing.
+    """
+    # Required columns keep their own spelling, e.g. `Name` is read as `name`
+    required_keys = {_label_key(col): col for col in REQUIRED_COLUMNS}
+    labels: dict[str, str] = dict(required_keys)
+    renamed = []
+    for frame in frames:
+        frame = frame.copy()
+        frame.columns = [
+            labels.setdefault(_label_key(col), _clean_label(col))
+            for col in frame.columns
+        ]
+        # Windows can repeat a column when the model splits a header
+        renamed.append(frame.loc[:, ~frame.columns.duplicated()])
+
+    model_columns = [
+        label for key, label in labels.items() if key not in required_keys
+    ]
+    columns = ["name", "test_type"] + model_columns + ["source"]
+    if not renamed:
+        return pd.DataFrame(columns=columns)
+
+    table = pd.concat(renamed, ignore_index=True).reindex(columns=columns)
+    table = table.astype(object)
+    table = table.where(table.notna(), None)
+    table = table.apply(lambda col: col.map(_missing_to_none))
+    table = table[table["name"].notna()]
+
+    keys = [
+        table["name"].map(_label_key).rename("name_key"),
+        table["test_type"]
+        .map(lambda v: "" if v is None else _label_key(v))
+        .rename("test_type_key"),
+    ]
+    merged = table.groupby(keys, sort=False, dropna=False).first()
+    merged = merged.reset_index(drop=True).reindex(columns=columns)
+    logger.info(
+        f"Merged {len(table)} rows from {len(frames)} windows into {len(merged)} "
+        f"benchmarks and {len(model_columns)} models"
+    )
+    return merged.fillna(MISSING_VALUE)
+
+
+def _missing_to_none(value: object) -> object:
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text or text in {MISSING_VALUE, "—", "–", "nan"}:
+        return None
+    return text
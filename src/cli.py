@@ -0,0 +1,196 @@
+import argparse
+import csv
+import sqlite3
+import sys
+from contextlib import closing
+from pathlib import Path
+from typing import Optional, Sequence
+
+from constants import benchmark_results_path, benchmark_sources_path, model_sources_path
+from logger import LOG_LEVEL, LOG_LEVEL_MAP, configure_logging
+
+# Only the standard library is imported up front. Commands import what they
+# need when they run, so quick ones like `status` load neither pandas nor the
+# Anthropic SDK (see STARTUP_BUDGET_MS in tests/test_cli.py)
+
+
+def count_pending(source_df_path: str) -> int:
+    """Counts the rows of a sources CSV with a URL that were not crawled yet"""
+    with open(source_df_path, newline="", encoding="utf-8") as f:
+        return sum(
+            1
+            for row in csv.DictReader(f)
+            if (row.get("url") or "").strip()
+            and not (row.get("crawled_timestamp") or "").strip()
+        )
+
+
+def crawl(args: argparse.Namespace) -> int:
+    import app
+
+    if args.batch:
+        app.crawl_batch(args.sources)
+        return 0
+    # Unset options fall back to the crawler's own settings
+    options = {
+        "max_workers": args.workers,
+        "max_depth": args.max_depth,
+        "runner_id": args.runner_id,
+    }
+    app.main(args.sources, **{k: v for k, v in options.items() if v is not None})
+    return 0
+
+
+def refresh(args: argparse.Namespace) -> int:
+    from datetime import timedelta
+
+    import app
+    from refresh import REFRESH_STALE_AFTER_DAYS, refresh_sources
+
+    days = REFRESH_STALE_AFTER_DAYS if args.stale_after is None else args.stale_after
+    options = {"max_workers": args.workers} if args.workers is not None else {}
+    outcomes = refresh_sources(
+        args.sources, app.crawl_model_url, stale_after=timedelta(days=days), **options
+    )
+    summary = ", ".join(f"{count} {outcome}" for outcome, count in outcomes.items())
+    print(summary or "No stale sources")
+    return 0
+
+
+def status(args: argparse.Namespace) -> int:
+    from store import SOURCES_DB_PATH
+
+    print(f"{count_pending(args.sources)} pending rows in {args.sources}")
+    db_path = Path(args.db or SOURCES_DB_PATH)
+    if not db_path.is_file():
+        print(f"No source store at {db_path}")
+        return 0
+
+    # Read only, so a status check never waits on or changes a running crawl
+    with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+        tables = {
+            name
+            for (name,) in conn.execute("SELECT name FROM sqlite_master")
+            if name in {"sources", "frontier"}
+        }
+        if "sources" in tables:
+            (count,) = conn.execute("SELECT COUNT(*) FROM sources").fetchone()
+            print(f"{count} sources in {db_path}")
+        if "frontier" in tables:
+            for state, count in conn.execute(
+                "SELECT state, COUNT(*) FROM frontier GROUP BY state ORDER BY state"
+            ):
+                print(f"frontier {state}: {count}")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(frontier)")]
+            if "lease_owner" in columns:
+                (runners,) = conn.execute(
+                    "SELECT COUNT(DISTINCT lease_owner) FROM frontier"
+                    " WHERE state = 'in_progress'"
+                ).fetchone()
+                print(f"frontier runners: {runners}")
+    return 0
+
+
+def export(args: argparse.Namespace) -> int:
+    if args.what == "sources":
+        from store import get_source_store
+
+        get_source_store().export_csv(args.output or benchmark_sources_path)
+    else:
+        from results import get_results_store
+
+        output = args.output or benchmark_results_path
+        scores = get_results_store().read()
+        scores.to_csv(output, index=False)
+        print(f"Exported {len(scores)} scores to {output}")
+    return 0
+
+
+def cache(args: argparse.Namespace) -> int:
+    from cache import get_completion_cache, get_pdf_cache
+
+    if args.action == "stats":
+        pdf_cache = get_pdf_cache()
+        print(
+            f"PDF cache: {len(pdf_cache)} files, "
+            f"{pdf_cache.size_bytes() / 1024**2:.1f} MiB in {pdf_cache.cache_dir}"
+        )
+        completion_cache = get_completion_cache()
+        print(
+            f"Completion cache: {len(completion_cache)} completions "
+            f"in {completion_cache.db_path}"
+        )
+    else:
+        from engines import route_models
+        from llm import prompt
+
+        # Completions of every model of the extraction route are kept
+        get_completion_cache().purge_stale(prompt, route_models())
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="benchmark-extractor",
+        description="Extract benchmark results from model cards and papers.",
+    )
+    parser.add_argument("--log-level", choices=sorted(LOG_LEVEL_MAP), default=LOG_LEVEL)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = commands.add_parser(
+        "crawl", help="crawl pending sources and the benchmarks they cite"
+    )
+    crawl_parser.add_argument("sources", nargs="?", default=model_sources_path)
+    crawl_parser.add_argument("--workers", type=int, default=None)
+    crawl_parser.add_argument("--max-depth", type=int, default=None)
+    crawl_parser.add_argument(
+        "--runner-id",
+        default=None,
+        help="name of this runner in the frontier's leases, defaults to host:pid",
+    )
+    crawl_parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="extract the pending rows with Message Batches, without recursing",
+    )
+    crawl_parser.set_defaults(func=crawl)
+
+    refresh_parser = commands.add_parser(
+        "refresh", help="re-crawl the crawled sources whose documents changed"
+    )
+    refresh_parser.add_argument("sources", nargs="?", default=model_sources_path)
+    refresh_parser.add_argument(
+        "--stale-after",
+        type=float,
+        default=None,
+        help="days after which a crawled source is checked again",
+    )
+    refresh_parser.add_argument("--workers", type=int, default=None)
+    refresh_parser.set_defaults(func=refresh)
+
+    status_parser = commands.add_parser("status", help="show the crawl progress")
+    status_parser.add_argument("sources", nargs="?", default=model_sources_path)
+    status_parser.add_argument("--db", help="source store database")
+    status_parser.set_defaults(func=status)
+
+    export_parser = commands.add_parser(
+        "export", help="write the stored sources or scores to CSV"
+    )
+    export_parser.add_argument("what", choices=["sources", "results"])
+    export_parser.add_argument("-o", "--output")
+    export_parser.set_defaults(func=export)
+
+    cache_parser = commands.add_parser("cache", help="inspect or purge the caches")
+    cache_parser.add_argument("action", choices=["stats", "purge"])
+    cache_parser.set_defaults(func=cache)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_level)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
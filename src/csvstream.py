@@ -0,0 +1,63 @@
+import csv
+from typing import Optional
+
+import pandas as pd
+
+
+class CsvRowStream:
+    """
+    Incremental CSV parser for text that arrives in arbitrary chunks.
+
+    `feed` returns the records completed by a chunk, so rows can be processed
+    while the rest of the table is still being generated. A newline inside a
+    quoted field does not end a record. The first record is the header; blank
+    lines and markdown code fences are skipped.
+    """
+
+    def __init__(self):
+        self.header: Optional[list[str]] = None
+        self._buffer = ""
+        self._scanned = 0
+        self._in_quotes = False
+
+    def feed(self, text: str) -> list[list[str]]:
+        """Adds a chunk of text and returns the rows it completed"""
+        self._buffer += text
+        records = []
+        start = 0
+        for i in range(self._scanned, len(self._buffer)):
+            char = self._buffer[i]
+            if char == '"':
+                self._in_quotes = not self._in_quotes
+            elif char == "\n" and not self._in_quotes:
+                records.append(self._buffer[start:i])
+                start = i + 1
+        self._buffer = self._buffer[start:]
+        self._scanned = len(self._buffer)
+        return self._parse(records)
+
+    def close(self) -> list[list[str]]:
+        """Returns the last row if the text did not end with a newline"""
+        records = [self._buffer] if self._buffer else []
+        self._buffer = ""
+        self._scanned = 0
+        return self._parse(records)
+
+    def _parse(self, records: list[str]) -> list[list[str]]:
+        rows = []
+        for record in records:
+            record = record.rstrip("\r")
+            if not record.strip() or record.lstrip().startswith("```"):
+                continue
+            row = next(csv.reader([record]))
+            if self.header is None:
+                self.header = row
+            else:
+                rows.append(row)
+        return rows
+
+    def to_frame(self, rows: list[list[str]]) -> pd.DataFrame:
+        """Returns the rows matching the header as a DataFrame"""
+        columns = self.header or []
+        rows = [row for row in rows if len(row) == len(columns)]
+        return pd.DataFrame(rows, columns=columns)
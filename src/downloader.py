@@ -0,0 +1,259 @@
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional, TypeVar, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from logger import get_logger
+from ratelimit import TokenBucket, retry_after_seconds
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "30"))
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", "4"))
+# Downloads in flight and requests per minute allowed to a single host
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "2"))
+DOWNLOAD_HOST_RPM = float(os.getenv("DOWNLOAD_HOST_RPM", "60"))
+# Hosts asking crawlers for a slower pace, arXiv allows one request every 3s
+HOST_RPM = {"arxiv.org": 20.0, "export.arxiv.org": 20.0}
+
+CHUNK_SIZE = 64 * 1024
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+USER_AGENT = "benchmark-extractor/0.1 (+https://github.com/)"
+
+
+class IncompleteDownloadError(requests.RequestException):
+    """Raised when a response did not deliver the bytes it announced"""
+
+
+RETRYABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    IncompleteDownloadError,
+)
+
+
+@dataclass
+class _Host:
+    session: requests.Session
+    slots: threading.BoundedSemaphore
+    bucket: TokenBucket
+
+
+def url_host(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host.removeprefix("www.")
+
+
+class Downloader:
+    """
+    Pooled HTTP downloader with per-host politeness and resumable transfers.
+
+    Every host gets its own keep-alive `requests.Session`, at most `per_host`
+    downloads in flight and requests spaced to `requests_per_minute` (or the
+    host's entry in HOST_RPM). Connection errors, timeouts and 429/5xx answers
+    are retried with jittered exponential backoff, honouring `Retry-After`.
+
+    Bytes are written to a partial file next to the destination as they arrive.
+    A retry, or a later run, asks for the rest with a `Range` request guarded
+    by `If-Range`, so the transfer resumes where it stopped unless the file
+    changed on the server.
+    """
+
+    def __init__(
+        self,
+        per_host: int = DOWNLOAD_PER_HOST,
+        requests_per_minute: float = DOWNLOAD_HOST_RPM,
+        max_retries: int = DOWNLOAD_MAX_RETRIES,
+        timeout: float = DOWNLOAD_TIMEOUT,
+        host_rpm: Optional[dict[str, float]] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if per_host < 1:
+            raise ValueError(f"per_host must be at least 1, got {per_host}")
+        self.per_host = per_host
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.host_rpm = HOST_RPM if host_rpm is None else host_rpm
+        self._sleep = sleep
+        self._hosts: dict[str, _Host] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host: str) -> _Host:
+        with self._lock:
+            if host not in self._hosts:
+                session = requests.Session()
+                session.headers["User-Agent"] = USER_AGENT
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                rpm = self.host_rpm.get(host, self.requests_per_minute)
+                self._hosts[host] = _Host(
+                    session,
+                    threading.BoundedSemaphore(self.per_host),
+                    # A single token, so requests are evenly spaced, not bursts
+                    TokenBucket(1, 60.0 / rpm),
+                )
+            return self._hosts[host]
+
+    def session(self, url: str) -> requests.Session:
+        """Returns the pooled session of the URL's host"""
+        return self._host(url_host(url)).session
+
+    def download(self, url: str, dest: Union[str, Path]) -> Path:
+        """
+        Downloads `url` to `dest`, resuming a partial download of it if any.
+
+        Raises:
+            requests.RequestException: If the download fails after all retries,
+                or at once on a status that is not worth retrying, e.g. 404
+        """
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        partial = dest.with_name(dest.name + ".part")
+        validator_path = dest.with_name(dest.name + ".validator")
+
+        self._with_retries(
+            url, lambda session: self._fetch(url, session, partial, validator_path)
+        )
+        os.replace(partial, dest)
+        validator_path.unlink(missing_ok=True)
+        return dest
+
+    def head(
+        self, url: str, headers: Optional[dict[str, str]] = None
+    ) -> requests.Response:
+        """
+        Sends a HEAD request, e.g. a conditional one, with the same politeness
+        and retries as downloads.
+
+        Only retryable failures raise, any other answer, including 304 Not
+        Modified or 405 Method Not Allowed, is returned.
+        """
+
+        def send(session: requests.Session) -> requests.Response:
+            response = session.head(
+                url, headers=headers, timeout=self.timeout, allow_redirects=True
+            )
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+            return response
+
+        return self._with_retries(url, send)
+
+    def _with_retries(self, url: str, send: Callable[[requests.Session], T]) -> T:
+        host = self._host(url_host(url))
+        attempt = 0
+        while True:
+            try:
+                with host.slots:
+                    host.bucket.acquire()
+                    return send(host.session)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_after_seconds(None, attempt)
+                error = e
+            except requests.HTTPError as e:
+                status = e.response.status_code
+                if status not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    raise
+                delay = retry_after_seconds(e.response.headers, attempt)
+                error = e
+            attempt += 1
+            logger.warning(
+                f"Request to {url} failed ({error}), retrying in {delay:.1f}s "
+                f"(attempt {attempt}/{self.max_retries})"
+            )
+            self._sleep(delay)
+
+    def _fetch(
+        self,
+        url: str,
+        session: requests.Session,
+        partial: Path,
+        validator_path: Path,
+    ) -> None:
+        offset = partial.stat().st_size if partial.exists() else 0
+        validator = validator_path.read_text() if validator_path.exists() else None
+        headers = {}
+        if offset and validator:
+            headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+
+        with session.get(
+            url, headers=headers, stream=True, timeout=self.timeout
+        ) as response:
+            if response.status_code == 416 and offset:
+                if _content_range(response)[1] == offset:
+                    # Nothing left to send, the partial file is the whole file
+                    return
+                partial.unlink()
+                raise IncompleteDownloadError(f"Partial download of {url} is stale")
+            response.raise_for_status()
+
+            mode = "wb"
+            if response.status_code == 206:
+                if _content_range(response)[0] != offset:
+                    partial.unlink(missing_ok=True)
+                    raise IncompleteDownloadError(
+                        f"Server answered {url} with an unexpected range"
+                    )
+                logger.info(f"Resuming download of {url} at byte {offset}")
+                mode = "ab"
+            validator = response.headers.get("ETag") or response.headers.get(
+                "Last-Modified"
+            )
+            if validator:
+                validator_path.write_text(validator)
+            else:
+                validator_path.unlink(missing_ok=True)
+
+            expected = response.headers.get("Content-Length")
+            received = 0
+            with open(partial, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    received += len(chunk)
+
+        if expected is not None and received < int(expected):
+            raise IncompleteDownloadError(
+                f"Received {received} of {expected} bytes from {url}"
+            )
+
+
+def _content_range(response: requests.Response) -> tuple[Optional[int], Optional[int]]:
+    """Returns the first byte and total size in a `Content-Range` header"""
+    # bytes 1000-4999/5000, or bytes */5000 on a 416
+    _, _, spec = response.headers.get("Content-Range", "").partition(" ")
+    span, _, total = spec.partition("/")
+    start = span.partition("-")[0]
+    return (
+        int(start) if start.isdigit() else None,
+        int(total) if total.isdigit() else None,
+    )
+
+
+def partial_name(url: str, filename: str) -> str:
+    """Returns a per-URL file name, so partial downloads are found again"""
+    return f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]}-{filename}"
+
+
+_default_downloader: Optional[Downloader] = None
+
+
+def get_downloader() -> Downloader:
+    """Returns the process-wide downloader, creating it on first use"""
+    global _default_downloader
+    if _default_downloader is None:
+        _default_downloader = Downloader()
+    return _default_downloader
@@ -0,0 +1,499 @@
+import os
+import re
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from io import StringIO
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, Mapping, Optional, Sequence
+
+import pandas as pd
+import tabula
+from pypdf import PdfReader
+
+import utils
+from cache import get_completion_cache, sha256_file
+from chunks import CHUNK_WORKERS, merge_tables, plan_windows
+from constants import MODEL_NAME
+from csvstream import CsvRowStream
+from llm import get_completion, prompt
+from logger import get_logger
+from metrics import get_metrics
+from pages import (
+    PAGE_LOCATOR_ENABLED,
+    locate_table_pages,
+    read_references,
+    slice_pdf,
+)
+from schema import MISSING_VALUE, REQUIRED_COLUMNS, benchmark_problems, is_cell
+
+if TYPE_CHECKING:
+    from preprocess import Preprocessed
+
+logger = get_logger(__name__)
+
+EXTRACTION_ENGINES = os.getenv("EXTRACTION_ENGINES", "tabula,llm").split(",")
+# Models the LLM engine routes through: a fast, cheap model first, re-asking the
+# next, stronger one only when the table it returns fails validation
+CHEAP_MODEL_NAME = os.getenv("CHEAP_MODEL_NAME", "claude-3-5-haiku-20241022")
+EXTRACTION_MODELS = os.getenv(
+    "EXTRACTION_MODELS", f"{CHEAP_MODEL_NAME},{MODEL_NAME}"
+).split(",")
+
+# Whether a tabula table none of whose benchmarks cites a reference escalates
+# to the LLM, which reads the sources the crawl follows. Off, such documents
+# are extracted without a network call but add nothing to the frontier
+TABULA_REQUIRE_SOURCES = os.getenv("TABULA_REQUIRE_SOURCES", "true").lower() == "true"
+
+MIN_CELL_RATIO = 0.5
+
+RowsCallback = Callable[[pd.DataFrame], None]
+TEST_TYPE_PATTERN = re.compile(r"(?i)\bshot\b|-shot|\bcot\b|pass@|maj@|f1")
+NAME_TEST_TYPE_PATTERN = re.compile(r"^(?P<name>.+?)\s*\((?P<test_type>[^)]+)\)\s*$")
+# Citation markers of a benchmark name, `MMLU [12]` or `GSM8K [4, 5]`
+CITATION_PATTERN = re.compile(r"\s*\[(?P<ref>\d+)(?:\s*[,;]\s*\d+)*\]")
+
+
+class ExtractionError(Exception):
+    """Raised when an engine could not produce a valid benchmark table"""
+
+
+def validate_benchmark_frame(df: pd.DataFrame) -> list[str]:
+    """
+    Checks a frame has the `name,test_type,<models...>,source` layout.
+
+    Returns the list of problems found, empty if the frame is valid.
+    """
+    return benchmark_problems(df)
+
+
+def route_models() -> list[str]:
+    """Returns the models of the LLM route in order, without duplicates"""
+    return list(dict.fromkeys(m.strip() for m in EXTRACTION_MODELS if m.strip()))
+
+
+class ExtractionEngine(ABC):
+    """Extracts the benchmark table of a PDF as a `name,test_type,...,source` frame"""
+
+    name: str
+
+    def is_available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def extract(self, file_path: Path) -> pd.DataFrame: ...
+
+
+class TabulaEngine(ExtractionEngine):
+    """
+    Local extraction of ruled tables with tabula-py.
+
+    Runs on CPU without any network call. Sources are the links of the numbered
+    references cited next to benchmark names, e.g. `MMLU [12]`. A table without
+    any cited source escalates unless `TABULA_REQUIRE_SOURCES` is off.
+    """
+
+    name = "tabula"
+
+    def __init__(
+        self,
+        pages: Optional[Sequence[int]] = None,
+        tables: Optional[list[pd.DataFrame]] = None,
+        references: Optional[Mapping[int, str]] = None,
+    ):
+        # 0-based page indices to read, all pages if None
+        self.pages = pages
+        # Tables already read by the preprocessing workers, if any
+        self.tables = tables
+        # Reference numbers to links, read from the document if None
+        self.references = references
+
+    def is_available(self) -> bool:
+        return tabula_available()
+
+    def extract(self, file_path: Path) -> pd.DataFrame:
+        tables = self.tables
+        if tables is None:
+            with get_metrics().span("tabula"):
+                tables = read_tables(file_path, self.pages)
+        references = self.references
+        if references is None and tables:
+            try:
+                references = read_references(file_path)
+            except Exception as e:
+                logger.warning(f"Failed to read references, no sources cited: {e}")
+        candidates = [normalize_table(table, references) for table in tables]
+        candidates = [c for c in candidates if not validate_benchmark_frame(c)]
+        if not candidates:
+            raise ExtractionError(f"No benchmark table found among {len(tables)}")
+        # The main benchmark table is the one with the most scores
+        table = max(candidates, key=lambda c: c.shape[0] * c.shape[1])
+        if TABULA_REQUIRE_SOURCES and (table["source"] == MISSING_VALUE).all():
+            raise ExtractionError("No benchmark of the table cites a source")
+        return table
+
+
+def tabula_available() -> bool:
+    # tabula-py shells out to the tabula Java library
+    return shutil.which("java") is not None
+
+
+def read_tables(
+    file_path: Path, pages: Optional[Sequence[int]] = None
+) -> list[pd.DataFrame]:
+    """Reads the ruled tables of the given pages (0-based), all pages if None"""
+    tabula_pages = [p + 1 for p in pages] if pages is not None else "all"
+    return tabula.read_pdf(
+        file_path, pages=tabula_pages, lattice=True, multiple_tables=True, silent=True
+    )
+
+
+def normalize_table(
+    table: pd.DataFrame, references: Optional[Mapping[int, str]] = None
+) -> pd.DataFrame:
+    """
+    Converts a raw table into the `name,test_type,<models...>,source` layout.
+
+    The first column holds the benchmark names. The test type is read from a
+    column of values like `5-shot`, or from a `Name (5-shot)` benchmark name.
+    Every column where most values look like scores becomes a model column.
+    The source is the link in `references` of the first reference a name cites.
+    """
+    table = table.dropna(how="all").dropna(axis=1, how="all")
+    if table.shape[1] < 2:
+        return pd.DataFrame(columns=REQUIRED_COLUMNS)
+    table = table.astype(str).apply(lambda col: col.str.replace("\r", " ").str.strip())
+    table.columns = [str(col).replace("\r", " ").strip() for col in table.columns]
+
+    names = table.iloc[:, 0]
+    cited = names.str.extract(CITATION_PATTERN)["ref"]
+    names = names.str.replace(CITATION_PATTERN, "", regex=True).str.strip()
+    rest = table.iloc[:, 1:]
+    test_types = pd.Series(MISSING_VALUE, index=table.index)
+
+    first = rest.iloc[:, 0]
+    if first.map(lambda v: bool(TEST_TYPE_PATTERN.search(v))).mean() >= MIN_CELL_RATIO:
+        test_types = first
+        rest = rest.iloc[:, 1:]
+    else:
+        split = names.str.extract(NAME_TEST_TYPE_PATTERN)
+        has_test_type = split["name"].notna()
+        names = names.where(~has_test_type, split["name"])
+        test_types = test_types.where(~has_test_type, split["test_type"])
+
+    model_cols = [
+        col for col in rest.columns if rest[col].map(is_cell).mean() >= MIN_CELL_RATIO
+    ]
+    result = pd.DataFrame({"name": names, "test_type": test_types})
+    for col in model_cols:
+        result[col] = rest[col].replace(
+            {"—": MISSING_VALUE, "–": MISSING_VALUE, "nan": MISSING_VALUE}
+        )
+    references = references or {}
+    sources = cited.map(lambda ref: references.get(int(ref)), na_action="ignore")
+    result["source"] = sources.fillna(MISSING_VALUE)
+    return result.reset_index(drop=True)
+
+
+class LLMEngine(ExtractionEngine):
+    """
+    Extraction with Claude, going through the page locator and completion cache.
+
+    If `on_rows` is given, the rows of the table are parsed while the response
+    streams in and passed to it in batches as soon as they are complete. If
+    `request_path` is given, that file, usually the table pages already sliced
+    out by the preprocessing workers, is sent instead of locating them again.
+    Documents over the page or size limit of a request are extracted in
+    overlapping page windows (see `chunks.plan_windows`) and the tables merged.
+
+    Every model of the route is an engine of its own, named `llm:<model>`, so
+    escalating from a cheap model to a stronger one is the regular engine
+    escalation of `extract_benchmarks`.
+    """
+
+    name = "llm"
+
+    def __init__(
+        self,
+        on_rows: Optional[RowsCallback] = None,
+        request_path: Optional[Path] = None,
+        model: str = MODEL_NAME,
+    ):
+        self.on_rows = on_rows
+        self.request_path = request_path
+        self.model = model
+        self.name = f"{LLMEngine.name}:{model}"
+
+    def extract(self, file_path: Path) -> pd.DataFrame:
+        completion_cache = get_completion_cache()
+        document_sha256 = sha256_file(file_path)
+        completion = completion_cache.get(document_sha256, prompt, self.model)
+        is_cached = completion is not None
+        if is_cached:
+            logger.info(f"Using cached completion for document {document_sha256}")
+        else:
+            completion = self._request_completion(file_path)
+
+        try:
+            with get_metrics().span("parse") as span:
+                span.bytes = len(completion)
+                benchmark_df = pd.read_csv(StringIO(completion))
+        except Exception as e:
+            logger.error(f"Failed to create benchmark DataFrame: {e}")
+            raise
+
+        if not is_cached:
+            completion_cache.put(document_sha256, prompt, self.model, completion)
+        return benchmark_df
+
+    def _request_completion(self, file_path: Path) -> str:
+        with request_document(file_path, self.request_path) as request_fpath:
+            try:
+                windows = plan_windows(request_fpath)
+            except Exception as e:
+                logger.warning(f"Failed to plan page windows, sending as is: {e}")
+                windows = None
+            if windows is not None:
+                return self._request_chunked(request_fpath, windows)
+            return self._request_window(request_fpath)
+
+    def _request_window(self, request_fpath: Path) -> str:
+        source_file_base64 = _encode(request_fpath)
+        rows = CsvRowStream()
+
+        def on_text(text: str) -> None:
+            self._emit_rows(rows, rows.feed(text))
+
+        try:
+            with get_metrics().span("completion") as span:
+                completion = get_completion(
+                    source_file_base64,
+                    on_text=on_text if self.on_rows is not None else None,
+                    model=self.model,
+                )
+                span.bytes = len(completion)
+            logger.info(f"Successfully got {self.model} response of benchmark table")
+            if self.on_rows is not None:
+                self._emit_rows(rows, rows.close())
+            return completion
+
+        except Exception as e:
+            logger.error(f"Failed to get completion: {e}")
+            raise
+
+    def _request_chunked(self, request_fpath: Path, windows: list[list[int]]) -> str:
+        """
+        Extracts the page windows of a long PDF concurrently and merges the tables.
+
+        Windows that fail or hold no table are skipped, the extraction fails only
+        when none of them produced a table. Returns the merged table as CSV, so it
+        is cached and parsed like a single completion.
+        """
+        with get_metrics().span("slice"):
+            reader = PdfReader(request_fpath)
+            window_paths = [slice_pdf(reader, pages) for pages in windows]
+
+        frames = []
+        errors = []
+        try:
+            workers = max(1, min(CHUNK_WORKERS, len(window_paths)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Each window runs in a copy of this thread's context, so its
+                # spans and token usage count towards the current crawl
+                futures = [
+                    executor.submit(copy_context().run, self._request_window, path)
+                    for path in window_paths
+                ]
+                for pages, future in zip(windows, futures):
+                    try:
+                        frames.append(pd.read_csv(StringIO(future.result())))
+                    except Exception as e:
+                        logger.warning(
+                            f"Failed to extract pages {pages[0] + 1}-{pages[-1] + 1} "
+                            f"of {request_fpath}: {e}"
+                        )
+                        errors.append(e)
+        finally:
+            for path in window_paths:
+                path.unlink(missing_ok=True)
+
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            raise ExtractionError(
+                f"No table found in the {len(windows)} windows of {request_fpath}"
+            ) from (errors[0] if errors else None)
+        logger.info(f"Extracted tables from {len(frames)}/{len(windows)} windows")
+        return merge_tables(frames).to_csv(index=False)
+
+    def _emit_rows(self, rows: CsvRowStream, completed: list[list[str]]) -> None:
+        if not completed:
+            return
+        try:
+            self.on_rows(rows.to_frame(completed))
+        except Exception as e:
+            # The full table is still processed once the response is complete
+            logger.warning(f"Failed to process streamed rows: {e}")
+
+
+@contextmanager
+def request_document(
+    file_path: Path, request_path: Optional[Path] = None
+) -> Iterator[Path]:
+    """
+    Yields the PDF to send for extraction.
+
+    Only the table and reference pages are sent when the page locator finds them,
+    their temporary file is removed when the block exits. A `request_path`
+    prepared beforehand is yielded as is and left for the caller to remove.
+    """
+    request_fpath = request_path or file_path
+    if request_path is None and PAGE_LOCATOR_ENABLED:
+        try:
+            with get_metrics().span("locate") as span:
+                selection = locate_table_pages(file_path)
+                if not selection.is_full_document:
+                    request_fpath = slice_pdf(file_path, selection.pages)
+                span.bytes = request_fpath.stat().st_size
+        except Exception as e:
+            logger.warning(f"Failed to locate table pages, sending full file: {e}")
+
+    try:
+        yield request_fpath
+    finally:
+        if request_path is None and request_fpath != file_path:
+            request_fpath.unlink(missing_ok=True)
+
+
+def _encode(request_fpath: Path) -> str:
+    try:
+        with get_metrics().span("encode") as span:
+            source_file_base64 = utils.encode_file(request_fpath)
+            span.bytes = len(source_file_base64)
+        logger.info("Successfully encoded source file")
+        return source_file_base64
+
+    except Exception as e:
+        logger.error(f"Failed to encode file {request_fpath}: {e}")
+        raise
+
+
+def encode_document(file_path: Path, request_path: Optional[Path] = None) -> str:
+    """
+    Returns the base64 PDF to send for extraction.
+
+    Only the table and reference pages are sent when the page locator finds them.
+    A `request_path` prepared beforehand is sent as is and left for the caller
+    to remove.
+    """
+    with request_document(file_path, request_path) as request_fpath:
+        return _encode(request_fpath)
+
+
+ENGINES: dict[str, type[ExtractionEngine]] = {
+    TabulaEngine.name: TabulaEngine,
+    LLMEngine.name: LLMEngine,
+}
+
+engine_attempts: Counter = Counter()
+engine_hits: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+def _record(engine: ExtractionEngine, hit: bool) -> None:
+    with _stats_lock:
+        engine_attempts[engine.name] += 1
+        engine_hits[engine.name] += hit
+        attempts, hits = engine_attempts[engine.name], engine_hits[engine.name]
+    logger.info(
+        f"Engine {engine.name} {'hit' if hit else 'miss'}, "
+        f"hit rate {hits}/{attempts} ({hits / attempts:.0%})"
+    )
+
+
+def default_engines(
+    on_rows: Optional[RowsCallback] = None,
+    prepared: Optional["Preprocessed"] = None,
+) -> list[ExtractionEngine]:
+    engines = []
+    for name in EXTRACTION_ENGINES:
+        engine_cls = ENGINES[name.strip()] if name.strip() else None
+        if engine_cls is LLMEngine:
+            request_path = prepared.request_path if prepared is not None else None
+            models = route_models()
+            # Only the last model streams rows: the table of an earlier one may
+            # fail validation and escalate, and its rows must not be stored
+            engines += [
+                LLMEngine(
+                    on_rows=on_rows if model == models[-1] else None,
+                    request_path=request_path,
+                    model=model,
+                )
+                for model in models
+            ]
+        elif engine_cls is TabulaEngine and prepared is not None:
+            engines.append(
+                TabulaEngine(tables=prepared.tables, references=prepared.references)
+            )
+        elif engine_cls is not None:
+            engines.append(engine_cls())
+    return engines
+
+
+def extract_benchmarks(
+    file_path: Path,
+    engines: Optional[Sequence[ExtractionEngine]] = None,
+    on_rows: Optional[RowsCallback] = None,
+    prepared: Optional["Preprocessed"] = None,
+) -> pd.DataFrame:
+    """
+    Extracts the benchmark table of a PDF with the first engine that succeeds.
+
+    Engines are tried in order. A result failing validation escalates to the next
+    engine, the last engine's result is returned as long as it parsed. Each
+    attempt is recorded as a route in the metrics, with its latency, cost and
+    whether it produced a valid table. `on_rows` is given to the last model of
+    the default LLM route to receive rows while they stream in, and the output
+    of `preprocess_document` to the default engines so they skip the local work
+    already done.
+    """
+    if engines is None:
+        engines = default_engines(on_rows, prepared)
+    engines = list(engines)
+    if not engines:
+        raise ValueError("No extraction engines configured")
+
+    for i, engine in enumerate(engines):
+        is_last = i == len(engines) - 1
+        if not engine.is_available():
+            logger.debug("Engine %s is not available, skipping", engine.name)
+            continue
+
+        with get_metrics().route(engine.name) as attempt:
+            try:
+                benchmark_df = engine.extract(file_path)
+            except Exception as e:
+                _record(engine, hit=False)
+                if is_last:
+                    raise
+                logger.info(f"Engine {engine.name} failed ({e}), escalating")
+                continue
+
+            problems = validate_benchmark_frame(benchmark_df)
+            attempt.success = not problems
+        if problems and not is_last:
+            _record(engine, hit=False)
+            logger.info(
+                f"Engine {engine.name} result is invalid ({problems}), escalating"
+            )
+            continue
+
+        if problems:
+            logger.warning(f"Engine {engine.name} result has problems: {problems}")
+        _record(engine, hit=True)
+        return benchmark_df
+
+    raise ExtractionError(f"No available extraction engine for {file_path}")
@@ -0,0 +1,447 @@
+import os
+import socket
+import sqlite3
+import time
+from collections import Counter
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Collection, Optional, Union
+from urllib.parse import urlparse
+
+import pandas as pd
+
+from logger import get_logger
+from scheduler import TIMESTAMP_FORMAT, pending_rows, save_metadata
+from store import SourceStore
+from urls import paper_key
+
+logger = get_logger(__name__)
+
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_PER_DOMAIN = int(os.getenv("CRAWL_PER_DOMAIN", "2"))
+# Entries claimed by a runner go back to pending when it has not renewed its
+# lease on them for this long, e.g. because it crashed
+FRONTIER_LEASE_SECONDS = float(os.getenv("FRONTIER_LEASE_SECONDS", "300"))
+FRONTIER_RUNNER_ID = os.getenv("FRONTIER_RUNNER_ID")
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class FrontierEntry:
+    url: str
+    depth: int
+    priority: float
+    origin_url: Optional[str] = None
+
+
+def url_domain(url: str) -> str:
+    return (urlparse(url).hostname or "").lower()
+
+
+def default_runner_id() -> str:
+    """Returns FRONTIER_RUNNER_ID, or `<host>:<pid>` identifying this process"""
+    return FRONTIER_RUNNER_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _is_dead_local_runner(runner_id: str) -> bool:
+    """Returns whether a `<host>:<pid>` runner id is an exited process of this host"""
+    host, _, pid = runner_id.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # e.g. a process of another user
+        return False
+    return False
+
+
+def _url_filter(urls: Optional[Collection[str]]) -> tuple[str, list[str]]:
+    # SQL condition restricting a query to `urls`, none if None
+    if urls is None:
+        return "", []
+    urls = list(urls)
+    return f" AND url IN ({', '.join('?' for _ in urls)})", urls
+
+
+class Frontier:
+    """
+    Persistent crawl frontier over the model and benchmark sources.
+
+    Lives in the source store database next to the `sources` table. Every URL,
+    and every paper (see `urls.paper_key`), is scheduled at most once. Pending
+    entries are popped by ascending priority, which defaults to the depth so
+    model cards are crawled before the papers they cite, and at most
+    `per_domain` entries of a domain are in progress at a time. Documents found
+    while crawling an entry are scheduled one level deeper, up to `max_depth`.
+
+    Several runners, threads or processes on one or more hosts, can crawl the
+    same frontier. Popping an entry claims it atomically with a lease held by
+    `runner_id` for `lease_seconds`, which the runner renews while it crawls
+    (see `renew`), and the `per_domain` limit counts the entries in progress of
+    every runner. An entry whose lease expired, or whose runner is a process of
+    this host that exited, goes back to pending and is claimed by the next pop,
+    so the work of a crashed runner is handed to the others. When the frontier
+    is opened, the entries left in progress by an earlier run of the same
+    runner go back to pending too, so a restart resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        store: SourceStore,
+        max_depth: int = CRAWL_MAX_DEPTH,
+        per_domain: int = CRAWL_PER_DOMAIN,
+        runner_id: Optional[str] = None,
+        lease_seconds: float = FRONTIER_LEASE_SECONDS,
+    ):
+        if per_domain < 1:
+            raise ValueError(f"per_domain must be at least 1, got {per_domain}")
+        if lease_seconds <= 0:
+            raise ValueError(f"lease_seconds must be positive, got {lease_seconds}")
+        self.db_path = store.db_path
+        self.max_depth = max_depth
+        self.per_domain = per_domain
+        self.runner_id = runner_id or default_runner_id()
+        self.lease_seconds = lease_seconds
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS frontier ("
+                " seq INTEGER PRIMARY KEY, url TEXT NOT NULL, paper_key TEXT,"
+                " domain TEXT NOT NULL, depth INTEGER NOT NULL,"
+                " priority REAL NOT NULL, origin_url TEXT, state TEXT NOT NULL,"
+                " crawled_timestamp TEXT, success INTEGER, cost REAL,"
+                " enqueued REAL NOT NULL, lease_owner TEXT, lease_expires REAL)"
+            )
+            self._migrate_leases(conn)
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS frontier_url ON frontier (url)"
+            )
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS frontier_paper_key"
+                " ON frontier (paper_key) WHERE paper_key IS NOT NULL"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS frontier_pending"
+                " ON frontier (state, priority, seq)"
+            )
+            requeued = self._release_stale(conn, include_own=True)
+        if requeued:
+            logger.info(f"Requeued {requeued} entries left in progress")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _migrate_leases(conn: sqlite3.Connection) -> None:
+        """Adds the lease columns to frontiers created without them"""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(frontier)")]
+        if "lease_owner" not in columns:
+            logger.info("Adding leases to the crawl frontier")
+            conn.execute("ALTER TABLE frontier ADD COLUMN lease_owner TEXT")
+            conn.execute("ALTER TABLE frontier ADD COLUMN lease_expires REAL")
+
+    def _release_stale(self, conn: sqlite3.Connection, include_own: bool) -> int:
+        """
+        Puts the entries in progress whose lease is stale back to pending.
+
+        A lease is stale when it expired, has no owner, belongs to a process of
+        this host that exited or, if `include_own`, to this runner.
+        """
+        owners = [
+            owner
+            for (owner,) in conn.execute(
+                "SELECT DISTINCT lease_owner FROM frontier"
+                " WHERE state = ? AND lease_owner IS NOT NULL",
+                (IN_PROGRESS,),
+            )
+        ]
+        stale_owners = [
+            owner
+            for owner in owners
+            if (include_own and owner == self.runner_id)
+            or (owner != self.runner_id and _is_dead_local_runner(owner))
+        ]
+        released = conn.execute(
+            "UPDATE frontier SET state = ?, lease_owner = NULL, lease_expires = NULL"
+            " WHERE state = ? AND (lease_owner IS NULL OR lease_expires < ?)",
+            (PENDING, IN_PROGRESS, time.time()),
+        ).rowcount
+        for owner in stale_owners:
+            released += conn.execute(
+                "UPDATE frontier SET state = ?, lease_owner = NULL,"
+                " lease_expires = NULL WHERE state = ? AND lease_owner = ?",
+                (PENDING, IN_PROGRESS, owner),
+            ).rowcount
+        return released
+
+    def _insert(self, conn: sqlite3.Connection, rows: list[tuple]) -> int:
+        """Inserts (url, depth, priority, origin_url, state, crawled, success, cost)"""
+        now = time.time()
+        records = [
+            (url, paper_key(url), url_domain(url), *rest, now)
+            for url, *rest in rows
+            if rest[0] <= self.max_depth
+        ]
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO frontier (url, paper_key, domain, depth,"
+            " priority, origin_url, state, crawled_timestamp, success, cost,"
+            " enqueued) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            records,
+        )
+        return conn.total_changes - before
+
+    def add(
+        self,
+        url: str,
+        depth: int = 0,
+        priority: Optional[float] = None,
+        origin_url: Optional[str] = None,
+    ) -> bool:
+        """
+        Schedules a URL unless it, or the paper it points to, was seen before.
+
+        Returns whether the URL was scheduled.
+        """
+        priority = depth if priority is None else priority
+        with closing(self._connect()) as conn, conn:
+            row = (url, depth, priority, origin_url, PENDING, None, None, None)
+            return self._insert(conn, [row]) == 1
+
+    def seed(self, sources_df: pd.DataFrame, depth: int = 0) -> int:
+        """
+        Adds the rows of a sources frame, e.g. model_sources.csv, at `depth`.
+
+        Rows crawled before are recorded as done so they are not crawled again,
+        and their discovered sources are still followed by `discover`. Returns
+        the number of new entries.
+        """
+        sources_df = sources_df[sources_df["url"].notna()]
+        pending = set(pending_rows(sources_df))
+        rows = []
+        for idx, row in sources_df.iterrows():
+            if idx in pending:
+                rows.append((row["url"], depth, depth, None, PENDING, None, None, None))
+                continue
+            success = None if pd.isna(row["success"]) else str(row["success"]) == "True"
+            cost = None if pd.isna(row["cost"]) else float(row["cost"])
+            state = FAILED if success is False else DONE
+            crawled = str(row["crawled_timestamp"])
+            rows.append((row["url"], depth, depth, None, state, crawled, success, cost))
+        with closing(self._connect()) as conn, conn:
+            added = self._insert(conn, rows)
+        logger.info(f"Seeded frontier with {added} new entries at depth {depth}")
+        return added
+
+    def discover(self, origin_url: Optional[str] = None) -> int:
+        """
+        Schedules the stored sources found in crawled documents.
+
+        Sources of `origin_url`, or of every crawled entry if None, are added
+        one level below the document they were found in. Sources whose origin is
+        not in the frontier are added at depth 1. Returns the number of new
+        entries.
+        """
+        query = (
+            "SELECT s.url, COALESCE(f.depth, 0) + 1, s.origin_url,"
+            " s.crawled_timestamp, s.success, s.cost"
+            " FROM sources s LEFT JOIN frontier f ON f.url = s.origin_url"
+            " WHERE (f.state IS NULL OR f.state IN (?, ?))"
+            " AND NOT EXISTS (SELECT 1 FROM frontier g WHERE g.url = s.url)"
+        )
+        params: tuple = (DONE, FAILED)
+        if origin_url is not None:
+            query += " AND s.origin_url = ?"
+            params += (origin_url,)
+        with closing(self._connect()) as conn, conn:
+            rows = [
+                (url, depth, depth, origin, PENDING, None, None, None)
+                if crawled is None
+                else (
+                    url,
+                    depth,
+                    depth,
+                    origin,
+                    FAILED if success == 0 else DONE,
+                    crawled,
+                    success,
+                    cost,
+                )
+                for url, depth, origin, crawled, success, cost in conn.execute(
+                    query, params
+                ).fetchall()
+            ]
+            added = self._insert(conn, rows)
+        if added:
+            logger.info(f"Discovered {added} new sources")
+        return added
+
+    def pop(
+        self, n: int, urls: Optional[Collection[str]] = None
+    ) -> list[FrontierEntry]:
+        """
+        Claims up to `n` pending entries for this runner and returns them.
+
+        Entries are taken by priority, skipping domains that already have
+        `per_domain` entries in progress across all runners, and only among
+        `urls` if given. Stale leases are released first, in the same
+        transaction, so two runners never claim the same entry.
+        """
+        url_clause, url_params = _url_filter(urls)
+        entries = []
+        with closing(self._connect()) as conn, conn:
+            # Takes the write lock up front, claims are serialized across runners
+            conn.execute("BEGIN IMMEDIATE")
+            released = self._release_stale(conn, include_own=False)
+            in_progress = Counter(
+                dict(
+                    conn.execute(
+                        "SELECT domain, COUNT(*) FROM frontier WHERE state = ?"
+                        " GROUP BY domain",
+                        (IN_PROGRESS,),
+                    ).fetchall()
+                )
+            )
+            cursor = conn.execute(
+                "SELECT seq, url, domain, depth, priority, origin_url FROM frontier"
+                f" WHERE state = ?{url_clause} ORDER BY priority, seq",
+                (PENDING, *url_params),
+            )
+            for seq, url, domain, depth, priority, origin_url in cursor:
+                if len(entries) >= n:
+                    break
+                if in_progress[domain] >= self.per_domain:
+                    continue
+                in_progress[domain] += 1
+                entries.append(FrontierEntry(url, depth, priority, origin_url))
+            cursor.close()
+            expires = time.time() + self.lease_seconds
+            conn.executemany(
+                "UPDATE frontier SET state = ?, lease_owner = ?, lease_expires = ?"
+                " WHERE url = ?",
+                [(IN_PROGRESS, self.runner_id, expires, e.url) for e in entries],
+            )
+        if released:
+            logger.info(f"Released {released} entries with expired leases")
+        return entries
+
+    def requeue(self, urls: list[str]) -> int:
+        """
+        Puts crawled entries back to pending, at their depth, to crawl them again.
+
+        Entries in progress with a runner are left to it. Returns the number of
+        requeued entries.
+        """
+        with closing(self._connect()) as conn, conn:
+            return conn.executemany(
+                "UPDATE frontier SET state = ? WHERE url = ? AND state IN (?, ?)",
+                [(PENDING, url, DONE, FAILED) for url in urls],
+            ).rowcount
+
+    def renew(self, entries: list[FrontierEntry]) -> int:
+        """
+        Extends this runner's leases on entries it is still crawling.
+
+        Returns the number of renewed leases. A lease that already expired and
+        was claimed by another runner is not renewed.
+        """
+        if not entries:
+            return 0
+        expires = time.time() + self.lease_seconds
+        with closing(self._connect()) as conn, conn:
+            renewed = conn.executemany(
+                "UPDATE frontier SET lease_expires = ?"
+                " WHERE url = ? AND state = ? AND lease_owner = ?",
+                [(expires, e.url, IN_PROGRESS, self.runner_id) for e in entries],
+            ).rowcount
+        if renewed < len(entries):
+            logger.warning(
+                f"Lost the lease on {len(entries) - renewed}/{len(entries)} entries"
+            )
+        return renewed
+
+    def has_work(self, urls: Optional[Collection[str]] = None) -> bool:
+        """
+        Returns whether entries, among `urls` if given, are pending or in
+        progress with any runner.
+        """
+        url_clause, url_params = _url_filter(urls)
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT 1 FROM frontier WHERE state IN (?, ?){url_clause} LIMIT 1",
+                (PENDING, IN_PROGRESS, *url_params),
+            ).fetchone()
+        return row is not None
+
+    def complete(
+        self, entry: FrontierEntry, success: bool, cost: Optional[float] = None
+    ) -> int:
+        """
+        Records the outcome of crawling an entry and schedules what it found.
+
+        The crawl metadata is also written to the entry's row in the sources
+        table, if any. The outcome is dropped when this runner lost its lease on
+        the entry, which then belongs to the runner that claimed it since.
+        Returns the number of newly scheduled entries.
+        """
+        crawled = datetime.now().strftime(TIMESTAMP_FORMAT)
+        with closing(self._connect()) as conn, conn:
+            updated = conn.execute(
+                "UPDATE frontier SET state = ?, crawled_timestamp = ?, success = ?,"
+                " cost = ?, lease_owner = NULL, lease_expires = NULL"
+                " WHERE url = ? AND state = ? AND lease_owner = ?",
+                (
+                    DONE if success else FAILED,
+                    crawled,
+                    success,
+                    cost,
+                    entry.url,
+                    IN_PROGRESS,
+                    self.runner_id,
+                ),
+            ).rowcount
+            if not updated:
+                logger.warning(f"Lost the lease on {entry.url}, dropping its outcome")
+                return 0
+            conn.execute(
+                "UPDATE sources SET crawled_timestamp = ?, success = ?, cost = ?"
+                " WHERE url = ?",
+                (crawled, success, cost, entry.url),
+            )
+        return self.discover(entry.url) if success else 0
+
+    def counts(self) -> Counter:
+        """Returns the number of entries in each state"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT state, COUNT(*) FROM frontier GROUP BY state"
+            ).fetchall()
+        return Counter(dict(rows))
+
+    def export_metadata(self, source_df_path: Union[str, os.PathLike]) -> None:
+        """Writes the crawl metadata of the frontier back to a sources CSV"""
+        sources_df = pd.read_csv(source_df_path)
+        with closing(self._connect()) as conn:
+            crawled = pd.read_sql_query(
+                "SELECT url, crawled_timestamp, success, cost FROM frontier"
+                " WHERE state IN (?, ?)",
+                conn,
+                params=(DONE, FAILED),
+            ).set_index("url")
+        rows = sources_df["url"].isin(crawled.index)
+        if not rows.any():
+            return
+        for col in ["crawled_timestamp", "success", "cost"]:
+            sources_df[col] = sources_df[col].astype("object")
+            values = crawled.loc[sources_df.loc[rows, "url"], col].to_numpy()
+            if col == "success":
+                values = [None if pd.isna(v) else bool(v) for v in values]
+            sources_df.loc[rows, col] = values
+        save_metadata(sources_df, source_df_path)
@@ -1,10 +1,31 @@
-from anthropic import Anthropic
+import os
+from typing import Callable, Optional
+
+import httpx
+from anthropic import Anthropic, APIStatusError, DefaultHttpxClient
 
 from constants import ANTHROPIC_API_KEY, MODEL_NAME
 from logger import get_logger
+from metrics import get_metrics
+from ratelimit import RateLimiter, retry_after_seconds
 
 logger = get_logger(__name__)
 
+ANTHROPIC_RPM = int(os.getenv("ANTHROPIC_RPM", "50"))
+ANTHROPIC_ITPM = int(os.getenv("ANTHROPIC_ITPM", "40000"))
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "20"))
+ANTHROPIC_MAX_RETRIES = int(os.getenv("ANTHROPIC_MAX_RETRIES", "5"))
+
+PDF_BETA_HEADERS = {"anthropic-beta": "pdfs-2024-09-25"}
+RETRYABLE_STATUS_CODES = {429, 529}
+MAX_TOKENS = int(os.getenv("ANTHROPIC_MAX_TOKENS", "2048"))
+# Continuation requests issued when a completion stops at max_tokens
+MAX_CONTINUATIONS = int(os.getenv("ANTHROPIC_MAX_CONTINUATIONS", "3"))
+
+# Rough input-token estimate for a base64 PDF, used to reserve rate limit budget
+# before the real count comes back in the response usage
+BASE64_CHARS_PER_TOKEN = 60
+
 prompt = """Please extract the main benchmark table from this PDF document. 
             - Include the name of the benchmarks as rows and the names of the models evaluated as columns.
             - Present the table data in a clear tabular format
@@ -16,20 +37,49 @@ prompt = """Please extract the main benchmark table from this PDF document.
 logger.info("Initialized script with empty PDF base64 string")
 
 
-logger.debug(f"Constructed messages with prompt length: {len(prompt)}")
+logger.debug("Constructed messages with prompt length: %d", len(prompt))
 
 
-anthropic_client = Anthropic(
-    default_headers={"anthropic-beta": "pdfs-2024-09-25"}, api_key=ANTHROPIC_API_KEY
-)
+_client: Optional[Anthropic] = None
+_rate_limiter: Optional[RateLimiter] = None
 
 
-def get_completion(
-    source_base64: str,
-    client: Anthropic = anthropic_client,
-):
-    """Returns extracted table of benchmarks (rows) by model (columns) in csv string"""
-    messages = [
+def get_client() -> Anthropic:
+    """Returns the shared client, pooling connections across the crawl threads"""
+    global _client
+    if _client is None:
+        _client = Anthropic(
+            default_headers=PDF_BETA_HEADERS,
+            api_key=ANTHROPIC_API_KEY,
+            http_client=DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=ANTHROPIC_MAX_CONNECTIONS,
+                    max_keepalive_connections=ANTHROPIC_MAX_CONNECTIONS,
+                )
+            ),
+        )
+    return _client
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns the process-wide limiter shared by all completions"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(ANTHROPIC_RPM, ANTHROPIC_ITPM)
+    return _rate_limiter
+
+
+def estimate_input_tokens(source_base64: str, prefill: str = "") -> int:
+    """Returns a rough upper estimate of the input tokens of a completion request"""
+    return (
+        len(source_base64) // BASE64_CHARS_PER_TOKEN
+        + (len(prompt) + len(prefill)) // 4
+    )
+
+
+def build_messages(source_base64: str) -> list[dict]:
+    """Returns the extraction request messages for a base64 encoded PDF"""
+    return [
         {
             "role": "user",
             "content": [
@@ -46,13 +96,94 @@ def get_completion(
         }
     ]
 
-    logger.info("Requesting completion from Anthropic API")
-    try:
-        response = client.messages.create(
-            model=MODEL_NAME, max_tokens=2048, messages=messages
+
+def get_completion(
+    source_base64: str,
+    client: Optional[Anthropic] = None,
+    on_text: Optional[Callable[[str], None]] = None,
+    max_continuations: int = MAX_CONTINUATIONS,
+    model: str = MODEL_NAME,
+    limiter: Optional[RateLimiter] = None,
+    max_retries: int = ANTHROPIC_MAX_RETRIES,
+):
+    """
+    Returns extracted table of benchmarks (rows) by model (columns) in csv string
+
+    The response is streamed and every text delta is passed to `on_text` as it
+    arrives. When the response stops at max_tokens, the text so far is sent back
+    as the start of the assistant turn and the model continues from there, up to
+    `max_continuations` times.
+
+    Every request waits for the shared rate limiter, so the crawl threads
+    together stay within the requests and input tokens per minute. Rate limited
+    (429) and overloaded (529) responses pause the limiter, give back the
+    request's input tokens and are retried.
+    """
+    # Retries go through the limiter rather than the client's own backoff
+    client = (client or get_client()).with_options(max_retries=0)
+    limiter = limiter or get_rate_limiter()
+    messages = build_messages(source_base64)
+    text = ""
+    continuation = 0
+    attempt = 0
+
+    while True:
+        request_messages = messages
+        if text:
+            # The API rejects assistant prefills ending with whitespace
+            text = text.rstrip()
+            request_messages = messages + [{"role": "assistant", "content": text}]
+        estimated_tokens = estimate_input_tokens(source_base64, text)
+        streamed = text
+
+        limiter.acquire(estimated_tokens)
+        logger.info("Requesting completion from Anthropic API")
+        try:
+            with client.messages.stream(
+                model=model, max_tokens=MAX_TOKENS, messages=request_messages
+            ) as stream:
+                for delta in stream.text_stream:
+                    text += delta
+                    if on_text is not None:
+                        on_text(delta)
+                message = stream.get_final_message()
+        except APIStatusError as e:
+            # Text already passed to on_text cannot be taken back
+            if (
+                e.status_code not in RETRYABLE_STATUS_CODES
+                or attempt >= max_retries
+                or text != streamed
+            ):
+                logger.error(f"Error getting completion: {str(e)}", exc_info=True)
+                raise
+            limiter.release(estimated_tokens)
+            delay = retry_after_seconds(e.response.headers, attempt)
+            attempt += 1
+            logger.warning(
+                f"Anthropic API returned {e.status_code}, retrying in {delay:.1f}s "
+                f"(attempt {attempt}/{max_retries})"
+            )
+            limiter.pause(delay)
+            continue
+        except Exception as e:
+            logger.error(f"Error getting completion: {str(e)}", exc_info=True)
+            raise
+
+        limiter.record_usage(estimated_tokens, message.usage.input_tokens)
+        get_metrics().record_usage(message.usage, model)
+        if message.stop_reason != "max_tokens":
+            logger.info("Successfully received completion")
+            return text
+        if continuation >= max_continuations:
+            break
+        continuation += 1
+        logger.info(
+            f"Completion stopped at max_tokens after {len(text)} characters, "
+            f"continuing ({continuation}/{max_continuations})"
         )
-        logger.info("Successfully received completion")
-        return response.content[0].text
-    except Exception as e:
-        logger.error(f"Error getting completion: {str(e)}", exc_info=True)
-        raise
+
+    logger.warning(
+        f"Completion still truncated after {max_continuations} continuations"
+    )
+    return text
+
@@ -1,5 +1,14 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
 LOG_LEVEL_MAP = {
@@ -8,22 +17,128 @@ LOG_LEVEL_MAP = {
     "warning": logging.WARNING,
     "error": logging.ERROR,
 }
+# "json" for one JSON object per line, "text" for the human readable format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Fraction of the per-row debug events logged with `extra=SAMPLED` that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
 
+TEXT_FORMAT = "%(asctime)s - %(module)s - %(levelname)s - %(message)s"
+# Pass as `extra` to log events emitted once per row, which are sampled
+SAMPLED = {"sampled": True}
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+_configure_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as JSON lines, with any `extra` fields as keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key != "sampled":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a random `rate` fraction of the records marked as sampled"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._random = random.Random()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.rate >= 1:
+            return True
+        return self._random.random() < self.rate
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are.
+
+    QueueHandler.prepare merges the message and its arguments so records can be
+    pickled, which would format every message on the calling thread. The queue
+    stays in process, so that is left to the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
 
-def get_logger(name: str) -> logging.Logger:
-    console_handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-        "%(asctime)s - %(module)s - %(levelname)s - %(message)s"
-    )
 
-    # Add formatter to console_handler
-    console_handler.setFormatter(formatter)
+def configure_logging(
+    level: Optional[str] = None,
+    log_format: Optional[str] = None,
+    stream: Optional[TextIO] = None,
+    sample_rate: Optional[float] = None,
+) -> QueueListener:
+    """
+    Sends the records of every logger through a queue to a background thread.
 
-    logging.basicConfig(
-        level=LOG_LEVEL_MAP[LOG_LEVEL],
-        format="%(message)s",
-        datefmt="[%X]",
-        handlers=[console_handler],
-    )
+    Loggers only put records on the queue, the listener thread formats them and
+    writes them to `stream` (stderr by default). Calling it again replaces the
+    previous configuration.
+    """
+    global _listener, _queue_handler
+    level = level or LOG_LEVEL
+    log_format = log_format or LOG_FORMAT
+    sample_rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
 
+    with _configure_lock:
+        root = logging.getLogger()
+        if _listener is not None:
+            _listener.stop()
+            root.removeHandler(_queue_handler)
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        if log_format == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _queue_handler = _LazyQueueHandler(log_queue)
+        _queue_handler.addFilter(SamplingFilter(sample_rate))
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+
+        root.addHandler(_queue_handler)
+        root.setLevel(LOG_LEVEL_MAP[level.lower()])
+        return _listener
+
+
+def flush_logging() -> None:
+    """Waits until the queued records are written, e.g. before the process exits"""
+    with _configure_lock:
+        if _listener is not None:
+            # Stopping the listener drains the queue, a new one takes over
+            _listener.stop()
+            _listener.start()
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+def get_logger(name: str) -> logging.Logger:
+    if _listener is None:
+        configure_logging()
     return logging.getLogger(name)
@@ -0,0 +1,374 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+from constants import MODEL_NAME, benchmark_sources_path
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+METRICS_PATH = os.getenv(
+    "METRICS_PATH", str(Path(benchmark_sources_path).with_name("metrics.jsonl"))
+)
+# Port of the Prometheus endpoint started by the crawler, disabled when 0
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# USD per million input and output tokens, matched on the model name prefix
+MODEL_PRICES = {
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-sonnet": (3.0, 15.0),
+    "claude-3-opus": (15.0, 75.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-opus-4": (15.0, 75.0),
+}
+# Prompt cache writes and reads are billed relative to the input price
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+# Message Batches are billed at half the price of interactive requests
+BATCH_DISCOUNT = 0.5
+
+
+def model_prices(model: str) -> Optional[tuple[float, float]]:
+    """Returns the input and output prices of a model, or None if unknown"""
+    matches = [prefix for prefix in MODEL_PRICES if model.startswith(prefix)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def usage_cost(
+    usage: Any, model: str = MODEL_NAME, batch: bool = False
+) -> Optional[float]:
+    """Returns the cost in USD of a response's token usage, None if unpriced"""
+    prices = model_prices(model)
+    if prices is None:
+        return None
+    input_price, output_price = prices
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cost = (
+        usage.input_tokens * input_price
+        + cache_write * input_price * CACHE_WRITE_MULTIPLIER
+        + cache_read * input_price * CACHE_READ_MULTIPLIER
+        + usage.output_tokens * output_price
+    ) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+@dataclass
+class Span:
+    """Timing, size and token usage of one stage of a crawl"""
+
+    stage: str
+    url: Optional[str] = None
+    start: float = 0.0
+    seconds: float = 0.0
+    bytes: Optional[int] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class CrawlTotals:
+    """Cost of the API requests made while crawling a document"""
+
+    url: str
+    cost: Optional[float] = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass
+class StageTotals:
+    spans: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+
+
+@dataclass
+class RouteAttempt:
+    """One extraction attempt of a route, e.g. a model, and what it cost"""
+
+    route: str
+    url: Optional[str] = None
+    start: float = 0.0
+    seconds: float = 0.0
+    success: bool = False
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: Optional[float] = None
+    error: Optional[str] = None
+    # Lets consumers of the JSON lines tell attempts apart from spans
+    stage: str = "route"
+
+
+@dataclass
+class RouteTotals:
+    attempts: int = 0
+    successes: int = 0
+    seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_current_crawl: ContextVar[Optional[CrawlTotals]] = ContextVar(
+    "current_crawl", default=None
+)
+_current_route: ContextVar[Optional[RouteAttempt]] = ContextVar(
+    "current_route", default=None
+)
+
+
+class Metrics:
+    """
+    Records spans of the crawl stages and the cost of API requests.
+
+    Every finished span is appended as a JSON line to `path`, if set, and added
+    to per-stage totals that can be rendered in the Prometheus text format.
+    Token usage is attributed to the innermost open span and to the document
+    being crawled, so `crawl` returns the actual cost of a document. Extraction
+    attempts are recorded per route, to compare the success rate, latency and
+    cost of the models tried.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = METRICS_PATH):
+        self.path = Path(path) if path is not None else None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.stages: dict[str, StageTotals] = {}
+        self.routes: dict[str, RouteTotals] = {}
+        self._lock = threading.Lock()
+        self._unpriced_models: set[str] = set()
+
+    @contextmanager
+    def crawl(self, url: str) -> Iterator[CrawlTotals]:
+        """Attributes the cost of the requests made inside the block to `url`"""
+        totals = CrawlTotals(url)
+        token = _current_crawl.set(totals)
+        try:
+            yield totals
+        finally:
+            _current_crawl.reset(token)
+
+    @contextmanager
+    def span(self, stage: str, url: Optional[str] = None) -> Iterator[Span]:
+        """
+        Times the block as a stage of the current crawl.
+
+        The yielded span's `bytes` can be set inside the block. A span left by
+        an exception is recorded with the exception type as its error.
+        """
+        crawl = _current_crawl.get()
+        span = Span(stage, url or (crawl.url if crawl else None), time.time())
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.seconds = time.perf_counter() - started
+            _current_span.reset(token)
+            self.record(span)
+
+    @contextmanager
+    def route(self, route: str, url: Optional[str] = None) -> Iterator[RouteAttempt]:
+        """
+        Times the block as an extraction attempt of `route`.
+
+        Set the yielded attempt's `success` inside the block once the result is
+        known valid. Token usage inside the block is added to the attempt.
+        """
+        crawl = _current_crawl.get()
+        attempt = RouteAttempt(
+            route, url or (crawl.url if crawl else None), time.time()
+        )
+        token = _current_route.set(attempt)
+        started = time.perf_counter()
+        try:
+            yield attempt
+        except BaseException as e:
+            attempt.error = type(e).__name__
+            attempt.success = False
+            raise
+        finally:
+            attempt.seconds = time.perf_counter() - started
+            _current_route.reset(token)
+            self.record_route(attempt)
+
+    def record_usage(
+        self, usage: Any, model: str = MODEL_NAME, batch: bool = False
+    ) -> Optional[float]:
+        """
+        Records the token usage of an API response and returns its cost.
+
+        Usage outside of any span is recorded as a `usage` span of its own.
+        """
+        cost = usage_cost(usage, model, batch)
+        crawl = _current_crawl.get()
+        span = _current_span.get()
+        # Concurrent page windows share the route, crawl and span of the thread
+        # that started them through their copied context
+        with self._lock:
+            is_first_unpriced = cost is None and model not in self._unpriced_models
+            if is_first_unpriced:
+                self._unpriced_models.add(model)
+
+            route = _current_route.get()
+            if route is not None:
+                route.input_tokens += usage.input_tokens
+                route.output_tokens += usage.output_tokens
+                if cost is not None:
+                    route.cost = (route.cost or 0.0) + cost
+
+            if crawl is not None:
+                crawl.input_tokens += usage.input_tokens
+                crawl.output_tokens += usage.output_tokens
+                crawl.cost = (
+                    None if cost is None or crawl.cost is None else crawl.cost + cost
+                )
+
+            if span is not None:
+                span.input_tokens += usage.input_tokens
+                span.output_tokens += usage.output_tokens
+                if cost is not None:
+                    span.cost = (span.cost or 0.0) + cost
+
+        if is_first_unpriced:
+            logger.warning(f"No prices known for model {model}, cost not recorded")
+        if span is None:
+            self.record(
+                Span(
+                    "usage",
+                    crawl.url if crawl else None,
+                    time.time(),
+                    input_tokens=usage.input_tokens,
+                    output_tokens=usage.output_tokens,
+                    cost=cost,
+                )
+            )
+        return cost
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            totals = self.stages.setdefault(span.stage, StageTotals())
+            totals.spans += 1
+            totals.errors += span.error is not None
+            totals.seconds += span.seconds
+            totals.bytes += span.bytes or 0
+            totals.input_tokens += span.input_tokens
+            totals.output_tokens += span.output_tokens
+            totals.cost += span.cost or 0.0
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(asdict(span)) + "\n")
+
+    def record_route(self, attempt: RouteAttempt) -> None:
+        with self._lock:
+            totals = self.routes.setdefault(attempt.route, RouteTotals())
+            totals.attempts += 1
+            totals.successes += attempt.success
+            totals.seconds += attempt.seconds
+            totals.input_tokens += attempt.input_tokens
+            totals.output_tokens += attempt.output_tokens
+            totals.cost += attempt.cost or 0.0
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(asdict(attempt)) + "\n")
+
+    def to_prometheus(self) -> str:
+        """Returns the per-stage and per-route totals in the Prometheus text format"""
+        metrics = [
+            ("crawl_stage_spans_total", "Finished spans", "spans"),
+            ("crawl_stage_errors_total", "Spans ended by an error", "errors"),
+            ("crawl_stage_seconds_total", "Wall time spent in the stage", "seconds"),
+            ("crawl_stage_bytes_total", "Bytes processed in the stage", "bytes"),
+            ("crawl_stage_input_tokens_total", "API input tokens", "input_tokens"),
+            ("crawl_stage_output_tokens_total", "API output tokens", "output_tokens"),
+            ("crawl_stage_cost_usd_total", "API cost in USD", "cost"),
+        ]
+        route_metrics = [
+            ("extraction_route_attempts_total", "Extraction attempts", "attempts"),
+            ("extraction_route_successes_total", "Valid tables", "successes"),
+            ("extraction_route_seconds_total", "Wall time of attempts", "seconds"),
+            ("extraction_route_input_tokens_total", "API input tokens", "input_tokens"),
+            (
+                "extraction_route_output_tokens_total",
+                "API output tokens",
+                "output_tokens",
+            ),
+            ("extraction_route_cost_usd_total", "API cost in USD", "cost"),
+        ]
+        with self._lock:
+            stages = {stage: asdict(totals) for stage, totals in self.stages.items()}
+            routes = {route: asdict(totals) for route, totals in self.routes.items()}
+        lines = []
+        for label, groups, group_metrics in (
+            ("stage", stages, metrics),
+            ("route", routes, route_metrics),
+        ):
+            for name, help_text, attr in group_metrics:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                lines += [
+                    f'{name}{{{label}="{key}"}} {totals[attr]:g}'
+                    for key, totals in sorted(groups.items())
+                ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Union[str, Path]) -> None:
+        """Writes the totals to a file, e.g. for the node exporter textfile collector"""
+        tmp_path = Path(f"{path}.tmp")
+        tmp_path.write_text(self.to_prometheus(), encoding="utf-8")
+        tmp_path.replace(path)
+
+    def serve(self, port: int = METRICS_PORT, host: str = "") -> ThreadingHTTPServer:
+        """Serves the totals at `/metrics` from a background thread"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on port {server.server_address[1]}")
+        return server
+
+
+_default_metrics: Optional[Metrics] = None
+
+
+def get_metrics() -> Metrics:
+    """Returns the process-wide metrics recorder, creating it on first use"""
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = Metrics()
+    return _default_metrics
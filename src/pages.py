@@ -0,0 +1,172 @@
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Sequence, Union
+
+from pypdf import PdfReader, PdfWriter
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+PAGE_LOCATOR_ENABLED = os.getenv("PAGE_LOCATOR_ENABLED", "true").lower() == "true"
+TABLE_PAGE_MIN_SCORE = float(os.getenv("TABLE_PAGE_MIN_SCORE", "0.15"))
+TABLE_PAGE_MIN_CELLS = 10
+REFERENCE_PAGE_MIN_ENTRIES = 5
+
+# The API renders every PDF page as an image on top of its text, estimate of
+# the image tokens per page
+PAGE_IMAGE_TOKENS = 1600
+CHARS_PER_TOKEN = 4
+
+# Table cells: numbers, percentages and dash placeholders for missing values
+CELL_PATTERN = re.compile(r"^\(?[-+]?\d+(?:[.,]\d+)?%?\)?$|^[—–-]+$")
+REFERENCE_ENTRY_PATTERN = re.compile(r"(?m)^\[(\d+)\]")
+# Links of a bibliography entry: a URL, or an arXiv identifier as in
+# `arXiv preprint arXiv:2009.03300`
+REFERENCE_URL_PATTERN = re.compile(r"https?://[^\s<>\"]+")
+REFERENCE_ARXIV_PATTERN = re.compile(
+    r"(?i)\barxiv:\s*(\d{4}\.\d{4,5}|[a-z-]+(?:\.[a-z]{2})?/\d{7})"
+)
+ARXIV_ABS_URL = "https://arxiv.org/abs/{}"
+
+
+@dataclass
+class PageSelection:
+    """Pages of a PDF selected to be sent for extraction (0-based indices)"""
+
+    pages: list[int]
+    total_pages: int
+    table_pages: list[int]
+    reference_pages: list[int]
+    tokens_saved: int
+
+    @property
+    def is_full_document(self) -> bool:
+        return len(self.pages) == self.total_pages
+
+
+def table_score(text: str) -> float:
+    """Returns the fraction of words on a page that look like table cells"""
+    words = text.split()
+    if not words:
+        return 0.0
+    cells = sum(1 for word in words if CELL_PATTERN.match(word))
+    if cells < TABLE_PAGE_MIN_CELLS:
+        return 0.0
+    return cells / len(words)
+
+
+def is_reference_page(text: str) -> bool:
+    """Returns whether a page holds bibliography entries like `[12] A. Author...`"""
+    return len(REFERENCE_ENTRY_PATTERN.findall(text)) >= REFERENCE_PAGE_MIN_ENTRIES
+
+
+def reference_urls(texts: Iterable[str]) -> dict[int, str]:
+    """
+    Returns the link of every numbered bibliography entry on the reference pages.
+
+    An entry `[12] A. Author...` maps 12 to the first URL it holds, or to the
+    arXiv page of its `arXiv:<id>` identifier. Entries without either are left
+    out, and the first entry seen for a number is kept.
+    """
+    urls: dict[int, str] = {}
+    for text in texts:
+        if not is_reference_page(text):
+            continue
+        entries = list(REFERENCE_ENTRY_PATTERN.finditer(text))
+        for entry, following in zip(entries, entries[1:] + [None]):
+            body = text[entry.end() : following.start() if following else len(text)]
+            if match := REFERENCE_URL_PATTERN.search(body):
+                url = match.group().rstrip(".,;:)]")
+            elif match := REFERENCE_ARXIV_PATTERN.search(body):
+                url = ARXIV_ABS_URL.format(match[1])
+            else:
+                continue
+            urls.setdefault(int(entry[1]), url)
+    return urls
+
+
+def read_references(file_path: Union[str, Path]) -> dict[int, str]:
+    """Returns the links of the numbered bibliography entries of a PDF"""
+    return reference_urls(page_texts(PdfReader(file_path)))
+
+
+def estimate_page_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + PAGE_IMAGE_TOKENS
+
+
+def page_texts(reader: PdfReader) -> list[str]:
+    """Returns the extracted text of every page of a PDF"""
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def locate_table_pages(
+    file_path: Union[str, Path], min_score: float = TABLE_PAGE_MIN_SCORE
+) -> PageSelection:
+    """
+    Scores the pages of a PDF for benchmark table content.
+
+    Selects the pages scoring at least `min_score` plus the reference pages, which
+    the model needs to fill in the `source` column. Falls back to the full
+    document when no page scores high enough.
+    """
+    return select_pages(page_texts(PdfReader(file_path)), min_score, str(file_path))
+
+
+def select_pages(
+    texts: Sequence[str],
+    min_score: float = TABLE_PAGE_MIN_SCORE,
+    name: str = "document",
+) -> PageSelection:
+    """Selects the table and reference pages among already extracted page texts"""
+    total_pages = len(texts)
+
+    table_pages = [i for i, text in enumerate(texts) if table_score(text) >= min_score]
+    reference_pages = [
+        i
+        for i, text in enumerate(texts)
+        if i not in table_pages and is_reference_page(text)
+    ]
+
+    if not table_pages:
+        logger.info(f"No table pages found in {name}, using the full document")
+        pages = list(range(total_pages))
+    else:
+        pages = sorted(table_pages + reference_pages)
+
+    tokens_saved = sum(
+        estimate_page_tokens(text) for i, text in enumerate(texts) if i not in pages
+    )
+    logger.info(
+        f"Selected {len(pages)}/{total_pages} pages of {name} "
+        f"(tables: {table_pages}, references: {len(reference_pages)} pages), "
+        f"saving ~{tokens_saved} input tokens"
+    )
+    return PageSelection(
+        pages=pages,
+        total_pages=total_pages,
+        table_pages=table_pages,
+        reference_pages=reference_pages,
+        tokens_saved=tokens_saved,
+    )
+
+
+def slice_pdf(file_path: Union[str, Path, PdfReader], pages: Sequence[int]) -> Path:
+    """
+    Writes the given pages (0-based) of a PDF to a new temporary file.
+
+    Accepts an open reader so a PDF that was already parsed is not read twice.
+    The caller is responsible for removing the returned file.
+    """
+    reader = file_path if isinstance(file_path, PdfReader) else PdfReader(file_path)
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(reader.pages[page])
+
+    fd, out_name = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as out:
+        writer.write(out)
+    return Path(out_name)
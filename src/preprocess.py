@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+from pypdf import PdfReader
+
+import engines
+from logger import get_logger
+from pages import (
+    PAGE_LOCATOR_ENABLED,
+    TABLE_PAGE_MIN_SCORE,
+    PageSelection,
+    page_texts,
+    reference_urls,
+    select_pages,
+    slice_pdf,
+)
+from titles import title_from_reader
+
+logger = get_logger(__name__)
+
+# Processes parsing PDFs next to the download and API threads of the crawl,
+# 0 runs the preprocessing in the calling thread instead
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 1)))
+
+
+@dataclass
+class Preprocessed:
+    """
+    Compact result of the local, CPU-bound work on a downloaded PDF.
+
+    `request_path` is the file to send for extraction: a temporary file holding
+    the selected pages, or the document itself when all of it is sent.
+    `tables` holds the raw tabula tables of the table pages and `references`
+    the links of the numbered references they may cite, both None when tabula
+    was not run.
+    """
+
+    file_path: Path
+    request_path: Path
+    selection: Optional[PageSelection] = None
+    title: Optional[str] = None
+    tables: Optional[list[pd.DataFrame]] = None
+    references: Optional[dict[int, str]] = None
+    errors: list[str] = field(default_factory=list)
+
+    def cleanup(self) -> None:
+        """Removes the temporary file of the selected pages, if any"""
+        if self.request_path != self.file_path:
+            self.request_path.unlink(missing_ok=True)
+
+
+def preprocess_document(
+    file_path: Union[str, Path],
+    locate_pages: bool = PAGE_LOCATOR_ENABLED,
+    read_tables: bool = False,
+    min_score: float = TABLE_PAGE_MIN_SCORE,
+) -> Preprocessed:
+    """
+    Extracts the page texts of a PDF once and derives from them the title, the
+    pages to send for extraction and, if `read_tables`, the tabula tables and
+    the references they may cite.
+
+    Never raises on a broken PDF: whatever could not be computed is left unset
+    and the reason added to `errors`, so the engines fall back to the full file.
+    """
+    file_path = Path(file_path)
+    result = Preprocessed(file_path=file_path, request_path=file_path)
+    try:
+        reader = PdfReader(file_path)
+        texts = page_texts(reader)
+    except Exception as e:
+        result.errors.append(f"Failed to read {file_path}: {e}")
+        reader, texts = None, []
+
+    if reader is not None:
+        try:
+            result.title = title_from_reader(reader, texts[0] if texts else "")
+        except Exception as e:
+            result.errors.append(f"Failed to read the title: {e}")
+
+        if locate_pages:
+            try:
+                result.selection = select_pages(texts, min_score, str(file_path))
+                if not result.selection.is_full_document:
+                    result.request_path = slice_pdf(reader, result.selection.pages)
+            except Exception as e:
+                result.errors.append(f"Failed to locate table pages: {e}")
+
+    if read_tables:
+        result.references = reference_urls(texts)
+        pages = None
+        if result.selection is not None and not result.selection.is_full_document:
+            pages = result.selection.table_pages
+        try:
+            result.tables = engines.read_tables(file_path, pages)
+        except Exception as e:
+            # An empty list, so the tabula engine escalates without reading again
+            result.errors.append(f"Failed to read tables: {e}")
+            result.tables = []
+    return result
+
+
+def _init_worker() -> None:
+    # Workers live as long as the pool, so pypdf and the page locator are
+    # imported once per worker rather than once per document. Without JPype,
+    # which is not a dependency, tabula-py still runs java in a subprocess per
+    # read: the pool moves that work off the crawl threads, it does not avoid it
+    logger.debug("Preprocessing worker %d started", os.getpid())
+
+
+class Preprocessor:
+    """
+    Process pool running `preprocess_document` for the I/O-bound crawl threads.
+
+    Crawl threads hand over downloaded file paths through the pool's call queue
+    and wait on the result without holding the GIL, so downloads and API calls
+    keep going while every core parses PDFs.
+    """
+
+    def __init__(self, workers: int = PREPROCESS_WORKERS):
+        if workers < 0:
+            raise ValueError(f"workers must be at least 0, got {workers}")
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Not forked from a process running crawl and logging threads
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    @staticmethod
+    def _options() -> dict[str, bool]:
+        # Settings are read here, workers do not see changes made after startup
+        enabled = [name.strip() for name in engines.EXTRACTION_ENGINES]
+        return {
+            "locate_pages": engines.PAGE_LOCATOR_ENABLED,
+            "read_tables": "tabula" in enabled and engines.tabula_available(),
+        }
+
+    def submit(self, file_path: Union[str, Path]) -> "Future[Preprocessed]":
+        options = self._options()
+        if self.workers == 0:
+            future: Future[Preprocessed] = Future()
+            try:
+                future.set_result(preprocess_document(file_path, **options))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._pool().submit(preprocess_document, file_path, **options)
+
+    def preprocess(self, file_path: Union[str, Path]) -> Preprocessed:
+        """Preprocesses a PDF in the pool and waits for the result"""
+        prepared = self.submit(file_path).result()
+        for error in prepared.errors:
+            logger.warning(error)
+        return prepared
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_default_preprocessor: Optional[Preprocessor] = None
+
+
+def get_preprocessor() -> Preprocessor:
+    """Returns the process-wide preprocessor, creating it on first use"""
+    global _default_preprocessor
+    if _default_preprocessor is None:
+        _default_preprocessor = Preprocessor()
+    return _default_preprocessor
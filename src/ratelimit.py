@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+from typing import Callable, Mapping, Optional
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `capacity` tokens per `period` seconds.
+
+    The bucket is safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        period: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if capacity <= 0 or period <= 0:
+            raise ValueError("capacity and period must be positive")
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """
+        Takes `amount` tokens if available.
+
+        Returns 0 if the tokens were taken, otherwise the number of seconds to wait
+        before they will be. Requests larger than the capacity are clamped to it so
+        they can still go through once the bucket is full.
+        """
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """Blocks the calling thread until `amount` tokens have been taken"""
+        while (wait := self.try_acquire(amount)) > 0:
+            time.sleep(wait)
+
+    def adjust(self, delta: float) -> None:
+        """Gives back (positive) or takes away (negative) tokens after the fact"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+
+class RateLimiter:
+    """
+    Dispatch limiter for the Anthropic API.
+
+    Combines a requests-per-minute bucket with an input-tokens-per-minute bucket,
+    and a shared pause that is set when the API answers with 429/529 so that every
+    in-flight caller backs off, not only the one that got the error. Crawl threads
+    dispatch with `acquire`.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        input_tokens_per_minute: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.requests = TokenBucket(requests_per_minute, clock=clock)
+        self.input_tokens = TokenBucket(input_tokens_per_minute, clock=clock)
+        self._clock = clock
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Holds back all dispatches for at least `seconds`"""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def acquire(self, input_tokens: float) -> None:
+        """Blocks the calling thread until a request of `input_tokens` may be sent"""
+        while (wait := self._paused_until - self._clock()) > 0:
+            time.sleep(wait)
+        self.requests.acquire(1)
+        self.input_tokens.acquire(input_tokens)
+
+    def record_usage(self, estimated_tokens: float, actual_tokens: float) -> None:
+        """Reconciles the input-token bucket with the usage reported by the API"""
+        self.input_tokens.adjust(estimated_tokens - actual_tokens)
+
+    def release(self, input_tokens: float) -> None:
+        """Gives back the input tokens of a request the API rejected unprocessed"""
+        self.input_tokens.adjust(input_tokens)
+
+
+def retry_after_seconds(
+    headers: Optional[Mapping[str, str]],
+    attempt: int,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+) -> float:
+    """
+    Returns how long to wait before retrying a rate limited or overloaded request.
+
+    Honours `retry-after-ms` and `retry-after` response headers, falling back to
+    exponential backoff with full jitter when neither is present.
+    """
+    if headers:
+        for header, scale in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+            value = headers.get(header)
+            if value is None:
+                continue
+            try:
+                return min(max(float(value) / scale, 0.0), max_delay)
+            except ValueError:
+                logger.debug("Ignoring unparseable %s header: %s", header, value)
+
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
@@ -0,0 +1,244 @@
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+
+import utils
+from cache import get_pdf_cache
+from downloader import get_downloader
+from frontier import Frontier
+from logger import get_logger
+from scheduler import (
+    CRAWL_WORKERS,
+    METADATA_COLS,
+    TIMESTAMP_FORMAT,
+    CrawlFn,
+    crawl_frontier,
+    pending_rows,
+)
+from store import SourceStore, get_source_store
+
+logger = get_logger(__name__)
+
+# Sources crawled or checked more recently than this are not checked again
+REFRESH_STALE_AFTER_DAYS = float(os.getenv("REFRESH_STALE_AFTER_DAYS", "7"))
+
+UNCHANGED = "unchanged"
+CHANGED = "changed"
+FAILED = "failed"
+
+
+@dataclass
+class SourceVersion:
+    """Validators and content hash of the last seen version of a source"""
+
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    sha256: Optional[str] = None
+    checked: Optional[float] = None
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def matches(self, headers) -> bool:
+        """Returns whether response headers carry the validators of this version"""
+        if self.etag and headers.get("ETag"):
+            return headers["ETag"] == self.etag
+        if self.last_modified and headers.get("Last-Modified"):
+            return headers["Last-Modified"] == self.last_modified
+        return False
+
+
+class VersionStore:
+    """
+    Versions of the crawled sources, in the source store database.
+
+    Lets a refresh tell, with a conditional HEAD request, whether a source
+    changed since it was last extracted.
+    """
+
+    def __init__(self, store: SourceStore):
+        self.db_path = store.db_path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS source_versions ("
+                " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT,"
+                " sha256 TEXT, checked REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, url: str) -> Optional[SourceVersion]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT url, etag, last_modified, sha256, checked"
+                " FROM source_versions WHERE url = ?",
+                (url,),
+            ).fetchone()
+        return SourceVersion(*row) if row is not None else None
+
+    def put(self, version: SourceVersion) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO source_versions VALUES (?, ?, ?, ?, ?)",
+                (
+                    version.url,
+                    version.etag,
+                    version.last_modified,
+                    version.sha256,
+                    version.checked,
+                ),
+            )
+
+    def checked_since(self, cutoff: float) -> set[str]:
+        """Returns the URLs checked after the `cutoff` epoch time"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT url FROM source_versions WHERE checked > ?", (cutoff,)
+            ).fetchall()
+        return {url for (url,) in rows}
+
+
+def check_source(url: str, versions: VersionStore) -> str:
+    """
+    Returns whether the document at `url` changed since it was last extracted.
+
+    Sends a conditional HEAD request when validators of the last version are
+    known; a 304, or the same ETag or Last-Modified, means unchanged without
+    downloading anything. Otherwise the document is downloaded again and its
+    SHA-256 compared with that of the last version, so a server answering
+    without validators or touching them on every request does not cause a new
+    extraction of the same bytes.
+    """
+    known = versions.get(url) or SourceVersion(
+        url, sha256=get_pdf_cache().content_sha256(url)
+    )
+    current = SourceVersion(url, sha256=known.sha256, checked=time.time())
+
+    response = get_downloader().head(url, known.conditional_headers())
+    if response.status_code == 304 or (response.ok and known.matches(response.headers)):
+        current.etag, current.last_modified = known.etag, known.last_modified
+        versions.put(current)
+        return UNCHANGED
+    if response.ok:
+        current.etag = response.headers.get("ETag")
+        current.last_modified = response.headers.get("Last-Modified")
+
+    cache = get_pdf_cache()
+    utils.download_file(url, cache, refresh=True)
+    current.sha256 = cache.content_sha256(url)
+    versions.put(current)
+    if known.sha256 is not None and current.sha256 == known.sha256:
+        return UNCHANGED
+    return CHANGED
+
+
+def stale_rows(
+    sources_df: pd.DataFrame,
+    stale_after: timedelta,
+    versions: VersionStore,
+    now: Optional[datetime] = None,
+) -> pd.Index:
+    """
+    Returns the crawled rows due for a refresh.
+
+    A row is due when it was crawled longer than `stale_after` ago and was not
+    checked within that window either. Rows not crawled yet are left to the
+    regular crawl.
+    """
+    cutoff = (now or datetime.now()) - stale_after
+    crawled = pd.to_datetime(
+        sources_df["crawled_timestamp"], format=TIMESTAMP_FORMAT, errors="coerce"
+    )
+    recently_checked = versions.checked_since(cutoff.timestamp())
+    due = (
+        sources_df["url"].notna()
+        & ~sources_df.index.isin(pending_rows(sources_df))
+        & ~(crawled > cutoff)
+        & ~sources_df["url"].isin(recently_checked)
+    )
+    return sources_df.index[due]
+
+
+def refresh_sources(
+    source_df_path: str,
+    crawl_fn: CrawlFn,
+    stale_after: timedelta = timedelta(days=REFRESH_STALE_AFTER_DAYS),
+    max_workers: int = CRAWL_WORKERS,
+) -> Counter:
+    """
+    Re-crawls the stale rows of a sources CSV whose documents changed.
+
+    Stale rows are checked concurrently with `check_source`, through the pooled
+    downloader so every host is still crawled politely. Rows whose document
+    changed, and stale rows whose last crawl failed, are put back in the crawl
+    frontier as pending, at their depth, and only they are crawled with
+    `crawl_fn` through `crawl_frontier`, so they are claimed under a lease like
+    any other crawl and the frontier keeps their new metadata. The others only
+    have their check time updated. A row whose check fails is left as is for the
+    next refresh.
+
+    Returns the number of rows per outcome.
+    """
+    store = get_source_store()
+    versions = VersionStore(store)
+    sources_df = pd.read_csv(source_df_path)
+    for col in METADATA_COLS:
+        sources_df[col] = sources_df[col].astype("object")
+
+    due = stale_rows(sources_df, stale_after, versions)
+    failed = sources_df.loc[due, "success"].astype(str) == "False"
+    to_check = due[~failed.to_numpy()]
+    logger.info(
+        f"Checking {len(to_check)} stale rows for changes, "
+        f"re-crawling {failed.sum()} stale failed rows"
+    )
+
+    recrawl = list(due[failed.to_numpy()])
+    outcomes = Counter({CHANGED: len(recrawl)} if recrawl else {})
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            idx: executor.submit(check_source, str(sources_df.at[idx, "url"]), versions)
+            for idx in to_check
+        }
+        for idx, future in futures.items():
+            try:
+                outcome = future.result()
+            except Exception as e:
+                logger.error(f"Failed to check {sources_df.at[idx, 'url']}: {e}")
+                outcome = FAILED
+            outcomes[outcome] += 1
+            if outcome == CHANGED:
+                recrawl.append(idx)
+
+    logger.info(
+        f"{outcomes[UNCHANGED]} unchanged, {outcomes[CHANGED]} to re-crawl, "
+        f"{outcomes[FAILED]} failed checks"
+    )
+    if recrawl:
+        frontier = Frontier(store)
+        # Rows missing from the frontier are added, crawled ones as done, so
+        # they can be requeued
+        frontier.seed(sources_df)
+        urls = sources_df.loc[recrawl, "url"].tolist()
+        requeued = frontier.requeue(urls)
+        logger.info(f"Requeued {requeued} changed sources in the frontier")
+        # Other pending entries, and the sources the re-crawl schedules, are
+        # left to the regular crawl
+        crawl_frontier(frontier, crawl_fn, max_workers=max_workers, urls=urls)
+        frontier.export_metadata(source_df_path)
+    return outcomes
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs
+import pyarrow.ipc
+
+from constants import benchmark_results_path
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+RESULTS_STORE_DIR = os.getenv(
+    "RESULTS_STORE_DIR", str(Path(benchmark_results_path).with_suffix(""))
+)
+
+RESULT_SCHEMA = pa.schema(
+    [
+        ("origin", pa.string()),
+        ("benchmark", pa.string()),
+        ("test_type", pa.string()),
+        ("model", pa.string()),
+        ("value", pa.float32()),
+        ("unit", pa.string()),
+    ]
+)
+NON_MODEL_COLUMNS = {"name", "test_type", "source"}
+SCORE_PATTERN = re.compile(r"^\(?(?P<value>[-+]?\d+(?:[.,]\d+)?)\s*(?P<unit>%?)\)?$")
+
+
+def origin_partition(origin: str) -> str:
+    """Returns the partition directory name of an origin document"""
+    return f"origin={hashlib.sha256(origin.encode('utf-8')).hexdigest()[:16]}"
+
+
+def to_long(benchmark_df: pd.DataFrame, origin: str) -> pd.DataFrame:
+    """
+    Converts a `name,test_type,<models...>,source` table to one row per score.
+
+    Scores like `86.8%` become a float value and a `%` unit. Missing values
+    (`-`) and cells that are not scores are left out.
+    """
+    model_cols = [col for col in benchmark_df.columns if col not in NON_MODEL_COLUMNS]
+    test_types = (
+        benchmark_df["test_type"]
+        if "test_type" in benchmark_df.columns
+        else pd.Series(None, index=benchmark_df.index, dtype=object)
+    )
+    wide = pd.DataFrame(
+        {
+            "benchmark": benchmark_df["name"].astype(str).str.strip(),
+            "test_type": test_types.where(test_types.notna(), None).map(
+                lambda v: None if v is None else str(v).strip()
+            ),
+        }
+    )
+    for col in model_cols:
+        wide[str(col).strip()] = benchmark_df[col].astype(str).str.strip()
+
+    long = wide.melt(
+        id_vars=["benchmark", "test_type"], var_name="model", value_name="raw"
+    )
+    scores = long["raw"].str.extract(SCORE_PATTERN)
+    long["value"] = scores["value"].str.replace(",", ".").astype("float32")
+    long["unit"] = scores["unit"]
+    long = long[long["value"].notna()].drop(columns="raw")
+    long.insert(0, "origin", origin)
+    return long.reset_index(drop=True)
+
+
+class ResultsStore:
+    """
+    Columnar store of benchmark scores in long format.
+
+    Scores are written as uncompressed Arrow IPC files partitioned by origin
+    document, `origin=<hash>/part-<time>-<id>.arrow`, so adding a document only
+    writes a new file and files are memory-mapped when read. The store is
+    append-only: extracting a document again adds a part next to the earlier
+    ones, and reads deduplicate by using only the latest part of each origin.
+    Queries go through a dataset scan that only reads the columns and rows they
+    need.
+    """
+
+    def __init__(self, root: Union[str, Path] = RESULTS_STORE_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+
+    def append(self, benchmark_df: pd.DataFrame, origin: str) -> int:
+        """
+        Stores the scores of a benchmark table extracted from `origin`.
+
+        Returns the number of stored scores.
+        """
+        long = to_long(benchmark_df, origin)
+        table = pa.Table.from_pandas(long, schema=RESULT_SCHEMA, preserve_index=False)
+        partition = self.root / origin_partition(origin)
+        partition.mkdir(exist_ok=True)
+
+        # Part names sort by write time, the latest one is the current extraction
+        part_path = partition / f"part-{time.time_ns():020d}-{uuid.uuid4().hex}.arrow"
+        # Written under another name and renamed, readers never see a partially
+        # written part
+        tmp_path = part_path.with_suffix(".tmp")
+        with (
+            pa.OSFile(str(tmp_path), "wb") as sink,
+            pyarrow.ipc.new_file(sink, RESULT_SCHEMA) as writer,
+        ):
+            writer.write_table(table)
+        tmp_path.replace(part_path)
+
+        logger.info(f"Stored {len(long)} scores from {origin}")
+        return len(long)
+
+    @staticmethod
+    def _latest_part(partition: Path) -> Optional[str]:
+        parts = sorted(partition.glob("part-*.arrow"))
+        return str(parts[-1]) if parts else None
+
+    def _dataset(self, partitions: list[Path]) -> ds.Dataset:
+        files = [
+            part
+            for part in map(self._latest_part, sorted(partitions))
+            if part is not None
+        ]
+        return ds.dataset(
+            files, schema=RESULT_SCHEMA, format="ipc", filesystem=self._filesystem
+        )
+
+    def dataset(self) -> ds.Dataset:
+        """Returns the latest scores of every origin as an Arrow dataset"""
+        return self._dataset(list(self.root.glob("origin=*")))
+
+    def read(self, origin: Optional[str] = None) -> pd.DataFrame:
+        """Returns all stored scores, or those of one origin document"""
+        if origin is not None:
+            dataset = self._dataset([self.root / origin_partition(origin)])
+        else:
+            dataset = self.dataset()
+        return dataset.to_table().to_pandas()
+
+    def leaderboard(
+        self, benchmark: str, test_type: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Returns the scores of every model on a benchmark, best first.
+
+        Benchmark and test type are matched case-insensitively.
+        """
+        condition = pc.utf8_lower(ds.field("benchmark")) == benchmark.strip().lower()
+        if test_type is not None:
+            condition &= pc.utf8_lower(ds.field("test_type")) == (
+                test_type.strip().lower()
+            )
+        table = self.dataset().to_table(
+            columns=["model", "value", "unit", "test_type", "origin"],
+            filter=condition,
+        )
+        return (
+            table.to_pandas()
+            .sort_values("value", ascending=False, kind="stable")
+            .reset_index(drop=True)
+        )
+
+
+_default_results_store: Optional[ResultsStore] = None
+
+
+def get_results_store() -> ResultsStore:
+    """Returns the process-wide results store, creating it on first use"""
+    global _default_results_store
+    if _default_results_store is None:
+        _default_results_store = ResultsStore()
+    return _default_results_store
+
+
+def query_leaderboard(benchmark: str, test_type: Optional[str] = None) -> pd.DataFrame:
+    """Returns the leaderboard of a benchmark, e.g. `query_leaderboard("MMLU", "5-shot")`"""
+    return get_results_store().leaderboard(benchmark, test_type)
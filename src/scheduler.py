@@ -0,0 +1,114 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Callable, Collection, Optional
+
+import pandas as pd
+
+from logger import get_logger
+
+if TYPE_CHECKING:
+    from frontier import Frontier
+
+logger = get_logger(__name__)
+
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "4"))
+# How often a runner with nothing to claim checks the frontier again while
+# other runners still hold entries
+FRONTIER_POLL_SECONDS = float(os.getenv("FRONTIER_POLL_SECONDS", "5"))
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+METADATA_COLS = ["crawled_timestamp", "success", "cost"]
+
+CrawlFn = Callable[[str], Optional[float]]
+
+
+def pending_rows(sources_df: pd.DataFrame) -> pd.Index:
+    """Returns index of rows that have not been crawled yet"""
+    crawled = sources_df["crawled_timestamp"]
+    mask = crawled.isna() | (crawled.astype(str).str.strip() == "")
+    return sources_df.index[mask & sources_df["url"].notna()]
+
+
+def save_metadata(sources_df: pd.DataFrame, source_df_path: str) -> None:
+    """Writes the sources and their crawl metadata back to the sources CSV"""
+    try:
+        logger.info(f"Updating crawl metadata in {source_df_path}")
+        # Written next to the file and moved over it, so a reader, or another
+        # runner exporting at the same time, never sees a partial file
+        tmp_path = f"{source_df_path}.{os.getpid()}.tmp"
+        sources_df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, source_df_path)
+        logger.info("Successfully updated crawl metadata.")
+    except Exception as e:
+        logger.error(f"Failed to save updated results to {source_df_path}: {e}")
+        raise
+
+
+def crawl_frontier(
+    frontier: "Frontier",
+    crawl_fn: CrawlFn,
+    max_workers: int = CRAWL_WORKERS,
+    poll_seconds: float = FRONTIER_POLL_SECONDS,
+    urls: Optional[Collection[str]] = None,
+) -> int:
+    """
+    Crawls the frontier until it has no pending entries left.
+
+    Keeps up to `max_workers` documents in flight. Every finished crawl is
+    recorded in the frontier, which schedules the sources it found, so the crawl
+    grows one level at a time until the frontier's depth limit. Given `urls`,
+    only those entries are crawled and the ones they schedule are left pending.
+
+    Other runners can crawl the same frontier: the leases on the entries in
+    flight are renewed every third of the lease duration, and a runner with
+    nothing to claim keeps polling every `poll_seconds` until no runner holds
+    any entry, as their crawls can schedule new entries or give theirs back.
+
+    Returns the number of crawled entries.
+    """
+    if max_workers < 1:
+        raise ValueError(f"max_workers must be at least 1, got {max_workers}")
+
+    heartbeat = frontier.lease_seconds / 3
+    crawled = 0
+    succeeded = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        renewed = time.monotonic()
+        while True:
+            # Claiming takes the frontier's write lock, not worth it with no
+            # worker free
+            if len(running) < max_workers:
+                for entry in frontier.pop(max_workers - len(running), urls):
+                    logger.info(f"Crawling {entry.url} at depth {entry.depth}")
+                    running[executor.submit(crawl_fn, entry.url)] = entry
+            if not running:
+                if not frontier.has_work(urls):
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            done, _ = wait(
+                running,
+                timeout=min(heartbeat, poll_seconds),
+                return_when=FIRST_COMPLETED,
+            )
+            if time.monotonic() - renewed >= heartbeat:
+                frontier.renew([e for f, e in running.items() if f not in done])
+                renewed = time.monotonic()
+            for future in done:
+                entry = running.pop(future)
+                try:
+                    cost = future.result()
+                    success = True
+                    succeeded += 1
+                except Exception as e:
+                    logger.error(f"Failed to crawl {entry.url}: {e}")
+                    cost = None
+                    success = False
+                frontier.complete(entry, success, cost)
+                crawled += 1
+
+    logger.info(f"Crawled {succeeded}/{crawled} frontier entries successfully")
+    return crawled
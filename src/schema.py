@@ -0,0 +1,80 @@
+import pandas as pd
+import pandera as pa
+
+from pages import CELL_PATTERN
+
+REQUIRED_COLUMNS = ["name", "test_type", "source"]
+MISSING_VALUE = "-"
+# Every column that is not a required one holds the scores of a model
+MODEL_COLUMN_REGEX = rf"^(?!(?:{'|'.join(REQUIRED_COLUMNS)})$).*$"
+
+
+def is_cell(value: object) -> bool:
+    """Returns whether a value looks like a score cell, e.g. 86.8%, 161 or -"""
+    return bool(CELL_PATTERN.match(str(value).strip()))
+
+
+def _fill_missing(column: pd.Series) -> pd.Series:
+    # Empty CSV cells are read as NaN, the extraction format writes them as -
+    return column.where(column.notna(), MISSING_VALUE).astype(str).str.strip()
+
+
+_fill = pa.Parser(_fill_missing)
+
+BENCHMARK_SCHEMA = pa.DataFrameSchema(
+    {
+        "name": pa.Column(
+            str,
+            coerce=True,
+            checks=pa.Check(lambda s: s.str.strip() != "", name="non_empty"),
+        ),
+        "test_type": pa.Column(str, parsers=_fill, coerce=True),
+        "source": pa.Column(str, parsers=_fill, coerce=True),
+        MODEL_COLUMN_REGEX: pa.Column(
+            parsers=_fill,
+            checks=pa.Check(is_cell, element_wise=True, name="is_score"),
+            regex=True,
+        ),
+    },
+    checks=pa.Check(lambda df: len(df) > 0, name="has_rows"),
+    name="benchmark_table",
+)
+
+
+def benchmark_problems(df: pd.DataFrame) -> list[str]:
+    """
+    Validates a frame against BENCHMARK_SCHEMA, returns the problems found.
+
+    Checks the required `name`, `test_type` and `source` columns, that there is
+    at least one model column and row, and that every model cell is a number, a
+    percentage or the `-` placeholder for a missing value.
+    """
+    try:
+        BENCHMARK_SCHEMA.validate(df, lazy=True)
+    except pa.errors.SchemaErrors as e:
+        return _describe(e.failure_cases)
+    return []
+
+
+def _describe(failure_cases: pd.DataFrame) -> list[str]:
+    problems = []
+    missing = failure_cases.loc[
+        failure_cases["check"] == "column_in_dataframe", "failure_case"
+    ].tolist()
+    if missing:
+        problems.append(f"missing columns {missing}")
+    for (column, check), cases in failure_cases.groupby(
+        ["column", "check"], dropna=False, sort=False
+    ):
+        if check == "column_in_dataframe":
+            continue
+        if str(check).startswith("no_regex_column_match"):
+            problems.append("no model columns")
+        elif check == "has_rows":
+            problems.append("no rows")
+        elif check == "is_score":
+            problems.append(f"model column {column!r} does not hold scores")
+        else:
+            values = cases["failure_case"].head(3).tolist()
+            problems.append(f"column {column!r} failed {check}: {values}")
+    return problems
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Union
+
+from constants import benchmark_sources_path
+from logger import get_logger
+from urls import canonicalize_urls, paper_key
+
+# pandas is imported where it is used, so opening the store for counts and
+# lookups, e.g. from the CLI, does not load it
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = get_logger(__name__)
+
+SOURCES_DB_PATH = os.getenv(
+    "SOURCES_DB_PATH", str(Path(benchmark_sources_path).with_suffix(".db"))
+)
+
+SOURCE_COLUMNS = [
+    "name",
+    "url",
+    "origin_url",
+    "crawled_timestamp",
+    "added_timestamp",
+    "type",
+    "success",
+    "cost",
+]
+
+
+def _to_records(df: "pd.DataFrame") -> list[tuple]:
+    """
+    Converts a sources frame to rows of plain Python values for SQLite.
+
+    Each row ends with the paper key of its URL.
+    """
+    import pandas as pd
+
+    df = df.reindex(columns=SOURCE_COLUMNS)
+    df = df.astype(object).where(df.notna(), None)
+    for col in ("crawled_timestamp", "added_timestamp"):
+        df[col] = df[col].map(lambda v: str(v) if isinstance(v, pd.Timestamp) else v)
+    df["paper_key"] = canonicalize_urls(df["url"].fillna(""))["paper_key"]
+    return list(df.itertuples(index=False, name=None))
+
+
+class SourceStore:
+    """
+    SQLite store of benchmark sources with unique indexes on `url` and `paper_key`.
+
+    The paper key (see `urls.paper_key`) identifies arXiv and ACL Anthology
+    papers whatever link form they were cited with, so the same paper is stored
+    and crawled once.
+
+    Runs in WAL mode so readers do not block the writer, and every write is a
+    single transaction, so several crawl workers or processes can add sources
+    concurrently. The first time a store is opened it imports the existing
+    sources CSV, if any; `export_csv` writes the CSV format back out.
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, Path] = SOURCES_DB_PATH,
+        csv_path: Optional[Union[str, Path]] = benchmark_sources_path,
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                " id INTEGER PRIMARY KEY, name TEXT, url TEXT NOT NULL,"
+                " origin_url TEXT, crawled_timestamp TEXT, added_timestamp TEXT,"
+                " type TEXT, success INTEGER, cost REAL, paper_key TEXT)"
+            )
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS sources_url ON sources (url)"
+            )
+            self._migrate_paper_keys(conn)
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS sources_paper_key"
+                " ON sources (paper_key) WHERE paper_key IS NOT NULL"
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM sources").fetchone()
+
+        if count == 0 and csv_path is not None and Path(csv_path).is_file():
+            import pandas as pd
+
+            logger.info(f"Importing existing sources from {csv_path}")
+            self.add_sources(pd.read_csv(csv_path))
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _migrate_paper_keys(conn: sqlite3.Connection) -> None:
+        """Adds and fills the paper_key column of databases created without it"""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(sources)")]
+        if "paper_key" in columns:
+            return
+        logger.info("Adding paper keys to the sources database")
+        conn.execute("ALTER TABLE sources ADD COLUMN paper_key TEXT")
+        rows = conn.execute("SELECT id, url FROM sources ORDER BY id").fetchall()
+        if not rows:
+            return
+        # Duplicates of an already keyed paper keep a NULL key
+        seen = set()
+        for row_id, url in rows:
+            key = paper_key(url)
+            if key is not None and key not in seen:
+                seen.add(key)
+                conn.execute(
+                    "UPDATE sources SET paper_key = ? WHERE id = ?", (key, row_id)
+                )
+
+    def add_sources(self, source_df: "pd.DataFrame") -> int:
+        """
+        Inserts the sources whose URL or paper is not stored yet.
+
+        Returns the number of inserted rows.
+        """
+        columns = SOURCE_COLUMNS + ["paper_key"]
+        placeholders = ", ".join("?" for _ in columns)
+        with closing(self._connect()) as conn, conn:
+            before = conn.total_changes
+            conn.executemany(
+                f"INSERT OR IGNORE INTO sources ({', '.join(columns)})"
+                f" VALUES ({placeholders})",
+                _to_records(source_df),
+            )
+            return conn.total_changes - before
+
+    def has_url(self, url: str) -> bool:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT 1 FROM sources WHERE url = ?", (url,)).fetchone()
+        return row is not None
+
+    def has_paper(self, key: str) -> bool:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sources WHERE paper_key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM sources").fetchone()
+        return count
+
+    def read(self) -> "pd.DataFrame":
+        """Returns all stored sources in insertion order"""
+        import pandas as pd
+
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(SOURCE_COLUMNS)} FROM sources ORDER BY id", conn
+            )
+        df["success"] = df["success"].map(lambda v: None if pd.isna(v) else bool(v))
+        return df
+
+    def export_csv(self, csv_path: Union[str, Path] = benchmark_sources_path) -> None:
+        """Writes all stored sources in the benchmark_sources.csv format"""
+        df = self.read()
+        # Moved over the old file, so concurrent runners never leave it partial
+        tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_path)
+        logger.info(f"Exported {len(df)} sources to {csv_path}")
+
+
+_default_source_store: Optional[SourceStore] = None
+
+
+def get_source_store() -> SourceStore:
+    """Returns the process-wide source store, creating it on first use"""
+    global _default_source_store
+    if _default_source_store is None:
+        _default_source_store = SourceStore()
+    return _default_source_store
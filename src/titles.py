@@ -0,0 +1,308 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+from pypdf import PdfReader
+
+from constants import benchmark_sources_path
+from logger import get_logger
+from urls import ARXIV_PDF_URL, canonical_url
+
+logger = get_logger(__name__)
+
+TITLE_INDEX_PATH = os.getenv(
+    "TITLE_INDEX_PATH",
+    str(Path(benchmark_sources_path).with_name("titles.db")),
+)
+TITLE_MATCH_THRESHOLD = float(os.getenv("TITLE_MATCH_THRESHOLD", "0.8"))
+# Shortest truncated title ("Beyond the imitation game...") matched as a prefix
+TITLE_MIN_PREFIX_CHARS = 20
+
+# MinHash signatures of character shingles, split into LSH bands: titles with
+# a Jaccard similarity of 0.7 share a band with probability ~0.99
+SHINGLE_SIZE = 3
+LSH_BANDS = 16
+LSH_ROWS = 4
+NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+# Hashes and coefficients are below 2^31 so (a * x + b) fits in 64 bits
+MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+IMPORT_BATCH_SIZE = 10_000
+ELLIPSIS_PATTERN = re.compile(r"(?:\.\.\.|…)\s*$")
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+
+def normalize_title(title: str) -> str:
+    """Returns a title lowercased, without accents, punctuation or extra spaces"""
+    title = unicodedata.normalize("NFKD", title)
+    title = "".join(char for char in title if not unicodedata.combining(char))
+    return NON_WORD_PATTERN.sub(" ", title.lower()).strip()
+
+
+def title_hash(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+def shingles(normalized: str) -> set[str]:
+    """Returns the character n-grams of a normalized title"""
+    text = normalized.replace(" ", "")
+    return {text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def minhash(shingle_set: set[str]) -> np.ndarray:
+    """Returns the MinHash signature of a set of shingles"""
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest())
+            % MERSENNE_PRIME
+            for s in shingle_set
+        ),
+        dtype=np.uint64,
+        count=len(shingle_set),
+    )
+    products = _PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]
+    return (products % MERSENNE_PRIME).min(axis=1)
+
+
+def lsh_buckets(signature: np.ndarray) -> list[int]:
+    """Returns one signed 64-bit bucket id per LSH band of a signature"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS : (band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(
+            band.to_bytes(2, "big") + rows.tobytes(), digest_size=8
+        ).digest()
+        buckets.append(int.from_bytes(digest, signed=True))
+    return buckets
+
+
+def title_from_pdf(file_path: Union[str, Path]) -> Optional[str]:
+    """Returns the title of a paper from its metadata, or its first text line"""
+    return title_from_reader(PdfReader(file_path))
+
+
+def title_from_reader(
+    reader: PdfReader, first_page_text: Optional[str] = None
+) -> Optional[str]:
+    """Same as `title_from_pdf`, reusing the first page text if already extracted"""
+    title = (reader.metadata.title if reader.metadata else None) or ""
+    if len(normalize_title(title)) < TITLE_MIN_PREFIX_CHARS:
+        text = first_page_text
+        if text is None:
+            text = reader.pages[0].extract_text() if reader.pages else ""
+        lines = [line.strip() for line in (text or "").splitlines() if line.strip()]
+        title = lines[0] if lines else ""
+    return title if len(normalize_title(title)) >= TITLE_MIN_PREFIX_CHARS else None
+
+
+class TitleIndex:
+    """
+    Persistent index resolving paper titles to canonical URLs.
+
+    A title is first looked up by the hash of its normalized form. Titles cut
+    short with an ellipsis are matched on their prefix, and other near matches
+    (typos, punctuation, a word more or less) through MinHash LSH buckets of
+    character shingles, confirmed by their Jaccard similarity. Every lookup is a
+    few indexed SQLite queries.
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, Path] = TITLE_INDEX_PATH,
+        threshold: float = TITLE_MATCH_THRESHOLD,
+    ):
+        self.db_path = Path(db_path)
+        self.threshold = threshold
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS titles ("
+                " id INTEGER PRIMARY KEY, title_hash TEXT NOT NULL UNIQUE,"
+                " normalized TEXT NOT NULL, title TEXT NOT NULL, url TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS titles_normalized ON titles (normalized)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS title_buckets ("
+                " bucket INTEGER NOT NULL, title_id INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS title_buckets_bucket"
+                " ON title_buckets (bucket)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _reader(self) -> sqlite3.Connection:
+        # Lookups reuse one connection per thread, opening one costs more than
+        # the lookup itself
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def add_titles(self, entries: Iterable[tuple[str, str]]) -> int:
+        """
+        Adds (title, url) pairs, keeping the first URL seen for a title.
+
+        Returns the number of new titles.
+        """
+        added = 0
+        bucket_rows = []
+        with closing(self._connect()) as conn, conn:
+            for title, url in entries:
+                normalized = normalize_title(title)
+                if not normalized:
+                    continue
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO titles"
+                    " (title_hash, normalized, title, url) VALUES (?, ?, ?, ?)",
+                    (title_hash(normalized), normalized, title.strip(), url),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                added += 1
+                title_shingles = shingles(normalized)
+                if title_shingles:
+                    signature = minhash(title_shingles)
+                    bucket_rows += [
+                        (bucket, cursor.lastrowid) for bucket in lsh_buckets(signature)
+                    ]
+            conn.executemany("INSERT INTO title_buckets VALUES (?, ?)", bucket_rows)
+        return added
+
+    def add_pdf(self, file_path: Union[str, Path], url: str) -> bool:
+        """Indexes the title of a crawled paper, returns whether it was added"""
+        title = title_from_pdf(file_path)
+        if title is None:
+            logger.debug("No title found in %s", file_path)
+            return False
+        return self.add_titles([(title, canonical_url(url))]) == 1
+
+    def import_dump(self, dump_path: Union[str, Path]) -> int:
+        """
+        Imports an offline metadata dump.
+
+        Accepts JSON lines, such as the arXiv metadata snapshot, or a CSV file,
+        with a `title` and either a `url` or an arXiv `id` per record. Returns
+        the number of new titles.
+        """
+        added = 0
+        batch = []
+        for entry in _read_dump(Path(dump_path)):
+            batch.append(entry)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                added += self.add_titles(batch)
+                batch = []
+        added += self.add_titles(batch)
+        logger.info(f"Imported {added} new titles from {dump_path}")
+        return added
+
+    def resolve(self, title: str) -> Optional[str]:
+        """Returns the URL of the paper with the given title, or None"""
+        normalized = normalize_title(title)
+        if not normalized:
+            return None
+        conn = self._reader()
+        row = conn.execute(
+            "SELECT url FROM titles WHERE title_hash = ?",
+            (title_hash(normalized),),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+
+        is_truncated = ELLIPSIS_PATTERN.search(title) is not None
+        if is_truncated and len(normalized) >= TITLE_MIN_PREFIX_CHARS:
+            rows = conn.execute(
+                "SELECT url FROM titles WHERE normalized >= ? AND normalized < ?"
+                " LIMIT 2",
+                (normalized, normalized + "\U0010ffff"),
+            ).fetchall()
+            # Only an unambiguous prefix is a match
+            if len(rows) == 1:
+                return rows[0][0]
+
+        return self._resolve_fuzzy(conn, normalized)
+
+    def _resolve_fuzzy(self, conn: sqlite3.Connection, normalized: str):
+        query_shingles = shingles(normalized)
+        if not query_shingles:
+            return None
+        buckets = lsh_buckets(minhash(query_shingles))
+        candidates = conn.execute(
+            "SELECT DISTINCT t.normalized, t.url FROM title_buckets b"
+            " JOIN titles t ON t.id = b.title_id"
+            f" WHERE b.bucket IN ({', '.join('?' for _ in buckets)})",
+            buckets,
+        ).fetchall()
+        best_url, best_score = None, self.threshold
+        for candidate, url in candidates:
+            score = jaccard(query_shingles, shingles(candidate))
+            if score >= best_score:
+                best_url, best_score = url, score
+        return best_url
+
+    def is_empty(self) -> bool:
+        """Returns whether no title is indexed, without counting them all"""
+        return self._reader().execute("SELECT 1 FROM titles LIMIT 1").fetchone() is None
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM titles").fetchone()
+        return count
+
+
+def _read_dump(dump_path: Path) -> Iterator[tuple[str, str]]:
+    with open(dump_path, newline="", encoding="utf-8") as f:
+        if dump_path.suffix == ".csv":
+            records: Iterable[dict] = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            title = record.get("title")
+            if record.get("url"):
+                url = canonical_url(record["url"])
+            elif record.get("id"):
+                url = ARXIV_PDF_URL.format(record["id"])
+            else:
+                continue
+            if title:
+                # Titles in the arXiv snapshot are wrapped over several lines
+                yield " ".join(title.split()), url
+
+
+_default_title_index: Optional[TitleIndex] = None
+
+
+def get_title_index() -> TitleIndex:
+    """Returns the process-wide title index, creating it on first use"""
+    global _default_title_index
+    if _default_title_index is None:
+        _default_title_index = TitleIndex()
+    return _default_title_index
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        get_title_index().import_dump(path)
@@ -0,0 +1,128 @@
+import re
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+# arXiv abstract, PDF and bare links to new (2201.11903) or old style
+# (hep-th/9901001, math.GT/0309136) identifiers, with optional version and .pdf.
+# Arrow's RE2 kernels run these patterns too, so they have no lookarounds and
+# spell out ASCII digits, which is all RE2's \d matches
+ARXIV_URL_PATTERN = re.compile(
+    r"(?i)^https?://(?:www\.|export\.)?arxiv\.org/(?:abs/|pdf/)?"
+    r"(?P<id>[0-9]{4}\.[0-9]{4,5}|[a-z-]+(?:\.[a-z]{2})?/[0-9]{7})"
+    r"(?:v[0-9]+)?/?(?:\.pdf)?/?(?:[?#].*)?$"
+)
+# ACL Anthology links to old style (N19-1246) or new style (2020.acl-main.1)
+# identifiers, including the legacy aclweb.org/anthology mirror
+ACL_URL_PATTERN = re.compile(
+    r"(?i)^https?://(?:www\.)?(?:aclanthology\.org|aclweb\.org/anthology)/"
+    r"(?P<id>[a-z][0-9]{2}-[0-9]{4}|[0-9]{4}\.[a-z0-9-]+\.[0-9]+)"
+    r"(?:v[0-9]+)?/?(?:\.pdf)?/?(?:[?#].*)?$"
+)
+OLD_ACL_ID_PATTERN = re.compile(r"(?i)^[a-z][0-9]{2}-[0-9]{4}$")
+
+ARXIV_PDF_URL = "https://arxiv.org/pdf/{}.pdf"
+ACL_PDF_URL = "https://aclanthology.org/{}.pdf"
+
+
+def _acl_id(paper_id: str) -> str:
+    # Old style identifiers are written with an upper case venue letter
+    return paper_id.upper() if OLD_ACL_ID_PATTERN.match(paper_id) else paper_id
+
+
+def paper_key(url: str) -> Optional[str]:
+    """
+    Returns a stable key for the paper a URL points to, or None if unknown.
+
+    Every link form of the same paper maps to the same key: `arxiv:<id>` for
+    arXiv, without the version suffix, and `acl:<id>` for the ACL Anthology.
+    """
+    url = url.strip()
+    if match := ARXIV_URL_PATTERN.match(url):
+        return f"arxiv:{match['id'].lower()}"
+    if match := ACL_URL_PATTERN.match(url):
+        return f"acl:{_acl_id(match['id'])}"
+    return None
+
+
+def canonical_url(url: str) -> str:
+    """
+    Returns the canonical PDF URL of a paper link.
+
+    arXiv and ACL Anthology links are resolved to the PDF of the latest version,
+    other URLs are returned unchanged.
+    """
+    key = paper_key(url)
+    if key is None:
+        return url
+    source, paper_id = key.split(":", 1)
+    return (ARXIV_PDF_URL if source == "arxiv" else ACL_PDF_URL).format(paper_id)
+
+
+def string_array(values: "pd.Series") -> "pa.Array":
+    """
+    Converts a Series to an Arrow string array for Arrow's regex kernels.
+
+    Values that are not strings become nulls, which match no pattern.
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    values = values.astype(object)
+    if pd.api.types.infer_dtype(values, skipna=True) not in {"string", "empty"}:
+        values = values.where(values.map(lambda v: isinstance(v, str)), None)
+    return pa.array(values.to_numpy(), type=pa.string(), from_pandas=True)
+
+
+def _format_ids(template: str, ids: "pa.Array") -> "pa.Array":
+    import pyarrow.compute as pc
+
+    prefix, suffix = template.split("{}")
+    return pc.binary_join_element_wise(prefix, ids, suffix, "")
+
+
+def canonicalize_urls(urls: "pd.Series") -> "pd.DataFrame":
+    """
+    Vectorized canonical_url and paper_key over a Series of URL strings.
+
+    The link patterns run through Arrow's regex kernels over the whole column.
+    Returns a frame with the same index and `url` and `paper_key` columns.
+    """
+    # Imported here so the scalar helpers load without pandas, e.g. in the CLI
+    import pandas as pd
+    import pyarrow.compute as pc
+
+    urls = urls.astype(object)
+    # Arrow trims the same whitespace as str.strip
+    text = pc.utf8_trim_whitespace(string_array(urls))
+    arxiv_ids = pc.utf8_lower(
+        pc.struct_field(pc.extract_regex(text, ARXIV_URL_PATTERN.pattern), "id")
+    )
+    acl_ids = pc.struct_field(pc.extract_regex(text, ACL_URL_PATTERN.pattern), "id")
+    acl_ids = pc.if_else(
+        pc.match_substring_regex(acl_ids, OLD_ACL_ID_PATTERN.pattern),
+        pc.utf8_upper(acl_ids),
+        acl_ids,
+    )
+
+    # Joins are null where the identifier is, so arXiv wins over the ACL
+    keys = pc.coalesce(
+        pc.binary_join_element_wise("arxiv:", arxiv_ids, ""),
+        pc.binary_join_element_wise("acl:", acl_ids, ""),
+    )
+    canonical = pc.coalesce(
+        _format_ids(ARXIV_PDF_URL, arxiv_ids), _format_ids(ACL_PDF_URL, acl_ids)
+    )
+    canonical = pd.Series(
+        canonical.to_numpy(zero_copy_only=False), index=urls.index, dtype=object
+    )
+    return pd.DataFrame(
+        {
+            "url": canonical.where(canonical.notna(), urls),
+            "paper_key": pd.Series(
+                keys.to_numpy(zero_copy_only=False), index=urls.index, dtype=object
+            ),
+        }
+    )
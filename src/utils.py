@@ -1,19 +1,37 @@
 import base64
 import os
-import tempfile
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 from urllib.parse import urlparse
 
-import requests
+from cache import PdfCache, get_pdf_cache
+from downloader import get_downloader, partial_name
 
+# The API accepts requests of up to 32MB and base64 inflates files by 4/3, so
+# leave some headroom for the prompt and the rest of the request body
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", str(24 * 1024 * 1024 - 64 * 1024)))
 
-def download_file(url: str) -> Path:
+# Multiple of 3 so every chunk encodes to base64 without padding
+ENCODE_CHUNK_SIZE = 3 * 256 * 1024
+
+
+class FileTooLargeError(ValueError):
+    """Raised when a file is over the size accepted by the API"""
+
+
+def download_file(
+    url: str, cache: Optional[PdfCache] = None, refresh: bool = False
+) -> Path:
     """
-    Downloads a file from the given URL and saves it to a temporary directory.
+    Downloads a file from the given URL into the persistent PDF cache.
+
+    If the URL has been downloaded before and the file is still cached, the cached
+    file is returned without any network I/O.
 
     Args:
         url: The URL of the file to download
+        cache: Cache to use, defaults to the process-wide PDF cache
+        refresh: Whether to download the file again even if it is cached
 
     Returns:
         Path object pointing to the downloaded file
@@ -31,57 +49,87 @@ def download_file(url: str) -> Path:
     if not filename:
         raise ValueError(f"Could not extract filename from URL: {url}")
 
-    # Create temporary directory that persists after function ends
-    temp_dir = tempfile.mkdtemp()
+    # PdfCache has a length, an empty cache given explicitly is still used
+    cache = cache if cache is not None else get_pdf_cache()
+    cached_path = None if refresh else cache.get(url)
+    if cached_path is not None:
+        return cached_path
+
+    # Stream into a partial file in the cache, so an interrupted download is
+    # resumed by the next attempt instead of starting over
+    dest = cache.partial_dir / partial_name(url, filename)
+    return cache.put_file(url, filename, get_downloader().download(url, dest))
+
 
-    # Construct full path for downloaded file
-    file_path = Path(temp_dir) / filename
+def _check_encodable(file_path: Union[str, Path], max_bytes: Optional[int]) -> int:
+    """Validates a file for encoding and returns its size in bytes"""
+    # Convert string path to Path object if necessary
+    path = Path(file_path)
+
+    # Check if file exists
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
 
-    # Download the file with streaming to handle large files
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
+    # Check if path is a file
+    if not path.is_file():
+        raise ValueError(f"Path is not a file: {file_path}")
 
-    # Write the file in chunks
-    with open(file_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
+    # Check size before reading any bytes
+    size = path.stat().st_size
+    if max_bytes is not None and size > max_bytes:
+        raise FileTooLargeError(
+            f"File is {size} bytes, over the limit of {max_bytes} bytes: {file_path}"
+        )
 
-    return file_path
+    return size
 
 
-def encode_file(file_path: Union[str, Path]) -> str:
+def encode_file(
+    file_path: Union[str, Path],
+    max_bytes: Optional[int] = MAX_PDF_BYTES,
+    chunk_size: int = ENCODE_CHUNK_SIZE,
+) -> str:
     """
     Reads a file and encodes its contents as a base64 string for sending as an API request.
 
+    The file is read in chunks and encoded into a buffer sized up front, so peak
+    memory is about twice the size of the encoded output rather than holding the
+    raw file, the encoded bytes and the string at the same time. The SDK takes
+    the document as one string of its JSON request body, so the encoding cannot
+    be streamed into the request itself.
+
     Args:
         file_path: Path to the file to encode (string or Path object)
+        max_bytes: Refuse files larger than this, checked before reading the file
+        chunk_size: Number of bytes read per chunk, must be a multiple of 3
 
     Returns:
         Base64 encoded string of the file contents
 
     Raises:
         FileNotFoundError: If the file doesn't exist
+        FileTooLargeError: If the file is larger than `max_bytes`
         PermissionError: If the file can't be read due to permissions
         IOError: For other file reading errors
     """
-    # Convert string path to Path object if necessary
-    path = Path(file_path)
+    if chunk_size % 3:
+        raise ValueError(f"chunk_size must be a multiple of 3, got {chunk_size}")
 
-    # Check if file exists
-    if not path.exists():
-        raise FileNotFoundError(f"File not found: {file_path}")
-
-    # Check if path is a file
-    if not path.is_file():
-        raise ValueError(f"Path is not a file: {file_path}")
+    size = _check_encodable(file_path, max_bytes)
+    encoded = bytearray(4 * ((size + 2) // 3))
 
     try:
-        # Read and encode the file
-        with open(path, "rb") as file:
-            binary_data = file.read()
-            base64_encoded = base64.b64encode(binary_data)
-            return base64_encoded.decode("utf-8")
+        # Read and encode the file chunk by chunk, chunks that are multiples of
+        # 3 bytes encode without padding
+        offset = 0
+        with open(file_path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                encoded_chunk = base64.b64encode(chunk)
+                encoded[offset : offset + len(encoded_chunk)] = encoded_chunk
+                offset += len(encoded_chunk)
+        # The file may have changed size since it was checked
+        del encoded[offset:]
+        return encoded.decode("ascii")
 
     except PermissionError as e:
         raise PermissionError(f"Permission denied reading file: {file_path}") from e
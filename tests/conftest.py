@@ -0,0 +1,287 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import cache
+import downloader as downloader_module
+import metrics
+import preprocess
+import results
+import store
+import titles
+
+
+def message_body(
+    text: str,
+    input_tokens: int = 100,
+    output_tokens: int = 50,
+    stop_reason: str = "end_turn",
+) -> dict:
+    """Returns a Messages API response body with a single text block"""
+    return {
+        "id": "msg_fake",
+        "type": "message",
+        "role": "assistant",
+        "model": "claude-fake",
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+    }
+
+
+def sse_events(body: dict, chunk_size: int = 16) -> str:
+    """Returns a Messages API response body as a stream of server-sent events"""
+    text = body["content"][0]["text"]
+    start = {**body, "content": [], "stop_reason": None}
+    events = [
+        ("message_start", {"type": "message_start", "message": start}),
+        (
+            "content_block_start",
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            },
+        ),
+    ]
+    for i in range(0, len(text), chunk_size):
+        delta = {"type": "text_delta", "text": text[i : i + chunk_size]}
+        events.append(
+            (
+                "content_block_delta",
+                {"type": "content_block_delta", "index": 0, "delta": delta},
+            )
+        )
+    events += [
+        ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        (
+            "message_delta",
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": body["stop_reason"], "stop_sequence": None},
+                "usage": {"output_tokens": body["usage"]["output_tokens"]},
+            },
+        ),
+        ("message_stop", {"type": "message_stop"}),
+    ]
+    return "".join(
+        f"event: {name}\ndata: {json.dumps(data)}\n\n" for name, data in events
+    )
+
+
+class FakeAnthropicServer:
+    """
+    Local stand-in for the Anthropic Messages endpoint.
+
+    Scripted responses are queued as (status, headers, body) tuples and served in
+    order; once the queue is empty every request gets `default_text` back.
+
+    Also serves the Message Batches endpoints. The requests of a batch are
+    answered from the same queue when the batch is created, and a batch ends
+    after it has been polled `batch_polls` times.
+    """
+
+    def __init__(self, default_text: str = "name,test_type,source"):
+        self.default_text = default_text
+        self.scripted = []
+        self.requests = []
+        self.batches = {}
+        self.batch_polls = 1
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def enqueue(self, status: int, body: dict, headers: dict | None = None) -> None:
+        self.scripted.append((status, headers or {}, body))
+
+    def next_response(self, path: str, payload: dict) -> tuple[int, dict, dict]:
+        with self._lock:
+            self.requests.append((path, payload))
+            if self.scripted:
+                return self.scripted.pop(0)
+        return 200, {}, message_body(self.default_text)
+
+    def create_batch(self, payload: dict) -> dict:
+        results = []
+        for request in payload["requests"]:
+            status, _, body = self.next_response("batch", request["params"])
+            if status == 200:
+                result = {"type": "succeeded", "message": body}
+            else:
+                result = {"type": "errored", "error": body}
+            results.append({"custom_id": request["custom_id"], "result": result})
+        with self._lock:
+            batch_id = f"msgbatch_{len(self.batches)}"
+            self.batches[batch_id] = {"polls": self.batch_polls, "results": results}
+        return self.batch_body(batch_id)
+
+    def batch_body(self, batch_id: str, poll: bool = False) -> dict:
+        with self._lock:
+            batch = self.batches[batch_id]
+            if poll and batch["polls"] > 0:
+                batch["polls"] -= 1
+            ended = poll and batch["polls"] == 0
+        succeeded = sum(r["result"]["type"] == "succeeded" for r in batch["results"])
+        errored = len(batch["results"]) - succeeded
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else len(batch["results"]),
+                "succeeded": succeeded if ended else 0,
+                "errored": errored if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": "2025-01-09T15:40:25Z",
+            "expires_at": "2025-01-10T15:40:25Z",
+            "ended_at": "2025-01-09T15:45:25Z" if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": (
+                f"{self.base_url}/v1/messages/batches/{batch_id}/results"
+                if ended
+                else None
+            ),
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("content-length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.startswith("/v1/messages/batches"):
+                    self._send(200, {}, json.dumps(server.create_batch(payload)))
+                    return
+                status, headers, body = server.next_response(self.path, payload)
+                if payload.get("stream") and status == 200:
+                    self._send(status, headers, sse_events(body), "text/event-stream")
+                else:
+                    self._send(status, headers, json.dumps(body))
+
+            def do_GET(self):
+                batch_id, _, rest = (
+                    self.path.split("?")[0]
+                    .removeprefix("/v1/messages/batches/")
+                    .partition("/")
+                )
+                if rest == "results":
+                    results = server.batches[batch_id]["results"]
+                    lines = "\n".join(json.dumps(result) for result in results)
+                    self._send(200, {}, lines, "application/binary")
+                else:
+                    body = server.batch_body(batch_id, poll=True)
+                    self._send(200, {}, json.dumps(body))
+
+            def _send(self, status, headers, text, content_type="application/json"):
+                data = text.encode()
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def fake_anthropic():
+    server = FakeAnthropicServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+# Process-wide singletons as (module, global, factory of a per-test instance).
+# The per-test instances keep their files under the test's tmp_path, the
+# downloader never waits and preprocessing runs in the calling thread
+SINGLETONS = {
+    "pdf_cache": (
+        cache,
+        "_default_pdf_cache",
+        lambda tmp_path: cache.PdfCache(tmp_path / "pdf_cache"),
+    ),
+    "completion_cache": (
+        cache,
+        "_default_completion_cache",
+        lambda tmp_path: cache.CompletionCache(tmp_path / "completions.sqlite"),
+    ),
+    "source_store": (
+        store,
+        "_default_source_store",
+        lambda tmp_path: store.SourceStore(tmp_path / "sources.db", csv_path=None),
+    ),
+    "title_index": (
+        titles,
+        "_default_title_index",
+        lambda tmp_path: titles.TitleIndex(tmp_path / "titles.db"),
+    ),
+    "results_store": (
+        results,
+        "_default_results_store",
+        lambda tmp_path: results.ResultsStore(tmp_path / "results"),
+    ),
+    "metrics_recorder": (
+        metrics,
+        "_default_metrics",
+        lambda tmp_path: metrics.Metrics(tmp_path / "metrics.jsonl"),
+    ),
+    "downloader": (
+        downloader_module,
+        "_default_downloader",
+        lambda tmp_path: downloader_module.Downloader(
+            requests_per_minute=60_000, host_rpm={}, sleep=lambda seconds: None
+        ),
+    ),
+    "preprocessor": (
+        preprocess,
+        "_default_preprocessor",
+        lambda tmp_path: preprocess.Preprocessor(workers=0),
+    ),
+}
+
+
+@pytest.fixture(autouse=True)
+def singletons(tmp_path, monkeypatch) -> dict:
+    """Replaces every process-wide singleton with a per-test instance, by name"""
+    instances = {}
+    for name, (module, attribute, factory) in SINGLETONS.items():
+        instances[name] = factory(tmp_path)
+        monkeypatch.setattr(module, attribute, instances[name])
+    return instances
+
+
+def _singleton_fixture(name: str):
+    @pytest.fixture(name=name)
+    def fixture(singletons):
+        return singletons[name]
+
+    return fixture
+
+
+# A fixture per singleton, e.g. `source_store`, for the tests using it
+for _name in SINGLETONS:
+    globals()[_name] = _singleton_fixture(_name)
@@ -2,8 +2,9 @@ from io import StringIO
 
 import pandas as pd
 
-from app import get_sources
+from app import get_sources, is_valid_url, parse_source_url
 from constants import claude_pdf_url
+from titles import TitleIndex
 
 example_completion = """name,test_type,Claude 3 Opus,Claude 3 Sonnet,Claude 3 Haiku,GPT-4,GPT-3.5,Gemini 1.0 Ultra,Gemini 1.5 Pro,Gemini 1.0 Pro,source
     MMLU,5-shot,86.8%,79.0%,75.2%,86.4%,70.0%,83.7%,81.9%,71.8%,https://arxiv.org/abs/2201.11903
@@ -28,7 +29,7 @@ example_sources_csv = """name,url,origin_url,crawled_timestamp,added_timestamp,t
     HumanEval,https://arxiv.org/pdf/2107.03374.pdf,https://www-cdn.anthropic.com/de8ba9b01c9ab7cbabf5c33b80b7bbc618857627/Model_Card_Claude_3.pdf,,2025-01-09 10:54:17.495720,benchmark,,
     GPQA (Diamond),https://arxiv.org/pdf/2311.12022.pdf,https://www-cdn.anthropic.com/de8ba9b01c9ab7cbabf5c33b80b7bbc618857627/Model_Card_Claude_3.pdf,,2025-01-09 10:54:17.495720,benchmark,,
     MGSM,https://arxiv.org/pdf/2210.03057.pdf,https://www-cdn.anthropic.com/de8ba9b01c9ab7cbabf5c33b80b7bbc618857627/Model_Card_Claude_3.pdf,,2025-01-09 10:54:17.495720,benchmark,,
-    DROP,https://aclanthology.org/N19-1246/.pdf,https://www-cdn.anthropic.com/de8ba9b01c9ab7cbabf5c33b80b7bbc618857627/Model_Card_Claude_3.pdf,,2025-01-09 10:54:17.495720,benchmark,,
+    DROP,https://aclanthology.org/N19-1246.pdf,https://www-cdn.anthropic.com/de8ba9b01c9ab7cbabf5c33b80b7bbc618857627/Model_Card_Claude_3.pdf,,2025-01-09 10:54:17.495720,benchmark,,
     HellaSwag,https://arxiv.org/pdf/1905.07830.pdf,https://www-cdn.anthropic.com/de8ba9b01c9ab7cbabf5c33b80b7bbc618857627/Model_Card_Claude_3.pdf,,2025-01-09 10:54:17.495720,benchmark,,
     PubMedQA,https://arxiv.org/pdf/1909.06146.pdf,https://www-cdn.anthropic.com/de8ba9b01c9ab7cbabf5c33b80b7bbc618857627/Model_Card_Claude_3.pdf,,2025-01-09 10:54:17.495720,benchmark,,
     WinoGrande,https://arxiv.org/pdf/1907.10641.pdf,https://www-cdn.anthropic.com/de8ba9b01c9ab7cbabf5c33b80b7bbc618857627/Model_Card_Claude_3.pdf,,2025-01-09 10:54:17.495720,benchmark,,
@@ -69,5 +70,102 @@ def test_get_sources():
     )
 
 
+def test_get_sources_uses_an_empty_resolver_given(tmp_path, title_index):
+    title = "Beyond the imitation game"
+    title_index.add_titles([(title, "https://arxiv.org/abs/2206.04615")])
+    input_df = pd.DataFrame({"name": ["BIG-Bench"], "source": [title]})
+
+    empty = TitleIndex(tmp_path / "empty_titles.db")
+    assert empty.is_empty() and not title_index.is_empty()
+    assert get_sources(input_df, "benchmark", claude_pdf_url, resolver=empty).empty
+    assert len(get_sources(input_df, "benchmark", claude_pdf_url)) == 1
+
+
+def reference_get_sources(input_df, source_type, origin_url):
+    """Row-by-row implementation get_sources must stay equivalent to"""
+    df = input_df.copy().replace("-", None).dropna(subset="source")
+    df = df[df["source"].apply(is_valid_url)]
+    return pd.DataFrame(
+        {
+            "name": df["name"],
+            "url": df["source"].apply(parse_source_url),
+            "origin_url": origin_url,
+            "crawled_timestamp": None,
+            "added_timestamp": pd.Timestamp("2025-01-09"),
+            "type": source_type,
+            "success": None,
+            "cost": None,
+        }
+    ).reset_index(drop=True)
+
+
+def test_get_sources_matches_row_by_row_validation():
+    sources = [
+        "https://arxiv.org/abs/2201.11903",
+        "https://arxiv.org/pdf/2201.11903",
+        "https://arxiv.org/2201.11903",
+        "https://aclanthology.org/D17-1082",
+        "https://example.com/paper.pdf",
+        " https://example.com/padded",
+        "https:example.com/no-slashes",
+        "https://a b.com",
+        "https://example.com:99999/bad-port",
+        "http://300.1.1.1",
+        "https://xn--abc.com",
+        "https://www.xn--abc.com:8080/paper",
+        "HTTPS://EXAMPLE.COM/UPPER",
+        "https://example.com/trailing-newline\n",
+        "ht\ttps://example.com/tab",
+        "\thttps://example.com/leading-tab",
+        "Beyond the imitation game\n",
+        42,
+        "Beyond the imitation game",
+        "-",
+        None,
+        "https://example.com/" + "x" * 2100,
+    ]
+    names = [f"bench-{i}" for i in range(len(sources))]
+    names[4] = "-"
+    input_df = pd.DataFrame({"name": names, "test_type": "5-shot", "source": sources})
+
+    actual = get_sources(input_df, "benchmark", claude_pdf_url)
+    expected = reference_get_sources(input_df, "benchmark", claude_pdf_url)
+
+    cols = [col for col in expected.columns if col != "added_timestamp"]
+    pd.testing.assert_frame_equal(actual[cols], expected[cols])
+
+
 def test_get_pdf():
     """Test getting pdf URL for extraction."""
+
+
+def test_crawl_model_url_uses_cached_completion(
+    tmp_path, monkeypatch, source_store, results_store
+):
+    import app
+    import engines
+
+    pdf_path = tmp_path / "card.pdf"
+    pdf_path.write_bytes(b"%PDF-1 model card")
+    calls = []
+
+    def fake_completion(source_base64, on_text=None, model=None):
+        calls.append(source_base64)
+        if on_text is not None:
+            for i in range(0, len(example_completion), 50):
+                on_text(example_completion[i : i + 50])
+        return example_completion
+
+    monkeypatch.setattr(app.utils, "download_file", lambda url: pdf_path)
+    monkeypatch.setattr(engines, "get_completion", fake_completion)
+    monkeypatch.setattr(engines, "EXTRACTION_ENGINES", ["llm"])
+
+    app.crawl_model_url(claude_pdf_url)
+    app.crawl_model_url(claude_pdf_url)
+
+    assert len(calls) == 1
+    assert len(source_store) == 12
+    # Crawling the card again replaced its scores instead of adding them twice
+    mmlu = results_store.leaderboard("MMLU", "5-shot")
+    assert len(mmlu) == 8
+    assert mmlu.loc[0, "model"] == "Claude 3 Opus"
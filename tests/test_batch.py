@@ -0,0 +1,161 @@
+import pandas as pd
+import pytest
+from anthropic import Anthropic
+
+import app
+import batch
+import engines
+import llm
+import metrics
+from batch import BatchTimeoutError, extract_batch, wait_for_batch
+from cache import sha256_file
+from conftest import message_body
+from constants import MODEL_NAME
+from llm import prompt
+
+ERROR_BODY = {
+    "type": "error",
+    "error": {"type": "invalid_request_error", "message": "bad document"},
+}
+COMPLETION = (
+    "name,test_type,Model A,source\nMMLU,5-shot,86.8%,https://arxiv.org/abs/2009.03300"
+)
+
+MODEL_SOURCES_CSV = """name,url,origin_url,crawled_timestamp,added_timestamp,type,success,cost
+A,https://cards.com/a.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+B,https://cards.com/b.pdf,example.com,2025-01-10 13:47:39.871897,2025-01-09 15:40:25.588219,model,True,0.1
+C,https://cards.com/c.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+"""
+
+
+@pytest.fixture
+def client(fake_anthropic):
+    return Anthropic(api_key="test-key", base_url=fake_anthropic.base_url)
+
+
+@pytest.fixture
+def documents(tmp_path):
+    paths = {}
+    for name in ["a", "b", "c"]:
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(f"%PDF-1 {name}".encode())
+        paths[f"doc-{name}"] = path
+    return paths
+
+
+def test_extract_batch_packs_requests_and_maps_results(
+    fake_anthropic, client, documents, completion_cache
+):
+    fake_anthropic.batch_polls = 2
+    fake_anthropic.enqueue(200, message_body(COMPLETION))
+    fake_anthropic.enqueue(400, ERROR_BODY)
+    fake_anthropic.enqueue(200, message_body('not, a\n"csv'))
+
+    results = extract_batch(
+        documents, client=client, models=[MODEL_NAME], max_requests=2, poll_seconds=0
+    )
+
+    assert len(fake_anthropic.batches) == 2
+    assert results.completions == {"doc-a": COMPLETION, "doc-c": 'not, a\n"csv'}
+    assert results.errors == {"doc-b": "bad document"}
+    params = fake_anthropic.requests[0][1]
+    assert params["model"] == MODEL_NAME
+    assert params["messages"][0]["content"][0]["type"] == "document"
+    # Only completions that parse are cached
+    assert completion_cache.stats.misses == 3
+    rerun = extract_batch(documents, client=client, models=[MODEL_NAME], poll_seconds=0)
+    assert rerun.completions["doc-a"] == COMPLETION
+    assert len(fake_anthropic.batches) == 3
+    assert fake_anthropic.batches["msgbatch_2"]["results"][0]["custom_id"] == "doc-b"
+
+
+def test_extract_batch_splits_on_bytes(fake_anthropic, client, documents):
+    extract_batch(
+        documents,
+        client=client,
+        models=[MODEL_NAME],
+        max_bytes=batch.REQUEST_OVERHEAD_BYTES,
+        poll_seconds=0,
+    )
+
+    assert len(fake_anthropic.batches) == 3
+
+
+def test_extract_batch_escalates_through_the_route(
+    fake_anthropic, client, documents, completion_cache
+):
+    cheap, strong = "claude-cheap", "claude-strong"
+    # a is valid, b fails and c has no model column with the cheap model
+    fake_anthropic.enqueue(200, message_body(COMPLETION))
+    fake_anthropic.enqueue(400, ERROR_BODY)
+    fake_anthropic.enqueue(200, message_body("name,test_type,source\nMMLU,5-shot,-"))
+    fake_anthropic.enqueue(200, message_body(COMPLETION))
+    fake_anthropic.enqueue(200, message_body(COMPLETION))
+
+    results = extract_batch(
+        documents, client=client, models=[cheap, strong], poll_seconds=0
+    )
+
+    assert results.completions == {name: COMPLETION for name in documents}
+    assert results.errors == {}
+    assert [params["model"] for _, params in fake_anthropic.requests] == [
+        cheap,
+        cheap,
+        cheap,
+        strong,
+        strong,
+    ]
+    assert fake_anthropic.batches["msgbatch_1"]["results"][0]["custom_id"] == "doc-b"
+    # Completions are cached under the model that produced them
+    sha256 = {name: sha256_file(path) for name, path in documents.items()}
+    assert completion_cache.get(sha256["doc-a"], prompt, cheap) == COMPLETION
+    assert completion_cache.get(sha256["doc-a"], prompt, strong) is None
+    assert completion_cache.get(sha256["doc-c"], prompt, strong) == COMPLETION
+
+    # Only the failed cheap request of b is sent again, the cached cheap table
+    # of c escalates to the cached strong one without a request
+    rerun = extract_batch(
+        documents, client=client, models=[cheap, strong], poll_seconds=0
+    )
+    assert [params["model"] for _, params in fake_anthropic.requests[5:]] == [cheap]
+    assert rerun.completions == results.completions
+
+
+def test_wait_for_batch_times_out(fake_anthropic, client, documents):
+    fake_anthropic.batch_polls = 100
+    batch_id = batch.submit_batch(client, [batch.build_request("doc-a", "abc")])
+
+    with pytest.raises(BatchTimeoutError):
+        wait_for_batch(client, batch_id, poll_seconds=0, timeout=0)
+
+
+def test_crawl_batch(fake_anthropic, client, tmp_path, monkeypatch, source_store):
+    sources_path = tmp_path / "model_sources.csv"
+    sources_path.write_text(MODEL_SOURCES_CSV)
+    fake_anthropic.enqueue(200, message_body(COMPLETION))
+    fake_anthropic.enqueue(400, ERROR_BODY)
+
+    def fake_download(url):
+        path = tmp_path / url.rsplit("/", 1)[1]
+        path.write_bytes(f"%PDF-1 {url}".encode())
+        return path
+
+    monkeypatch.setattr(app.utils, "download_file", fake_download)
+    monkeypatch.setattr(llm, "_client", client)
+    monkeypatch.setattr(engines, "EXTRACTION_MODELS", [MODEL_NAME])
+    monkeypatch.setattr(app, "benchmark_sources_path", tmp_path / "sources.csv")
+    monkeypatch.setitem(metrics.MODEL_PRICES, MODEL_NAME, (3.0, 15.0))
+
+    app.crawl_batch(str(sources_path))
+
+    crawled = pd.read_csv(sources_path).set_index("name")
+    assert crawled["success"].tolist() == [True, True, False]
+    assert crawled["crawled_timestamp"].notna().all()
+    # 100 input and 50 output tokens at half the interactive price, B was
+    # crawled before and C failed
+    assert crawled["cost"].tolist()[:2] == pytest.approx([0.000525, 0.1])
+    assert pd.isna(crawled.at["C", "cost"])
+    assert source_store.read()["url"].tolist() == [
+        "https://arxiv.org/pdf/2009.03300.pdf"
+    ]
+    assert source_store.read()["origin_url"].tolist() == ["https://cards.com/a.pdf"]
@@ -0,0 +1,134 @@
+import pytest
+import responses
+
+from cache import CompletionCache, PdfCache, normalize_url, sha256_file
+from utils import download_file
+
+PDF_URL = "https://arxiv.org/pdf/2201.11903.pdf"
+
+
+@pytest.fixture
+def mock_responses():
+    with responses.RequestsMock() as rsps:
+        yield rsps
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("HTTPS://ArXiv.org/pdf/1.pdf", "https://arxiv.org/pdf/1.pdf"),
+        ("https://arxiv.org:443/pdf/1.pdf#page=2", "https://arxiv.org/pdf/1.pdf"),
+        ("http://example.com:8080/a?b=2&a=1", "http://example.com:8080/a?a=1&b=2"),
+        ("https://example.com", "https://example.com/"),
+    ],
+)
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_download_is_served_from_cache(mock_responses, pdf_cache):
+    mock_responses.add(responses.GET, PDF_URL, body=b"%PDF-1 content", status=200)
+
+    first = download_file(PDF_URL)
+    # Same document under an equivalent URL, must not touch the network again
+    second = download_file("https://ARXIV.org/pdf/2201.11903.pdf#page=3")
+
+    assert first == second
+    assert first.name == "2201.11903.pdf"
+    assert first.read_bytes() == b"%PDF-1 content"
+    assert first.parent.name == sha256_file(first)
+    assert len(mock_responses.calls) == 1
+    assert (pdf_cache.stats.hits, pdf_cache.stats.misses) == (1, 1)
+
+
+def test_paper_links_share_a_cache_entry(mock_responses, pdf_cache):
+    mock_responses.add(responses.GET, PDF_URL, body=b"%PDF-1 content", status=200)
+
+    first = download_file(PDF_URL)
+    second = download_file("https://arxiv.org/pdf/2201.11903v2.pdf")
+
+    assert first == second
+    assert len(mock_responses.calls) == 1
+
+
+def test_same_content_is_stored_once(tmp_path):
+    cache = PdfCache(tmp_path)
+
+    first = cache.put_stream("https://a.com/x.pdf", "x.pdf", [b"same"])
+    second = cache.put_stream("https://b.com/y.pdf", "y.pdf", [b"same"])
+
+    assert first == second
+    assert cache.size_bytes() == 4
+    assert cache.get("https://b.com/y.pdf") == first
+
+
+def test_removed_file_is_a_miss(tmp_path):
+    cache = PdfCache(tmp_path)
+    path = cache.put_stream("https://a.com/x.pdf", "x.pdf", [b"content"])
+    path.unlink()
+
+    assert cache.get("https://a.com/x.pdf") is None
+    assert cache.stats.misses == 1
+    assert cache.size_bytes() == 0
+
+
+def test_lru_eviction(tmp_path):
+    cache = PdfCache(tmp_path, max_bytes=10)
+
+    a = cache.put_stream("https://a.com/a.pdf", "a.pdf", [b"aaaa"])
+    cache.put_stream("https://a.com/b.pdf", "b.pdf", [b"bbbb"])
+    # Touch a so that b becomes the least recently used file
+    assert cache.get("https://a.com/a.pdf") == a
+    cache.put_stream("https://a.com/c.pdf", "c.pdf", [b"cccc"])
+
+    assert cache.get("https://a.com/b.pdf") is None
+    assert cache.get("https://a.com/a.pdf") == a
+    assert cache.get("https://a.com/c.pdf") is not None
+    assert cache.stats.evictions == 1
+    assert cache.size_bytes() == 8
+
+
+def test_failed_download_is_not_cached(tmp_path):
+    cache = PdfCache(tmp_path)
+
+    def broken_stream():
+        yield b"partial"
+        raise ConnectionError("stalled")
+
+    with pytest.raises(ConnectionError):
+        cache.put_stream("https://a.com/x.pdf", "x.pdf", broken_stream())
+
+    assert cache.get("https://a.com/x.pdf") is None
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+def test_completion_cache_key(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    cache.put("doc", "prompt v1", "model-a", "name,test_type,source")
+
+    assert cache.get("doc", "prompt v1", "model-a") == "name,test_type,source"
+    assert cache.get("doc", "prompt v2", "model-a") is None
+    assert cache.get("doc", "prompt v1", "model-b") is None
+    assert cache.get("other", "prompt v1", "model-a") is None
+    assert (cache.stats.hits, cache.stats.misses) == (1, 3)
+
+
+def test_completion_cache_purge_stale(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    cache.put("doc", "prompt v1", "model-a", "old prompt")
+    cache.put("doc", "prompt v2", "model-a", "current")
+    cache.put("doc", "prompt v2", "model-b", "old model")
+
+    assert cache.purge_stale("prompt v2", "model-a") == 2
+    assert cache.get("doc", "prompt v2", "model-a") == "current"
+    assert cache.get("doc", "prompt v1", "model-a") is None
+
+
+def test_completion_cache_purge_keeps_route_models(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    cache.put("doc", "prompt", "cheap", "cheap")
+    cache.put("doc", "prompt", "strong", "strong")
+    cache.put("doc", "prompt", "retired", "retired")
+
+    assert cache.purge_stale("prompt", ["cheap", "strong"]) == 1
+    assert cache.get("doc", "prompt", "cheap") == "cheap"
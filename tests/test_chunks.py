@@ -0,0 +1,142 @@
+import base64
+import threading
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+import chunks
+import engines
+from chunks import merge_tables, page_windows, plan_windows
+from engines import ExtractionError, extract_benchmarks
+
+
+def blank_pdf(path, pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=72, height=72)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+def test_page_windows_overlap_and_cover_every_page():
+    assert page_windows(10, 4, 1) == [[0, 1, 2, 3], [3, 4, 5, 6], [6, 7, 8, 9]]
+    assert page_windows(3, 4, 1) == [[0, 1, 2]]
+    assert page_windows(0, 4, 1) == []
+
+    with pytest.raises(ValueError):
+        page_windows(10, 4, 4)
+
+
+def test_plan_windows(tmp_path):
+    short = blank_pdf(tmp_path / "short.pdf", 5)
+    long = blank_pdf(tmp_path / "long.pdf", 12)
+
+    assert plan_windows(short, min_pages=10, window=4, overlap=1) is None
+    assert plan_windows(long, min_pages=10, window=5, overlap=1) == [
+        [0, 1, 2, 3, 4],
+        [4, 5, 6, 7, 8],
+        [8, 9, 10, 11],
+    ]
+
+    # Over the size limit, windows shrink so each fits in a request
+    size = short.stat().st_size
+    windows = plan_windows(
+        short, min_pages=10, window=4, overlap=1, max_bytes=size // 2
+    )
+    assert windows is not None
+    assert max(len(w) for w in windows) <= 2
+    assert sorted({p for w in windows for p in w}) == list(range(5))
+
+
+def test_merge_tables_dedups_rows_and_reconciles_models():
+    first = pd.DataFrame(
+        {
+            "name": ["MMLU", "GSM8K"],
+            "test_type": ["5-shot", "8-shot"],
+            "Claude 3 Opus": ["86.8%", "95%"],
+            "source": ["-", "-"],
+        }
+    )
+    # The overlapping window repeats GSM8K with another spelling of the model
+    # and finds its source in the references
+    second = pd.DataFrame(
+        {
+            "Name": ["gsm8k", "MATH"],
+            "test_type": ["8-shot", None],
+            "claude 3  opus": ["-", "61%"],
+            "GPT-4": ["92%", "52.9%"],
+            "source": ["https://arxiv.org/abs/2110.14168", "-"],
+        }
+    )
+
+    merged = merge_tables([first, second])
+
+    assert list(merged.columns) == [
+        "name",
+        "test_type",
+        "Claude 3 Opus",
+        "GPT-4",
+        "source",
+    ]
+    assert merged["name"].tolist() == ["MMLU", "GSM8K", "MATH"]
+    assert merged["Claude 3 Opus"].tolist() == ["86.8%", "95%", "61%"]
+    assert merged["GPT-4"].tolist() == ["-", "92%", "52.9%"]
+    assert merged["source"].tolist() == ["-", "https://arxiv.org/abs/2110.14168", "-"]
+    assert engines.validate_benchmark_frame(merged) == []
+
+
+def test_llm_engine_extracts_long_documents_in_windows(tmp_path, monkeypatch):
+    pdf_path = blank_pdf(tmp_path / "report.pdf", 12)
+    completions = {
+        5: "name,test_type,Model A,source\nMMLU,5-shot,86.8%,-\nMATH,4-shot,61%,-",
+        4: (
+            "name,test_type,Model A,source\n"
+            "MATH,4-shot,61%,https://arxiv.org/abs/2103.03874"
+        ),
+    }
+    window_pages = []
+    lock = threading.Lock()
+
+    def fake_completion(source_base64, on_text=None, model=None):
+        pages = len(PdfReader(BytesIO(base64.b64decode(source_base64))).pages)
+        with lock:
+            window_pages.append(pages)
+        # Both five-page windows read the table, the last one its references
+        return completions.get(pages, "No benchmark table on these pages.")
+
+    monkeypatch.setattr(engines, "get_completion", fake_completion)
+    monkeypatch.setattr(engines, "EXTRACTION_ENGINES", ["llm"])
+    monkeypatch.setattr(engines, "EXTRACTION_MODELS", ["claude-test"])
+    monkeypatch.setattr(engines, "PAGE_LOCATOR_ENABLED", False)
+    monkeypatch.setattr(chunks, "CHUNK_MIN_PAGES", 10)
+    monkeypatch.setattr(chunks, "CHUNK_WINDOW_PAGES", 5)
+    monkeypatch.setattr(chunks, "CHUNK_OVERLAP_PAGES", 1)
+
+    result = extract_benchmarks(pdf_path)
+
+    assert sorted(window_pages) == [4, 5, 5]
+    assert result["name"].tolist() == ["MMLU", "MATH"]
+    assert result["source"].tolist() == ["-", "https://arxiv.org/abs/2103.03874"]
+
+    # The merged table is cached like a single completion
+    window_pages.clear()
+    extract_benchmarks(pdf_path)
+    assert window_pages == []
+
+
+def test_chunked_extraction_fails_without_any_table(tmp_path, monkeypatch):
+    pdf_path = blank_pdf(tmp_path / "report.pdf", 12)
+
+    monkeypatch.setattr(
+        engines, "get_completion", lambda *args, **kwargs: "No table here."
+    )
+    monkeypatch.setattr(engines, "EXTRACTION_ENGINES", ["llm"])
+    monkeypatch.setattr(engines, "EXTRACTION_MODELS", ["claude-test"])
+    monkeypatch.setattr(engines, "PAGE_LOCATOR_ENABLED", False)
+    monkeypatch.setattr(chunks, "CHUNK_MIN_PAGES", 10)
+
+    with pytest.raises(ExtractionError, match="No table found"):
+        extract_benchmarks(pdf_path)
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+import cli
+
+# Import time of the CLI, measured around 40 ms, well below the ~1.2 s of
+# importing app with pandas, pydantic and the Anthropic SDK
+STARTUP_BUDGET_MS = 150
+HEAVY_MODULES = {"pandas", "numpy", "pyarrow", "pydantic", "anthropic", "tabula"}
+
+MODEL_SOURCES_CSV = """name,url,origin_url,crawled_timestamp,added_timestamp,type,success,cost
+A,https://cards.com/a.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+B,https://cards.com/b.pdf,example.com,2025-01-10 13:47:39.871897,2025-01-09 15:40:25.588219,model,True,0.1
+C,,example.com,,2025-01-09 15:40:25.588219,model,,
+"""
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    return subprocess.run(
+        [sys.executable, *args], capture_output=True, text=True, env=env, check=True
+    )
+
+
+def test_import_time_budget():
+    result = run_python("-X", "importtime", "-c", "import cli")
+
+    imported = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        imported[name.strip()] = int(cumulative)
+    assert not {name.split(".")[0] for name in imported} & HEAVY_MODULES
+    assert imported["cli"] / 1000 < STARTUP_BUDGET_MS
+
+
+def test_status_does_not_load_heavy_modules(tmp_path, source_store):
+    sources_path = tmp_path / "model_sources.csv"
+    sources_path.write_text(MODEL_SOURCES_CSV)
+    source_store.add_sources(
+        pd.DataFrame({"name": ["MMLU"], "url": ["https://arxiv.org/abs/2009.03300"]})
+    )
+
+    result = run_python(
+        "-c",
+        "import sys, cli; cli.main(sys.argv[1:]);"
+        f" print(sorted(set(sys.modules) & {HEAVY_MODULES!r}))",
+        "status",
+        str(sources_path),
+        "--db",
+        str(source_store.db_path),
+    )
+
+    lines = result.stdout.splitlines()
+    assert lines[0] == f"1 pending rows in {sources_path}"
+    assert lines[1] == f"1 sources in {source_store.db_path}"
+    assert lines[-1] == "[]"
+
+
+def test_export_results(tmp_path, results_store):
+    results_store.append(
+        pd.DataFrame({"name": ["MMLU"], "test_type": ["5-shot"], "A": ["86.8%"]}),
+        "https://example.com/card.pdf",
+    )
+    output = tmp_path / "results.csv"
+
+    assert cli.main(["export", "results", "-o", str(output)]) == 0
+
+    exported = pd.read_csv(output)
+    assert exported[["benchmark", "model", "unit"]].values.tolist() == [
+        ["MMLU", "A", "%"]
+    ]
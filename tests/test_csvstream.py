@@ -0,0 +1,33 @@
+from csvstream import CsvRowStream
+
+TABLE = (
+    "name,test_type,Model A,source\n"
+    'MMLU,5-shot,86.8%,"Measuring massive\nmultitask language understanding"\n'
+    "MATH,4-shot,61%,https://arxiv.org/abs/2103.03874\n"
+    "DROP,F1 Score,83.1,-"
+)
+
+
+def test_rows_are_returned_as_they_complete():
+    stream = CsvRowStream()
+    completed = []
+    for i in range(0, len(TABLE), 7):
+        completed.append(stream.feed(TABLE[i : i + 7]))
+    completed.append(stream.close())
+
+    rows = [row for chunk in completed for row in chunk]
+    assert stream.header == ["name", "test_type", "Model A", "source"]
+    assert [row[0] for row in rows] == ["MMLU", "MATH", "DROP"]
+    assert rows[0][3] == "Measuring massive\nmultitask language understanding"
+    # Rows are available before the end of the text
+    math_row = ["MATH", "4-shot", "61%", "https://arxiv.org/abs/2103.03874"]
+    assert completed.index([math_row]) < len(completed) - 1
+
+
+def test_skips_code_fences_blank_lines_and_malformed_rows():
+    stream = CsvRowStream()
+    rows = stream.feed("```csv\nname,source\n\nMMLU,-\nbroken\n```\n")
+
+    frame = stream.to_frame(rows)
+
+    assert frame.to_dict("records") == [{"name": "MMLU", "source": "-"}]
@@ -0,0 +1,205 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from downloader import CHUNK_SIZE, Downloader
+from utils import download_file
+
+BODY = bytes(range(256)) * 1024
+
+
+class PdfServer:
+    """
+    Local file server honouring `Range` and `If-Range` requests.
+
+    The first `drop_after` responses stop after `drop_bytes` bytes of the body,
+    as if the connection was lost, and the first `fail` responses are 503s.
+    """
+
+    def __init__(self, body: bytes = BODY, etag: str = '"v1"'):
+        self.body = body
+        self.etag = etag
+        self.drop_after = 0
+        self.drop_bytes = 2 * CHUNK_SIZE
+        self.fail = 0
+        self.delay = 0.0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append(dict(self.headers))
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    self.respond()
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def respond(self):
+                time.sleep(server.delay)
+                if self.path.startswith("/missing"):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if server.fail:
+                    server.fail -= 1
+                    self.send_response(503)
+                    self.send_header("Retry-After", "7")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                start = 0
+                range_header = self.headers.get("Range")
+                if range_header and self.headers.get("If-Range") == server.etag:
+                    start = int(range_header.removeprefix("bytes=").rstrip("-"))
+                body = server.body[start:]
+                self.send_response(206 if start else 200)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(body)))
+                if start:
+                    end = len(server.body) - 1
+                    self.send_header(
+                        "Content-Range", f"bytes {start}-{end}/{len(server.body)}"
+                    )
+                self.end_headers()
+                if server.drop_after:
+                    server.drop_after -= 1
+                    self.wfile.write(body[: server.drop_bytes])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.httpd.server_address[1]
+
+    def url(self, path: str = "/paper.pdf", host: str = "127.0.0.1") -> str:
+        return f"http://{host}:{self.port}{path}"
+
+
+@pytest.fixture
+def pdf_server():
+    server = PdfServer()
+    thread = threading.Thread(
+        target=server.httpd.serve_forever, args=(0.05,), daemon=True
+    )
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def test_interrupted_download_resumes_with_range(pdf_server, pdf_cache):
+    pdf_server.drop_after = 1
+
+    path = download_file(pdf_server.url())
+
+    assert path.read_bytes() == BODY
+    assert len(pdf_server.requests) == 2
+    assert "Range" not in pdf_server.requests[0]
+    assert pdf_server.requests[1]["Range"] == f"bytes={pdf_server.drop_bytes}-"
+    assert pdf_server.requests[1]["If-Range"] == '"v1"'
+    assert list(pdf_cache.partial_dir.iterdir()) == []
+
+
+def test_partial_download_survives_a_failed_run(pdf_server, tmp_path):
+    pdf_server.drop_after = 1
+    dest = tmp_path / "paper.pdf"
+
+    with pytest.raises(requests.RequestException):
+        Downloader(max_retries=0).download(pdf_server.url(), dest)
+    assert (tmp_path / "paper.pdf.part").stat().st_size == pdf_server.drop_bytes
+
+    # The file changed on the server meanwhile, so it is fetched from the start
+    pdf_server.body = BODY[::-1]
+    pdf_server.etag = '"v2"'
+    Downloader(sleep=lambda seconds: None).download(pdf_server.url(), dest)
+
+    assert dest.read_bytes() == BODY[::-1]
+    assert len(pdf_server.requests) == 2
+    assert pdf_server.requests[1]["If-Range"] == '"v1"'
+
+
+def test_retries_honour_retry_after(pdf_server, tmp_path):
+    pdf_server.fail = 2
+    delays = []
+    downloader = Downloader(requests_per_minute=60_000, sleep=delays.append)
+
+    path = downloader.download(pdf_server.url(), tmp_path / "paper.pdf")
+
+    assert path.read_bytes() == BODY
+    assert delays == [7.0, 7.0]
+
+
+def test_missing_file_is_not_retried(pdf_server, tmp_path):
+    delays = []
+    downloader = Downloader(requests_per_minute=60_000, sleep=delays.append)
+
+    with pytest.raises(requests.HTTPError):
+        downloader.download(pdf_server.url("/missing.pdf"), tmp_path / "missing.pdf")
+
+    assert len(pdf_server.requests) == 1
+    assert delays == []
+
+
+def test_gives_up_after_max_retries(pdf_server, tmp_path):
+    pdf_server.fail = 10
+    delays = []
+    downloader = Downloader(
+        max_retries=2, requests_per_minute=60_000, sleep=delays.append
+    )
+
+    with pytest.raises(requests.HTTPError):
+        downloader.download(pdf_server.url(), tmp_path / "paper.pdf")
+
+    assert len(pdf_server.requests) == 3
+    assert len(delays) == 2
+
+
+def test_per_host_concurrency_and_sessions(pdf_server, tmp_path):
+    pdf_server.delay = 0.05
+    downloader = Downloader(per_host=1, requests_per_minute=60_000)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paths = list(
+            pool.map(
+                lambda i: downloader.download(pdf_server.url(), tmp_path / f"{i}.pdf"),
+                range(4),
+            )
+        )
+
+    assert all(path.read_bytes() == BODY for path in paths)
+    assert pdf_server.max_in_flight == 1
+    assert downloader.session(pdf_server.url()) is downloader.session(
+        pdf_server.url("/other.pdf")
+    )
+    assert downloader.session(pdf_server.url()) is not downloader.session(
+        pdf_server.url(host="localhost")
+    )
+
+
+def test_requests_to_a_host_are_spaced(pdf_server, tmp_path):
+    downloader = Downloader(requests_per_minute=600)
+
+    start = time.monotonic()
+    for i in range(3):
+        downloader.download(pdf_server.url(), tmp_path / f"{i}.pdf")
+
+    # One request every 0.1s, the first one without waiting
+    assert time.monotonic() - start >= 0.2
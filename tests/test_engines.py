@@ -0,0 +1,268 @@
+from io import StringIO
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import engines
+import metrics
+from engines import (
+    ExtractionEngine,
+    ExtractionError,
+    extract_benchmarks,
+    normalize_table,
+    validate_benchmark_frame,
+)
+
+VALID_FRAME = pd.DataFrame(
+    {
+        "name": ["MMLU", "MATH"],
+        "test_type": ["5-shot", "4-shot"],
+        "Claude 3 Opus": ["86.8%", "61%"],
+        "GPT-4": ["86.4%", "-"],
+        "source": ["https://arxiv.org/abs/2009.03300", "-"],
+    }
+)
+
+
+class FakeEngine(ExtractionEngine):
+    def __init__(self, name, result=None, error=None, available=True):
+        self.name = name
+        self.result = result
+        self.error = error
+        self.available = available
+        self.calls = 0
+
+    def is_available(self):
+        return self.available
+
+    def extract(self, file_path):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def test_normalize_table_with_test_type_column():
+    raw = pd.DataFrame(
+        {
+            "Unnamed: 0": ["MMLU", "MATH", None],
+            "Unnamed: 1": ["5-shot", "4-shot", None],
+            "Claude 3\rOpus": ["86.8%", "61%", None],
+            "GPT-4": ["86.4%", "—", None],
+        }
+    )
+
+    result = normalize_table(raw)
+
+    assert list(result.columns) == [
+        "name",
+        "test_type",
+        "Claude 3 Opus",
+        "GPT-4",
+        "source",
+    ]
+    assert result["test_type"].tolist() == ["5-shot", "4-shot"]
+    assert result["GPT-4"].tolist() == ["86.4%", "-"]
+    assert result["source"].tolist() == ["-", "-"]
+    assert validate_benchmark_frame(result) == []
+
+
+def test_normalize_table_with_test_type_in_name():
+    raw = pd.DataFrame(
+        {"Benchmark": ["MMLU (5-shot)", "DROP"], "Claude 3 Opus": ["86.8%", "83.1"]}
+    )
+
+    result = normalize_table(raw)
+
+    assert result["name"].tolist() == ["MMLU", "DROP"]
+    assert result["test_type"].tolist() == ["5-shot", "-"]
+
+
+def test_normalize_table_cites_references():
+    raw = pd.DataFrame(
+        {
+            "Benchmark": ["MMLU [12] (5-shot)", "GSM8K [4, 5]", "DROP", "MATH [9]"],
+            "Claude 3 Opus": ["86.8%", "95%", "83.1", "61%"],
+        }
+    )
+    references = {12: "https://arxiv.org/abs/2009.03300", 4: "https://a.com/gsm8k"}
+
+    result = normalize_table(raw, references)
+
+    assert result["name"].tolist() == ["MMLU", "GSM8K", "DROP", "MATH"]
+    assert result["test_type"].tolist() == ["5-shot", "-", "-", "-"]
+    assert result["source"].tolist() == [
+        "https://arxiv.org/abs/2009.03300",
+        "https://a.com/gsm8k",
+        "-",
+        "-",
+    ]
+
+
+def test_tabula_table_without_sources_escalates(monkeypatch):
+    raw = pd.DataFrame({"Benchmark": ["MMLU", "DROP"], "A": ["86.8%", "83.1"]})
+    llm = FakeEngine("fake-llm", result=VALID_FRAME)
+    tabula = engines.TabulaEngine(tables=[raw], references={})
+    monkeypatch.setattr(engines, "tabula_available", lambda: True)
+
+    assert extract_benchmarks("doc.pdf", [tabula, llm]) is VALID_FRAME
+    assert llm.calls == 1
+
+    # Trading the sources for no network call
+    monkeypatch.setattr(engines, "TABULA_REQUIRE_SOURCES", False)
+    result = extract_benchmarks("doc.pdf", [tabula, llm])
+    assert result["source"].tolist() == ["-", "-"]
+    assert llm.calls == 1
+
+
+def test_validate_benchmark_frame():
+    assert validate_benchmark_frame(VALID_FRAME) == []
+
+    problems = validate_benchmark_frame(VALID_FRAME.drop(columns=["test_type"]))
+    assert problems == ["missing columns ['test_type']"]
+
+    prose = VALID_FRAME.assign(**{"GPT-4": ["see text", "not reported"]})
+    assert validate_benchmark_frame(prose) == [
+        "model column 'GPT-4' does not hold scores"
+    ]
+
+
+def test_local_engine_hit_skips_llm():
+    local = FakeEngine("local", result=VALID_FRAME)
+    llm = FakeEngine("fake-llm", result=VALID_FRAME)
+
+    result = extract_benchmarks("doc.pdf", [local, llm])
+
+    assert result is VALID_FRAME
+    assert (local.calls, llm.calls) == (1, 0)
+    assert engines.engine_hits["local"] >= 1
+
+
+def test_invalid_local_result_escalates():
+    local = FakeEngine("local", result=VALID_FRAME.drop(columns=["source"]))
+    llm = FakeEngine("fake-llm", result=VALID_FRAME)
+
+    assert extract_benchmarks("doc.pdf", [local, llm]) is VALID_FRAME
+    assert (local.calls, llm.calls) == (1, 1)
+
+
+def test_failing_and_unavailable_engines_escalate():
+    unavailable = FakeEngine("unavailable", available=False)
+    failing = FakeEngine("failing", error=ExtractionError("no table"))
+    llm = FakeEngine("fake-llm", result=VALID_FRAME)
+
+    assert extract_benchmarks("doc.pdf", [unavailable, failing, llm]) is VALID_FRAME
+    assert unavailable.calls == 0
+
+
+def test_last_engine_error_is_raised():
+    llm = FakeEngine("fake-llm", error=RuntimeError("API down"))
+
+    with pytest.raises(RuntimeError, match="API down"):
+        extract_benchmarks("doc.pdf", [llm])
+
+
+def test_llm_engine_streams_rows(tmp_path, monkeypatch):
+    completion = "name,test_type,Model A,source\nMMLU,5-shot,86.8%,-\nMATH,4-shot,61%,-"
+    pdf_path = tmp_path / "card.pdf"
+    pdf_path.write_bytes(b"%PDF-1 model card")
+    streamed = []
+
+    def fake_completion(source_base64, on_text=None, model=None):
+        for i in range(0, len(completion), 5):
+            on_text(completion[i : i + 5])
+        return completion
+
+    monkeypatch.setattr(engines, "get_completion", fake_completion)
+    monkeypatch.setattr(engines, "EXTRACTION_ENGINES", ["llm"])
+    monkeypatch.setattr(engines, "EXTRACTION_MODELS", ["claude-test"])
+
+    result = extract_benchmarks(pdf_path, on_rows=streamed.append)
+
+    assert [frame["name"].tolist() for frame in streamed] == [["MMLU"], ["MATH"]]
+    assert result["name"].tolist() == ["MMLU", "MATH"]
+
+
+def test_schema_fills_missing_cells_and_rejects_prose():
+    completion = (
+        "name,test_type,Model A,Model B,source\nMMLU,5-shot,86.8%,,-\nGSM8K,,95,(0.5),"
+    )
+
+    assert validate_benchmark_frame(pd.read_csv(StringIO(completion))) == []
+
+    invalid = VALID_FRAME.assign(**{"GPT-4": ["86.4%", "86.4 (5-shot)"]})
+    invalid.loc[0, "name"] = " "
+    assert validate_benchmark_frame(invalid) == [
+        "column 'name' failed non_empty: [' ']",
+        "model column 'GPT-4' does not hold scores",
+    ]
+    assert validate_benchmark_frame(VALID_FRAME[["name", "test_type", "source"]]) == [
+        "no model columns"
+    ]
+
+
+def test_cheap_model_escalates_on_invalid_table(
+    tmp_path, monkeypatch, metrics_recorder
+):
+    pdf_path = tmp_path / "card.pdf"
+    pdf_path.write_bytes(b"%PDF-1 model card")
+    completions = {
+        "claude-3-5-haiku-test": "name,test_type,Model A,source\nMMLU,5-shot,see text,-",
+        "claude-3-5-sonnet-test": "name,test_type,Model A,source\nMMLU,5-shot,86.8%,-",
+    }
+    models = []
+
+    def fake_completion(source_base64, on_text=None, model=None):
+        models.append(model)
+        usage = SimpleNamespace(input_tokens=1000, output_tokens=100)
+        metrics.get_metrics().record_usage(usage, model)
+        return completions[model]
+
+    monkeypatch.setattr(engines, "get_completion", fake_completion)
+    monkeypatch.setattr(engines, "EXTRACTION_ENGINES", ["llm"])
+    monkeypatch.setattr(engines, "EXTRACTION_MODELS", list(completions))
+
+    result = extract_benchmarks(pdf_path)
+
+    assert result["Model A"].tolist() == ["86.8%"]
+    assert models == list(completions)
+    cheap = metrics_recorder.routes["llm:claude-3-5-haiku-test"]
+    strong = metrics_recorder.routes["llm:claude-3-5-sonnet-test"]
+    assert (cheap.attempts, cheap.successes) == (1, 0)
+    assert (strong.attempts, strong.successes) == (1, 1)
+    assert cheap.cost == pytest.approx(0.0012)
+    assert strong.cost == pytest.approx(0.0045)
+    assert (
+        'extraction_route_successes_total{route="llm:claude-3-5-sonnet-test"} 1'
+        in metrics_recorder.to_prometheus()
+    )
+
+    # Both completions are cached, the cheap one still escalates without a call
+    models.clear()
+    extract_benchmarks(pdf_path)
+    assert models == []
+
+
+def test_only_the_last_model_streams_rows(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "card.pdf"
+    pdf_path.write_bytes(b"%PDF-1 model card")
+    completions = {
+        "claude-cheap": "name,test_type,Model A,source\nMMLU,5-shot,see text,x.org",
+        "claude-strong": "name,test_type,Model A,source\nMMLU,5-shot,86.8%,-",
+    }
+    streamed = []
+
+    def fake_completion(source_base64, on_text=None, model=None):
+        if on_text is not None:
+            on_text(completions[model])
+        return completions[model]
+
+    monkeypatch.setattr(engines, "get_completion", fake_completion)
+    monkeypatch.setattr(engines, "EXTRACTION_ENGINES", ["llm"])
+    monkeypatch.setattr(engines, "EXTRACTION_MODELS", list(completions))
+
+    extract_benchmarks(pdf_path, on_rows=streamed.append)
+
+    # The rejected table of the cheap model is never streamed
+    assert [frame["Model A"].tolist() for frame in streamed] == [["86.8%"]]
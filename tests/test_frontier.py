@@ -0,0 +1,207 @@
+import multiprocessing
+import time
+from io import StringIO
+
+import pandas as pd
+import pytest
+
+from frontier import DONE, FAILED, IN_PROGRESS, PENDING, Frontier
+from scheduler import crawl_frontier
+from store import SourceStore
+
+MODEL_SOURCES_CSV = """name,url,origin_url,crawled_timestamp,added_timestamp,type,success,cost
+A,https://cards.com/a.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+B,https://cards.com/b.pdf,example.com,2025-01-10 13:47:39.871897,2025-01-09 15:40:25.588219,model,True,0.1
+C,https://other.com/c.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+"""
+
+
+def sources_df(urls, origin):
+    return pd.DataFrame(
+        {
+            "name": [f"bench-{i}" for i in range(len(urls))],
+            "url": urls,
+            "origin_url": origin,
+            "crawled_timestamp": None,
+            "added_timestamp": pd.Timestamp("2025-01-09 15:40:25.588219"),
+            "type": "benchmark",
+            "success": None,
+            "cost": None,
+        }
+    )
+
+
+@pytest.fixture
+def frontier(source_store):
+    return Frontier(source_store, max_depth=2, per_domain=1)
+
+
+def test_seed_skips_crawled_rows_and_schedules_once(frontier):
+    model_sources = pd.read_csv(StringIO(MODEL_SOURCES_CSV))
+
+    assert frontier.seed(model_sources) == 3
+    assert frontier.seed(model_sources) == 0
+    assert not frontier.add("https://cards.com/a.pdf")
+    assert frontier.counts() == {PENDING: 2, DONE: 1}
+
+
+def test_add_deduplicates_papers(frontier):
+    assert frontier.add("https://arxiv.org/pdf/2201.11903.pdf", depth=1)
+    assert not frontier.add("https://arxiv.org/abs/2201.11903v2", depth=1)
+
+
+def test_pop_orders_by_priority_and_limits_domains(frontier):
+    frontier.add("https://cards.com/deep.pdf", depth=2)
+    frontier.add("https://cards.com/a.pdf")
+    frontier.add("https://cards.com/b.pdf")
+    frontier.add("https://other.com/c.pdf", priority=0.5)
+
+    first = frontier.pop(3)
+    # One entry per domain is allowed in progress
+    assert [e.url for e in first] == [
+        "https://cards.com/a.pdf",
+        "https://other.com/c.pdf",
+    ]
+    assert frontier.pop(3) == []
+
+    frontier.complete(first[0], success=True)
+    assert [e.url for e in frontier.pop(3)] == ["https://cards.com/b.pdf"]
+
+
+def test_depth_limit(frontier):
+    assert not frontier.add("https://cards.com/too-deep.pdf", depth=3)
+
+
+def test_restart_requeues_entries_in_progress(frontier, source_store):
+    frontier.add("https://cards.com/a.pdf")
+    assert len(frontier.pop(1)) == 1
+
+    restarted = Frontier(source_store)
+
+    assert [e.url for e in restarted.pop(1)] == ["https://cards.com/a.pdf"]
+
+
+def test_expired_lease_is_handed_to_another_runner(source_store):
+    crashed = Frontier(source_store, runner_id="crashed", lease_seconds=0.05)
+    other = Frontier(source_store, runner_id="other")
+    crashed.add("https://cards.com/a.pdf")
+
+    (entry,) = crashed.pop(1)
+    assert other.pop(1) == []
+
+    time.sleep(0.1)
+    (claimed,) = other.pop(1)
+    assert claimed.url == entry.url
+
+    # The late outcome of the runner that lost the lease is dropped
+    crashed.complete(entry, success=False)
+    assert other.counts() == {IN_PROGRESS: 1}
+    other.complete(claimed, success=True)
+    assert other.counts() == {DONE: 1}
+
+
+def test_renewed_lease_is_kept(source_store):
+    runner = Frontier(source_store, runner_id="runner", lease_seconds=0.2)
+    other = Frontier(source_store, runner_id="other")
+    runner.add("https://cards.com/a.pdf")
+
+    entries = runner.pop(1)
+    time.sleep(0.15)
+    assert runner.renew(entries) == 1
+    time.sleep(0.1)
+
+    assert other.pop(1) == []
+    assert other.renew(entries) == 0
+
+
+def test_busy_crawl_does_not_claim(source_store, monkeypatch):
+    frontier = Frontier(source_store, per_domain=100)
+    for i in range(2):
+        frontier.add(f"https://cards.com/{i}.pdf")
+    claims = []
+    pop = frontier.pop
+    monkeypatch.setattr(
+        frontier, "pop", lambda n, urls=None: claims.append(n) or pop(n, urls)
+    )
+
+    # The crawl outlasts several polls while its only worker is busy
+    crawl_frontier(
+        frontier, lambda url: time.sleep(0.3), max_workers=1, poll_seconds=0.05
+    )
+
+    assert 0 not in claims
+    assert frontier.counts() == {DONE: 2}
+
+
+def _run_crawler(db_path, runner_id):
+    frontier = Frontier(
+        SourceStore(db_path, csv_path=None), per_domain=100, runner_id=runner_id
+    )
+    crawled = []
+
+    def fake_crawl(url):
+        crawled.append(url)
+        time.sleep(0.01)
+        return 0.0
+
+    crawl_frontier(frontier, fake_crawl, max_workers=2, poll_seconds=0.05)
+    return crawled
+
+
+def test_runner_processes_share_the_frontier(source_store):
+    frontier = Frontier(source_store)
+    urls = [f"https://cards{i % 3}.com/{i}.pdf" for i in range(30)]
+    for url in urls:
+        frontier.add(url)
+
+    with multiprocessing.get_context("spawn").Pool(3) as pool:
+        results = pool.starmap(
+            _run_crawler,
+            [(source_store.db_path, f"runner-{i}") for i in range(3)],
+        )
+
+    crawled = [url for result in results for url in result]
+    # Every entry is claimed by exactly one runner
+    assert sorted(crawled) == sorted(urls)
+    assert frontier.counts() == {DONE: 30}
+
+
+def test_crawl_frontier_follows_sources(frontier, source_store, tmp_path):
+    model_sources_path = tmp_path / "model_sources.csv"
+    model_sources_path.write_text(MODEL_SOURCES_CSV)
+    found = {
+        "https://cards.com/a.pdf": ["https://arxiv.org/pdf/2201.11903.pdf"],
+        "https://other.com/c.pdf": ["https://arxiv.org/pdf/2201.11903.pdf"],
+        "https://arxiv.org/pdf/2201.11903.pdf": ["https://papers.com/ref.pdf"],
+        "https://papers.com/ref.pdf": ["https://papers.com/too-deep.pdf"],
+    }
+    crawled = []
+
+    def fake_crawl(url):
+        crawled.append(url)
+        if url == "https://other.com/c.pdf":
+            raise RuntimeError("broken PDF")
+        source_store.add_sources(sources_df(found.get(url, []), origin=url))
+        return 0.25
+
+    frontier.seed(pd.read_csv(model_sources_path))
+    frontier.discover()
+
+    assert crawl_frontier(frontier, fake_crawl, max_workers=2) == 4
+    assert sorted(crawled) == [
+        "https://arxiv.org/pdf/2201.11903.pdf",
+        "https://cards.com/a.pdf",
+        "https://other.com/c.pdf",
+        "https://papers.com/ref.pdf",
+    ]
+    assert frontier.counts() == {DONE: 4, FAILED: 1}
+
+    stored = source_store.read().set_index("url")
+    assert stored.at["https://papers.com/ref.pdf", "success"]
+    assert pd.isna(stored.at["https://papers.com/too-deep.pdf", "crawled_timestamp"])
+
+    frontier.export_metadata(model_sources_path)
+    model_sources = pd.read_csv(model_sources_path).set_index("name")
+    assert model_sources["success"].tolist() == [True, True, False]
+    assert model_sources.at["A", "cost"] == 0.25
+    assert model_sources.at["B", "cost"] == 0.1
@@ -0,0 +1,131 @@
+import pytest
+from anthropic import Anthropic, BadRequestError, RateLimitError
+
+import metrics
+from conftest import message_body
+from constants import MODEL_NAME
+from llm import build_messages, get_completion
+from ratelimit import RateLimiter
+
+ERROR_BODY = {"type": "error", "error": {"type": "rate_limit_error", "message": "x"}}
+
+
+@pytest.fixture
+def limiter():
+    return RateLimiter(requests_per_minute=1000, input_tokens_per_minute=1_000_000)
+
+
+def test_build_messages():
+    messages = build_messages("abc")
+    document, text = messages[0]["content"]
+    assert document["source"]["data"] == "abc"
+    assert text["type"] == "text"
+
+
+@pytest.fixture
+def sync_client(fake_anthropic):
+    return Anthropic(
+        api_key="test-key", base_url=fake_anthropic.base_url, max_retries=0
+    )
+
+
+def test_get_completion_streams_text(fake_anthropic, sync_client):
+    fake_anthropic.enqueue(200, message_body("name,test_type,source\nMMLU,5-shot,-"))
+    deltas = []
+
+    completion = get_completion("abc", client=sync_client, on_text=deltas.append)
+
+    assert completion == "name,test_type,source\nMMLU,5-shot,-"
+    assert len(deltas) > 1
+    assert fake_anthropic.requests[0][1]["stream"] is True
+
+
+def test_get_completion_continues_after_max_tokens(fake_anthropic, sync_client):
+    fake_anthropic.enqueue(
+        200, message_body("name,source\nMMLU,https://ar\n", stop_reason="max_tokens")
+    )
+    fake_anthropic.enqueue(200, message_body("xiv.org/abs/2009.03300\nMATH,-"))
+
+    completion = get_completion("abc", client=sync_client)
+
+    assert completion == "name,source\nMMLU,https://arxiv.org/abs/2009.03300\nMATH,-"
+    continuation = fake_anthropic.requests[1][1]["messages"]
+    assert continuation[-1] == {
+        "role": "assistant",
+        "content": "name,source\nMMLU,https://ar",
+    }
+
+
+def test_get_completion_gives_up_after_max_continuations(fake_anthropic, sync_client):
+    for _ in range(2):
+        fake_anthropic.enqueue(200, message_body("a,b\n", stop_reason="max_tokens"))
+
+    completion = get_completion("abc", client=sync_client, max_continuations=1)
+
+    assert completion == "a,ba,b\n"
+    assert len(fake_anthropic.requests) == 2
+
+
+def test_get_completion_retries_through_limiter(fake_anthropic, sync_client):
+    limiter = RateLimiter(requests_per_minute=1000, input_tokens_per_minute=10_000)
+    fake_anthropic.enqueue(429, ERROR_BODY, headers={"retry-after-ms": "10"})
+    fake_anthropic.enqueue(200, message_body("name,test_type,source"))
+
+    completion = get_completion("abc", client=sync_client, limiter=limiter)
+
+    assert completion == "name,test_type,source"
+    assert len(fake_anthropic.requests) == 2
+    # The rejected request's tokens were given back, only the answered one's
+    # 100 reported input tokens are spent
+    assert limiter.input_tokens.try_acquire(9_800) == 0
+
+
+def test_get_completion_records_usage(
+    fake_anthropic, sync_client, metrics_recorder, monkeypatch
+):
+    monkeypatch.setitem(metrics.MODEL_PRICES, MODEL_NAME, (3.0, 15.0))
+    fake_anthropic.enqueue(
+        200, message_body("a,b\n", output_tokens=2048, stop_reason="max_tokens")
+    )
+    fake_anthropic.enqueue(200, message_body("1,2", input_tokens=1000))
+
+    with metrics_recorder.crawl("https://example.com/a.pdf") as crawl:
+        with metrics_recorder.span("completion") as span:
+            get_completion("abc", client=sync_client)
+
+    assert (span.input_tokens, span.output_tokens) == (1100, 2098)
+    assert crawl.cost == pytest.approx((1100 * 3.0 + 2098 * 15.0) / 1_000_000)
+    assert metrics_recorder.stages["completion"].cost == pytest.approx(crawl.cost)
+
+
+@pytest.mark.parametrize("status", [429, 529])
+def test_retries_on_rate_limit_and_overload(
+    fake_anthropic, sync_client, limiter, status
+):
+    fake_anthropic.enqueue(status, ERROR_BODY, headers={"retry-after": "0"})
+    fake_anthropic.enqueue(status, ERROR_BODY, headers={"retry-after-ms": "10"})
+    fake_anthropic.enqueue(200, message_body("ok"))
+
+    completion = get_completion("abc", client=sync_client, limiter=limiter)
+
+    assert completion == "ok"
+    assert len(fake_anthropic.requests) == 3
+
+
+def test_gives_up_after_max_retries(fake_anthropic, sync_client, limiter):
+    for _ in range(3):
+        fake_anthropic.enqueue(429, ERROR_BODY, headers={"retry-after": "0"})
+
+    with pytest.raises(RateLimitError):
+        get_completion("abc", client=sync_client, limiter=limiter, max_retries=2)
+
+    assert len(fake_anthropic.requests) == 3
+
+
+def test_does_not_retry_bad_request(fake_anthropic, sync_client, limiter):
+    fake_anthropic.enqueue(400, ERROR_BODY)
+
+    with pytest.raises(BadRequestError):
+        get_completion("abc", client=sync_client, limiter=limiter)
+
+    assert len(fake_anthropic.requests) == 1
@@ -0,0 +1,80 @@
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+import logger as logger_module
+from logger import SAMPLED, _LazyQueueHandler, configure_logging, flush_logging
+
+
+@pytest.fixture
+def stream():
+    stream = io.StringIO()
+    yield stream
+    configure_logging()
+
+
+def test_json_lines(stream):
+    configure_logging("info", "json", stream)
+    log = logging.getLogger("test.json")
+
+    log.info("Crawled %s", "https://example.com/a.pdf", extra={"cost": 0.5})
+    log.debug("Not written at info level")
+    try:
+        raise ValueError("bad")
+    except ValueError:
+        log.exception("Failed")
+    flush_logging()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(lines) == 2
+    assert lines[0]["message"] == "Crawled https://example.com/a.pdf"
+    assert lines[0]["level"] == "INFO"
+    assert lines[0]["logger"] == "test.json"
+    assert lines[0]["cost"] == 0.5
+    assert "ValueError: bad" in lines[1]["exception"]
+
+
+def test_messages_are_formatted_on_the_listener_thread(stream, monkeypatch):
+    configure_logging("debug", "text", stream)
+    # Only through the queue handler, not the capture handlers pytest adds
+    log = logging.getLogger("test.lazy")
+    monkeypatch.setattr(log, "propagate", False)
+    monkeypatch.setattr(log, "handlers", [logger_module._queue_handler])
+    formatted_on = []
+
+    class Arg:
+        def __str__(self):
+            formatted_on.append(threading.current_thread())
+            return "arg"
+
+    log.debug("Value: %s", Arg())
+    flush_logging()
+
+    assert "Value: arg" in stream.getvalue()
+    assert formatted_on and formatted_on[0] is not threading.current_thread()
+
+
+def test_sampling_only_drops_sampled_events(stream):
+    configure_logging("debug", "json", stream, sample_rate=0.0)
+    log = logging.getLogger("test.sampling")
+
+    for i in range(10):
+        log.debug("Row %d", i, extra=SAMPLED)
+    log.debug("Summary")
+    flush_logging()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == ["Summary"]
+
+
+def test_configure_replaces_previous_handler(stream):
+    configure_logging("info", "json", stream)
+    configure_logging("info", "json", stream)
+
+    handlers = [
+        h for h in logging.getLogger().handlers if isinstance(h, _LazyQueueHandler)
+    ]
+    assert len(handlers) == 1
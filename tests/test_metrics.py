@@ -0,0 +1,115 @@
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import Metrics, model_prices, usage_cost
+
+
+def usage(input_tokens, output_tokens, **cache_tokens):
+    return SimpleNamespace(
+        input_tokens=input_tokens, output_tokens=output_tokens, **cache_tokens
+    )
+
+
+def test_usage_cost():
+    assert model_prices("claude-3-5-sonnet-20241022") == (3.0, 15.0)
+    assert model_prices("claude-3-5-haiku-latest") == (0.8, 4.0)
+    assert model_prices("unknown-model") is None
+
+    model = "claude-3-5-sonnet-20241022"
+    assert usage_cost(usage(1000, 100), model) == pytest.approx(0.0045)
+    assert usage_cost(usage(1000, 100), model, batch=True) == pytest.approx(0.00225)
+    cached = usage(0, 0, cache_creation_input_tokens=1000, cache_read_input_tokens=1000)
+    assert usage_cost(cached, model) == pytest.approx(0.00375 + 0.0003)
+    assert usage_cost(usage(1000, 100), "unknown-model") is None
+
+
+def test_spans_are_recorded_per_stage(tmp_path):
+    metrics = Metrics(tmp_path / "metrics.jsonl")
+    model = "claude-3-haiku-20240307"
+
+    with metrics.crawl("https://example.com/a.pdf") as crawl:
+        with metrics.span("download") as span:
+            span.bytes = 1024
+        with metrics.span("completion"):
+            metrics.record_usage(usage(4000, 400), model)
+        with pytest.raises(ValueError), metrics.span("parse"):
+            raise ValueError("not a csv")
+
+    assert crawl.cost == pytest.approx(0.0015)
+    records = [json.loads(line) for line in (tmp_path / "metrics.jsonl").open()]
+    assert [r["stage"] for r in records] == ["download", "completion", "parse"]
+    assert {r["url"] for r in records} == {"https://example.com/a.pdf"}
+    assert records[0]["bytes"] == 1024
+    assert records[1]["input_tokens"] == 4000
+    assert records[2]["error"] == "ValueError"
+    assert metrics.stages["parse"].errors == 1
+
+
+def test_unpriced_usage_makes_crawl_cost_unknown():
+    metrics = Metrics(None)
+
+    with metrics.crawl("https://example.com/a.pdf") as crawl:
+        metrics.record_usage(usage(10, 10), "unknown-model")
+
+    assert crawl.cost is None
+    assert metrics.stages["usage"].input_tokens == 10
+
+
+class SlowUsage:
+    """Usage whose token counts yield to other threads while being read"""
+
+    output_tokens = 1
+
+    @property
+    def input_tokens(self):
+        # `total += usage.input_tokens` reads the total before this, so an
+        # unguarded update loses those made by other threads meanwhile
+        time.sleep(0.0005)
+        return 1
+
+
+def test_usage_from_concurrent_windows_adds_up():
+    metrics = Metrics(None)
+    model = "claude-3-haiku-20240307"
+
+    def request_window():
+        for _ in range(20):
+            metrics.record_usage(SlowUsage(), model)
+
+    with metrics.crawl("https://example.com/a.pdf") as crawl:
+        with metrics.route(model) as attempt, metrics.span("completion") as span:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [
+                    executor.submit(copy_context().run, request_window)
+                    for _ in range(4)
+                ]
+                for future in futures:
+                    future.result()
+
+    assert crawl.input_tokens == attempt.input_tokens == span.input_tokens == 80
+    assert metrics.routes[model].input_tokens == 80
+    assert metrics.stages["completion"].input_tokens == 80
+
+
+def test_prometheus_endpoint():
+    metrics = Metrics(None)
+    with metrics.span("download") as span:
+        span.bytes = 2048
+
+    server = metrics.serve(port=0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+
+    assert "# TYPE crawl_stage_bytes_total counter" in text
+    assert 'crawl_stage_bytes_total{stage="download"} 2048' in text
+    assert 'crawl_stage_spans_total{stage="download"} 1' in text
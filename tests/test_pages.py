@@ -0,0 +1,78 @@
+from pathlib import Path
+
+from pypdf import PdfReader
+
+from pages import (
+    is_reference_page,
+    locate_table_pages,
+    read_references,
+    reference_urls,
+    slice_pdf,
+    table_score,
+)
+
+TEST_FILE_PATH = Path(__file__).parent / "test_data" / "claude_modelcard_excerpt.pdf"
+
+
+def test_table_score():
+    table = "MMLU 5-shot 86.8% 79.0% 75.2% 86.4% 70.0% 83.7% 81.9% 71.8% — —"
+    prose = "We protect the security of the environment of our models " * 5
+
+    assert table_score(table) > 0.5
+    assert table_score(prose) == 0.0
+
+
+def test_is_reference_page():
+    references = "\n".join(f"[{i}] A. Author, “A Paper.” 2023." for i in range(6))
+    assert is_reference_page(references)
+    assert not is_reference_page("See [1] and [2] for details.")
+
+
+def test_reference_urls():
+    entries = [f"[{i}] A. Author, “A Paper.” 2023." for i in range(1, 5)]
+    entries[0] += "\nhttps://arxiv.org/abs/2009.03300."
+    entries[1] += " arXiv preprint arXiv:2110.14168"
+    entries[2] += " In (https://aclanthology.org/D17-1082)"
+    page = "\n".join(entries + ["[5] B. Author, a book."])
+
+    assert reference_urls([page, "See [1] for details."]) == {
+        1: "https://arxiv.org/abs/2009.03300",
+        2: "https://arxiv.org/abs/2110.14168",
+        3: "https://aclanthology.org/D17-1082",
+    }
+
+
+def test_read_references():
+    references = read_references(TEST_FILE_PATH)
+
+    assert references[24] == "https://arxiv.org/abs/2110.14168"
+    assert references[30] == "https://aclanthology.org/D17-1082"
+
+
+def test_locate_table_pages():
+    selection = locate_table_pages(TEST_FILE_PATH)
+
+    assert selection.total_pages == 9
+    assert selection.table_pages == [2, 3, 4]
+    assert selection.reference_pages == [5, 6, 7, 8]
+    assert selection.pages == [2, 3, 4, 5, 6, 7, 8]
+    assert not selection.is_full_document
+    assert selection.tokens_saved > 0
+
+
+def test_locate_table_pages_falls_back_to_full_document():
+    selection = locate_table_pages(TEST_FILE_PATH, min_score=2.0)
+
+    assert selection.is_full_document
+    assert selection.tokens_saved == 0
+
+
+def test_slice_pdf():
+    sliced = slice_pdf(TEST_FILE_PATH, [2, 4])
+    try:
+        reader = PdfReader(sliced)
+        assert len(reader.pages) == 2
+        assert "MMLU" in reader.pages[0].extract_text()
+        assert sliced.stat().st_size < TEST_FILE_PATH.stat().st_size
+    finally:
+        sliced.unlink()
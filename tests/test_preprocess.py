@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import pandas as pd
+from pypdf import PdfReader
+
+import engines
+from engines import extract_benchmarks
+from preprocess import Preprocessor, preprocess_document
+from titles import title_from_pdf
+
+TEST_FILE_PATH = Path(__file__).parent / "test_data" / "claude_modelcard_excerpt.pdf"
+
+
+def test_preprocess_document():
+    prepared = preprocess_document(TEST_FILE_PATH, locate_pages=True)
+    try:
+        assert prepared.selection.pages == [2, 3, 4, 5, 6, 7, 8]
+        assert len(PdfReader(prepared.request_path).pages) == 7
+        assert prepared.title == title_from_pdf(TEST_FILE_PATH)
+        assert prepared.tables is None
+        assert prepared.errors == []
+    finally:
+        prepared.cleanup()
+    assert not prepared.request_path.exists()
+    assert TEST_FILE_PATH.exists()
+
+
+def test_broken_pdf_falls_back_to_full_file(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "card.pdf"
+    pdf_path.write_bytes(b"%PDF-1 model card")
+
+    def broken_read(file_path, pages=None):
+        raise RuntimeError("no java")
+
+    monkeypatch.setattr(engines, "read_tables", broken_read)
+    prepared = preprocess_document(pdf_path, locate_pages=True, read_tables=True)
+
+    assert prepared.request_path == pdf_path
+    assert prepared.selection is None
+    assert prepared.tables == []
+    assert len(prepared.errors) == 2
+
+
+def test_workers_return_results_to_the_caller():
+    preprocessor = Preprocessor(workers=2)
+    try:
+        futures = [preprocessor.submit(TEST_FILE_PATH) for _ in range(3)]
+        results = [future.result(timeout=60) for future in futures]
+    finally:
+        preprocessor.shutdown()
+
+    try:
+        assert {tuple(r.selection.table_pages) for r in results} == {(2, 3, 4)}
+        assert len({r.request_path for r in results}) == 3
+    finally:
+        for result in results:
+            result.cleanup()
+
+
+def test_engines_use_preprocessed_document(tmp_path, monkeypatch):
+    table = pd.DataFrame(
+        {
+            "Benchmark": ["MMLU [3]", "GSM8K"],
+            "Shots": ["5-shot", "8-shot"],
+            "A": ["86.8%", "95.0%"],
+        }
+    )
+    request_path = tmp_path / "pages.pdf"
+    request_path.write_bytes(b"%PDF-1 table pages")
+    prepared = preprocess_document(tmp_path / "missing.pdf", locate_pages=False)
+    prepared.request_path = request_path
+    prepared.tables = [table]
+    prepared.references = {3: "https://arxiv.org/abs/2009.03300"}
+    monkeypatch.setattr(engines, "EXTRACTION_ENGINES", ["tabula", "llm"])
+    monkeypatch.setattr(engines, "tabula_available", lambda: True)
+
+    result = extract_benchmarks(prepared.file_path, prepared=prepared)
+
+    assert result["name"].tolist() == ["MMLU", "GSM8K"]
+    assert result["test_type"].tolist() == ["5-shot", "8-shot"]
+    assert result["source"].tolist() == ["https://arxiv.org/abs/2009.03300", "-"]
+
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from ratelimit import RateLimiter, TokenBucket, retry_after_seconds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(60, period=60, clock=clock)
+
+    assert bucket.try_acquire(60) == 0
+    assert bucket.try_acquire(1) == pytest.approx(1.0)
+
+    clock.now = 2.0
+    assert bucket.try_acquire(2) == 0
+    assert bucket.try_acquire(1) > 0
+
+
+def test_token_bucket_clamps_oversized_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(10, period=60, clock=clock)
+
+    assert bucket.try_acquire(1000) == 0
+
+
+def test_token_bucket_adjust():
+    clock = FakeClock()
+    bucket = TokenBucket(100, period=60, clock=clock)
+
+    bucket.try_acquire(100)
+    bucket.adjust(40)
+    assert bucket.try_acquire(40) == 0
+    assert bucket.try_acquire(1) > 0
+
+
+def test_rate_limiter_reconciles_usage():
+    clock = FakeClock()
+    limiter = RateLimiter(100, 1000, clock=clock)
+
+    limiter.acquire(1000)
+    limiter.record_usage(estimated_tokens=1000, actual_tokens=200)
+
+    assert limiter.input_tokens.try_acquire(800) == 0
+
+
+def test_rate_limiter_release_gives_back_tokens():
+    clock = FakeClock()
+    limiter = RateLimiter(100, 1000, clock=clock)
+
+    limiter.acquire(1000)
+    limiter.release(1000)
+
+    assert limiter.input_tokens.try_acquire(1000) == 0
+
+
+def test_rate_limiter_pause_blocks_dispatch():
+    limiter = RateLimiter(100, 1000)
+    limiter.pause(0.05)
+
+    start = time.monotonic()
+    limiter.acquire(1)
+
+    assert time.monotonic() - start >= 0.04
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        ({"retry-after": "3"}, 3.0),
+        ({"retry-after-ms": "1500", "retry-after": "3"}, 1.5),
+        ({"retry-after": "600"}, 60.0),
+    ],
+)
+def test_retry_after_seconds_uses_headers(headers, expected):
+    assert retry_after_seconds(headers, attempt=0) == expected
+
+
+def test_retry_after_seconds_falls_back_to_backoff():
+    for attempt in range(5):
+        delay = retry_after_seconds({}, attempt=attempt, base_delay=1.0)
+        assert 0 <= delay <= 2**attempt
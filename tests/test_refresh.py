@@ -0,0 +1,180 @@
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from frontier import DONE, PENDING, Frontier
+from refresh import CHANGED, FAILED, UNCHANGED, refresh_sources
+from scheduler import TIMESTAMP_FORMAT
+from utils import download_file
+
+
+class CardServer:
+    """Serves model cards with an ETag, except /c.pdf, answering HEAD and 304s"""
+
+    def __init__(self):
+        self.cards = {"/a.pdf": b"%PDF-1 card A", "/b.pdf": b"%PDF-1 card B"}
+        self.cards["/c.pdf"] = b"%PDF-1 card C"
+        self.versions = {path: 1 for path in self.cards}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.respond(with_body=False)
+
+            def do_GET(self):
+                self.respond(with_body=True)
+
+            def respond(self, with_body):
+                server.requests.append((self.command, self.path))
+                if self.path not in server.cards:
+                    self.send_error(404)
+                    return
+                body = server.cards[self.path]
+                etag = f'"{server.versions[self.path]}"'
+                if self.path != "/c.pdf" and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if self.path != "/c.pdf":
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if with_body:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    def requests_of(self, command: str, path: str) -> int:
+        return self.requests.count((command, path))
+
+
+@pytest.fixture
+def card_server():
+    server = CardServer()
+    thread = threading.Thread(
+        target=server.httpd.serve_forever, args=(0.05,), daemon=True
+    )
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def test_refresh_recrawls_only_changed_documents(tmp_path, card_server, source_store):
+    month_ago = (datetime.now() - timedelta(days=30)).strftime(TIMESTAMP_FORMAT)
+    yesterday = (datetime.now() - timedelta(days=1)).strftime(TIMESTAMP_FORMAT)
+    sources_path = tmp_path / "model_sources.csv"
+    pd.DataFrame(
+        {
+            "name": ["A", "B", "C", "D"],
+            "url": [card_server.url(p) for p in ["/a.pdf", "/b.pdf", "/c.pdf", "/d"]],
+            "crawled_timestamp": [month_ago, month_ago, month_ago, yesterday],
+            "success": [True, True, True, True],
+            "cost": [0.1, 0.1, 0.1, 0.1],
+        }
+    ).to_csv(sources_path, index=False)
+    # The cards as they were downloaded by the crawl
+    for path in ["/a.pdf", "/b.pdf", "/c.pdf"]:
+        download_file(card_server.url(path))
+    crawled = []
+
+    def crawl_fn(url):
+        crawled.append(url)
+        return 0.2
+
+    # First refresh: no validators yet, the bytes are compared with the cache
+    outcomes = refresh_sources(str(sources_path), crawl_fn)
+    assert outcomes == {UNCHANGED: 3}
+    assert crawled == []
+    # Checked rows are not due again within the staleness window
+    assert refresh_sources(str(sources_path), crawl_fn) == {}
+
+    card_server.cards["/b.pdf"] = b"%PDF-1 card B, updated"
+    card_server.versions["/b.pdf"] = 2
+    card_server.requests.clear()
+
+    outcomes = refresh_sources(str(sources_path), crawl_fn, stale_after=timedelta(0))
+
+    # D is gone from the server, so its row is left for the next refresh
+    assert outcomes == {UNCHANGED: 2, CHANGED: 1, FAILED: 1}
+    assert crawled == [card_server.url("/b.pdf")]
+    # A answered 304 to a conditional HEAD, C has no validators and was fetched
+    assert card_server.requests_of("HEAD", "/a.pdf") == 1
+    assert card_server.requests_of("GET", "/a.pdf") == 0
+    assert card_server.requests_of("GET", "/b.pdf") == 1
+    assert card_server.requests_of("GET", "/c.pdf") == 1
+    sources = pd.read_csv(sources_path).set_index("name")
+    assert sources.at["B", "crawled_timestamp"] > month_ago
+    assert sources.at["B", "cost"] == 0.2
+    assert sources.at["A", "crawled_timestamp"] == month_ago
+    assert sources.at["D", "crawled_timestamp"] == yesterday
+
+    # The frontier holds the new crawl, a later export does not revert it
+    Frontier(source_store).export_metadata(sources_path)
+    sources = pd.read_csv(sources_path).set_index("name")
+    assert sources.at["B", "cost"] == 0.2
+
+
+def test_refresh_leaves_pending_sources_to_the_crawl(
+    tmp_path, card_server, source_store
+):
+    month_ago = (datetime.now() - timedelta(days=30)).strftime(TIMESTAMP_FORMAT)
+    sources_path = tmp_path / "model_sources.csv"
+    pd.DataFrame(
+        {
+            "name": ["A", "B", "E"],
+            "url": [card_server.url(p) for p in ["/a.pdf", "/b.pdf", "/e.pdf"]],
+            "crawled_timestamp": [month_ago, month_ago, None],
+            "success": [True, True, None],
+            "cost": [0.1, 0.1, None],
+        }
+    ).to_csv(sources_path, index=False)
+    for path in ["/a.pdf", "/b.pdf"]:
+        download_file(card_server.url(path))
+    # Left pending by an earlier crawl
+    Frontier(source_store).add(card_server.url("/c.pdf"), depth=1)
+    card_server.cards["/b.pdf"] = b"%PDF-1 card B, updated"
+    card_server.versions["/b.pdf"] = 2
+    crawled = []
+
+    outcomes = refresh_sources(
+        str(sources_path), lambda url: crawled.append(url), stale_after=timedelta(0)
+    )
+
+    assert outcomes == {UNCHANGED: 1, CHANGED: 1}
+    assert crawled == [card_server.url("/b.pdf")]
+    # E was never crawled and C is pending, both wait for the regular crawl
+    frontier = Frontier(source_store)
+    assert frontier.counts() == {DONE: 2, PENDING: 2}
+
+
+def test_refresh_recrawls_stale_failed_rows_without_checking(tmp_path, card_server):
+    month_ago = (datetime.now() - timedelta(days=30)).strftime(TIMESTAMP_FORMAT)
+    sources_path = tmp_path / "model_sources.csv"
+    pd.DataFrame(
+        {
+            "name": ["A"],
+            "url": [card_server.url("/a.pdf")],
+            "crawled_timestamp": [month_ago],
+            "success": [False],
+            "cost": [None],
+        }
+    ).to_csv(sources_path, index=False)
+    crawled = []
+
+    outcomes = refresh_sources(str(sources_path), lambda url: crawled.append(url))
+
+    assert outcomes == {CHANGED: 1}
+    assert crawled == [card_server.url("/a.pdf")]
+    assert card_server.requests == []
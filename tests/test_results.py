@@ -0,0 +1,79 @@
+import math
+
+import pandas as pd
+import pytest
+
+from results import ResultsStore, to_long
+
+CARD_URL = "https://example.com/card.pdf"
+PAPER_URL = "https://arxiv.org/pdf/2403.05530.pdf"
+
+
+@pytest.fixture
+def card_df():
+    return pd.DataFrame(
+        {
+            "name": ["MMLU", "DROP", "GPQA"],
+            "test_type": ["5-shot", "F1 Score", "0-shot CoT"],
+            "Model A": ["86.8%", "83.1", "-"],
+            "Model B": ["79.0%", "78,9", "40.4%"],
+            "source": ["https://arxiv.org/abs/2009.03300", None, None],
+        }
+    )
+
+
+def test_to_long(card_df):
+    long = to_long(card_df, CARD_URL)
+
+    assert list(long.columns) == [
+        "origin",
+        "benchmark",
+        "test_type",
+        "model",
+        "value",
+        "unit",
+    ]
+    assert len(long) == 5
+    assert long["value"].dtype == "float32"
+    mmlu_a = long[(long["benchmark"] == "MMLU") & (long["model"] == "Model A")]
+    assert math.isclose(mmlu_a["value"].item(), 86.8, rel_tol=1e-6)
+    assert mmlu_a["unit"].item() == "%"
+    drop_b = long[(long["benchmark"] == "DROP") & (long["model"] == "Model B")]
+    assert math.isclose(drop_b["value"].item(), 78.9, rel_tol=1e-6)
+    assert drop_b["unit"].item() == ""
+    assert (long["origin"] == CARD_URL).all()
+
+
+def test_append_and_leaderboard(tmp_path, card_df):
+    store = ResultsStore(tmp_path)
+    paper_df = pd.DataFrame(
+        {
+            "name": ["MMLU", "MMLU"],
+            "test_type": ["5-shot", "0-shot"],
+            "Model C": ["90.0%", "85.0%"],
+        }
+    )
+
+    assert store.append(card_df, CARD_URL) == 5
+    assert store.append(paper_df, PAPER_URL) == 2
+
+    leaderboard = store.leaderboard("mmlu", "5-shot")
+    assert leaderboard["model"].tolist() == ["Model C", "Model A", "Model B"]
+    assert leaderboard["origin"].tolist() == [PAPER_URL, CARD_URL, CARD_URL]
+    assert len(store.leaderboard("MMLU")) == 4
+    assert store.leaderboard("Unknown").empty
+
+
+def test_reads_use_the_latest_extraction_of_an_origin(tmp_path, card_df):
+    store = ResultsStore(tmp_path)
+    store.append(card_df, CARD_URL)
+    store.append(card_df.iloc[:1], CARD_URL)
+
+    assert len(store.read()) == 2
+    assert len(store.read(CARD_URL)) == 2
+    assert len(store.leaderboard("MMLU")) == 2
+    assert store.leaderboard("DROP").empty
+    assert store.read(PAPER_URL).empty
+    # Earlier extractions are kept, not overwritten
+    assert len(list(tmp_path.glob("origin=*/*.arrow"))) == 2
+    assert not list(tmp_path.glob("origin=*/*.tmp"))
@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+from scheduler import pending_rows
+
+SOURCES_CSV = """name,url,origin_url,crawled_timestamp,added_timestamp,type,success,cost
+A,https://example.com/a.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+B,https://example.com/b.pdf,example.com,2025-01-10 13:47:39.871897,2025-01-09 15:40:25.588219,model,True,0.1
+C,https://example.com/c.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+D,https://example.com/d.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+E,https://example.com/e.pdf,example.com,,2025-01-09 15:40:25.588219,model,,
+"""
+
+
+@pytest.fixture
+def sources_path(tmp_path):
+    path = tmp_path / "model_sources.csv"
+    path.write_text(SOURCES_CSV)
+    return path
+
+
+def test_pending_rows(sources_path):
+    df = pd.read_csv(sources_path)
+    assert list(pending_rows(df)) == [0, 2, 3, 4]
+
@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+from io import StringIO
+
+import pandas as pd
+
+from store import SourceStore
+
+SOURCES_CSV = """name,url,origin_url,crawled_timestamp,added_timestamp,type,success,cost
+MMLU,https://arxiv.org/pdf/2201.11903.pdf,https://example.com/card.pdf,,2025-01-09 15:40:25.588219,benchmark,,
+MATH,https://arxiv.org/pdf/2110.14168.pdf,https://example.com/card.pdf,2025-01-10 13:47:39.871897,2025-01-09 15:40:25.588219,benchmark,True,0.1
+"""
+
+
+def sources_df(urls, origin="https://example.com/other.pdf"):
+    return pd.DataFrame(
+        {
+            "name": [f"bench-{i}" for i in range(len(urls))],
+            "url": urls,
+            "origin_url": origin,
+            "crawled_timestamp": None,
+            "added_timestamp": pd.Timestamp("2025-01-09 15:40:25.588219"),
+            "type": "benchmark",
+            "success": None,
+            "cost": None,
+        }
+    )
+
+
+def test_add_sources_deduplicates_on_url(tmp_path):
+    store = SourceStore(tmp_path / "sources.db", csv_path=None)
+
+    assert (
+        store.add_sources(sources_df(["https://a.com/1.pdf", "https://a.com/2.pdf"]))
+        == 2
+    )
+    assert (
+        store.add_sources(sources_df(["https://a.com/2.pdf", "https://a.com/3.pdf"]))
+        == 1
+    )
+
+    assert len(store) == 3
+    assert store.has_url("https://a.com/3.pdf")
+    assert not store.has_url("https://a.com/4.pdf")
+    # The first occurrence of a URL wins
+    assert store.read()["name"].tolist() == ["bench-0", "bench-1", "bench-1"]
+
+
+def test_add_sources_deduplicates_on_paper_key(tmp_path):
+    store = SourceStore(tmp_path / "sources.db", csv_path=None)
+    store.add_sources(sources_df(["https://arxiv.org/pdf/2201.11903.pdf"]))
+
+    inserted = store.add_sources(
+        sources_df(
+            [
+                "https://arxiv.org/abs/2201.11903v2",
+                "https://arxiv.org/pdf/2201.11903v1.pdf",
+                "https://aclanthology.org/N19-1246/",
+            ]
+        )
+    )
+
+    assert inserted == 1
+    assert store.has_paper("arxiv:2201.11903")
+    assert store.has_paper("acl:N19-1246")
+    assert len(store) == 2
+
+
+def test_migrates_databases_without_paper_keys(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE sources (id INTEGER PRIMARY KEY, name TEXT,"
+            " url TEXT NOT NULL, origin_url TEXT, crawled_timestamp TEXT,"
+            " added_timestamp TEXT, type TEXT, success INTEGER, cost REAL)"
+        )
+        conn.executemany(
+            "INSERT INTO sources (name, url) VALUES (?, ?)",
+            [
+                ("MMLU", "https://arxiv.org/pdf/2009.03300.pdf"),
+                ("MMLU", "https://arxiv.org/abs/2009.03300"),
+                ("DROP", "https://aclanthology.org/N19-1246/.pdf"),
+            ],
+        )
+    conn.close()
+
+    store = SourceStore(db_path, csv_path=None)
+
+    assert len(store) == 3
+    assert store.has_paper("arxiv:2009.03300")
+    assert store.has_paper("acl:N19-1246")
+    assert store.add_sources(sources_df(["https://arxiv.org/abs/2009.03300v3"])) == 0
+
+
+def test_imports_and_exports_csv(tmp_path):
+    csv_path = tmp_path / "benchmark_sources.csv"
+    csv_path.write_text(SOURCES_CSV)
+
+    store = SourceStore(tmp_path / "sources.db", csv_path=csv_path)
+    assert len(store) == 2
+
+    export_path = tmp_path / "export.csv"
+    store.export_csv(export_path)
+    pd.testing.assert_frame_equal(
+        pd.read_csv(export_path), pd.read_csv(StringIO(SOURCES_CSV))
+    )
+
+    # Reopening an existing store does not import the CSV again
+    assert len(SourceStore(tmp_path / "sources.db", csv_path=csv_path)) == 2
+
+
+def test_concurrent_writers(tmp_path):
+    store = SourceStore(tmp_path / "sources.db", csv_path=None)
+    urls = [f"https://a.com/{i}.pdf" for i in range(50)]
+
+    def add_all():
+        store.add_sources(sources_df(urls))
+
+    threads = [threading.Thread(target=add_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store) == 50
@@ -0,0 +1,120 @@
+import json
+
+import pandas as pd
+import pytest
+
+from app import get_sources
+from titles import TitleIndex, normalize_title
+
+BIG_BENCH = (
+    "Beyond the Imitation Game: Quantifying and extrapolating the capabilities "
+    "of language models"
+)
+BIG_BENCH_URL = "https://arxiv.org/pdf/2206.04615.pdf"
+ARC = "Think you have Solved Question Answering? Try ARC, the AI2 Reasoning Challenge"
+ARC_URL = "https://arxiv.org/pdf/1803.05457.pdf"
+
+
+@pytest.fixture
+def index(title_index):
+    title_index.add_titles(
+        [
+            (BIG_BENCH, BIG_BENCH_URL),
+            (ARC, ARC_URL),
+            ("Measuring Massive Multitask Language Understanding", "https://a.com/1"),
+            ("Measuring Mathematical Problem Solving", "https://a.com/2"),
+        ]
+    )
+    return title_index
+
+
+def test_normalize_title():
+    assert normalize_title("  Think you have Solved QA?  Try ARC… ") == (
+        "think you have solved qa try arc"
+    )
+    assert normalize_title("Évaluation_des modèles") == "evaluation des modeles"
+
+
+@pytest.mark.parametrize(
+    "title,url",
+    [
+        (BIG_BENCH.upper(), BIG_BENCH_URL),
+        ("Beyond the imitation game…", BIG_BENCH_URL),
+        ("Beyond the imitation game: Quantifying and extrapolating", None),
+        (
+            "Think you have Solved Question Answering? Try ARC the AI2 Reasoning "
+            "Challenge",
+            ARC_URL,
+        ),
+        (
+            "Think you have solved question answering? Try ARC, the AI2 Reasonng Chalenge",
+            ARC_URL,
+        ),
+        ("Measuring...", None),
+        ("Training language models to follow instructions", None),
+    ],
+)
+def test_resolve(index, title, url):
+    assert index.resolve(title) == url
+
+
+def test_ambiguous_prefix_is_not_resolved(index):
+    assert index.resolve("Measuring massive multitask...") is not None
+    assert index.resolve("Measuring M...") is None
+
+
+def test_import_dump(tmp_path):
+    index = TitleIndex(tmp_path / "dump_titles.db")
+    jsonl = tmp_path / "arxiv-metadata.json"
+    jsonl.write_text(
+        json.dumps(
+            {"id": "2206.04615", "title": "Beyond the Imitation Game:\n  Quantifying"}
+        )
+        + "\n"
+        + json.dumps({"id": "1803.05457", "title": ARC})
+        + "\n"
+    )
+    csv_path = tmp_path / "titles.csv"
+    pd.DataFrame(
+        {
+            "title": [ARC, "HellaSwag: Can a Machine Really Finish Your Sentence?"],
+            "url": [
+                "https://arxiv.org/abs/1803.05457",
+                "https://arxiv.org/abs/1905.07830",
+            ],
+        }
+    ).to_csv(csv_path, index=False)
+
+    assert index.import_dump(jsonl) == 2
+    assert index.import_dump(csv_path) == 1
+
+    assert len(index) == 3
+    assert index.resolve("Beyond the imitation game: quantifying") == BIG_BENCH_URL
+    assert index.resolve("HellaSwag: Can a machine really finish your sentence") == (
+        "https://arxiv.org/pdf/1905.07830.pdf"
+    )
+
+
+def test_get_sources_resolves_titles(index):
+    input_df = pd.DataFrame(
+        {
+            "name": ["BIG-Bench-Hard", "ARC-Challenge", "Unknown", "MMLU"],
+            "test_type": "5-shot",
+            "source": [
+                "Beyond the imitation game: Quantifying and extrapolating the "
+                "capabilities of language models",
+                ARC,
+                "Some paper nobody indexed",
+                "https://arxiv.org/abs/2009.03300",
+            ],
+        }
+    )
+
+    result = get_sources(input_df, "benchmark", "https://example.com/card.pdf")
+
+    assert result["name"].tolist() == ["BIG-Bench-Hard", "ARC-Challenge", "MMLU"]
+    assert result["url"].tolist() == [
+        BIG_BENCH_URL,
+        ARC_URL,
+        "https://arxiv.org/pdf/2009.03300.pdf",
+    ]
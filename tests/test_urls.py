@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+
+from urls import canonical_url, canonicalize_urls, paper_key
+
+
+@pytest.mark.parametrize(
+    "url,key,canonical",
+    [
+        (
+            "https://arxiv.org/abs/2201.11903",
+            "arxiv:2201.11903",
+            "https://arxiv.org/pdf/2201.11903.pdf",
+        ),
+        (
+            "https://arxiv.org/abs/2201.11903v2",
+            "arxiv:2201.11903",
+            "https://arxiv.org/pdf/2201.11903.pdf",
+        ),
+        (
+            "http://www.arxiv.org/pdf/2201.11903v6.pdf",
+            "arxiv:2201.11903",
+            "https://arxiv.org/pdf/2201.11903.pdf",
+        ),
+        (
+            "https://arxiv.org/pdf/2201.11903",
+            "arxiv:2201.11903",
+            "https://arxiv.org/pdf/2201.11903.pdf",
+        ),
+        (
+            "https://arxiv.org/2201.11903",
+            "arxiv:2201.11903",
+            "https://arxiv.org/pdf/2201.11903.pdf",
+        ),
+        (
+            "https://arxiv.org/abs/hep-th/9901001v1",
+            "arxiv:hep-th/9901001",
+            "https://arxiv.org/pdf/hep-th/9901001.pdf",
+        ),
+        (
+            "https://aclanthology.org/N19-1246/",
+            "acl:N19-1246",
+            "https://aclanthology.org/N19-1246.pdf",
+        ),
+        (
+            "https://aclanthology.org/N19-1246/.pdf",
+            "acl:N19-1246",
+            "https://aclanthology.org/N19-1246.pdf",
+        ),
+        (
+            "https://www.aclweb.org/anthology/n19-1246.pdf",
+            "acl:N19-1246",
+            "https://aclanthology.org/N19-1246.pdf",
+        ),
+        (
+            "https://aclanthology.org/2020.acl-main.1v2.pdf",
+            "acl:2020.acl-main.1",
+            "https://aclanthology.org/2020.acl-main.1.pdf",
+        ),
+        ("https://example.com/paper.pdf", None, "https://example.com/paper.pdf"),
+        (
+            "https://arxiv.org/list/cs.CL/recent",
+            None,
+            "https://arxiv.org/list/cs.CL/recent",
+        ),
+    ],
+)
+def test_paper_key_and_canonical_url(url, key, canonical):
+    assert paper_key(url) == key
+    assert canonical_url(url) == canonical
+
+
+def test_canonicalize_urls_matches_scalar_functions():
+    urls = pd.Series(
+        [
+            "https://arxiv.org/abs/2201.11903v2",
+            "https://aclanthology.org/D17-1082",
+            "https://example.com/paper.pdf",
+            "https://aclanthology.org/2020.acl-main.1/",
+            " HTTP://export.ARXIV.org/pdf/hep-th/9901001v3.pdf?x=1 ",
+            "https://aclweb.org/anthology/n19-1246.pdf",
+            "Attention is all you need",
+            "",
+        ],
+        index=[3, 5, 8, 9, 10, 11, 12, 13],
+    )
+
+    result = canonicalize_urls(urls)
+
+    assert result.index.tolist() == [3, 5, 8, 9, 10, 11, 12, 13]
+    assert result["url"].tolist() == urls.map(canonical_url).tolist()
+    assert result["paper_key"].tolist() == urls.map(paper_key).tolist()
+
+
+def test_canonicalize_urls_leaves_non_strings_unchanged():
+    result = canonicalize_urls(pd.Series([None, 3, "https://arxiv.org/abs/2201.11903"]))
+
+    assert result["url"].tolist() == [None, 3, "https://arxiv.org/pdf/2201.11903.pdf"]
+    assert result["paper_key"].tolist() == [None, None, "arxiv:2201.11903"]
@@ -5,8 +5,13 @@ import pytest
 import responses
 from requests.exceptions import RequestException
 
+from cache import PdfCache
 from constants import claude_pdf_url
-from utils import download_file, encode_file  # Update with your actual module
+from utils import (  # Update with your actual module
+    FileTooLargeError,
+    download_file,
+    encode_file,
+)
 
 # Constants for test data
 TEST_DATA_DIR = Path(__file__).parent / "test_data"
@@ -105,6 +110,21 @@ class TestDownloadFile:
             if downloaded_path.parent.exists():
                 downloaded_path.parent.rmdir()
 
+    def test_download_into_given_empty_cache(
+        self, mock_responses, test_file, tmp_path, pdf_cache
+    ):
+        """Test an empty cache passed explicitly is not swapped for the default"""
+        _, expected_content = test_file
+        mock_responses.add(
+            responses.GET, TEST_FILE_URL, body=expected_content, status=200
+        )
+        cache = PdfCache(tmp_path / "explicit_cache")
+
+        downloaded_path = download_file(TEST_FILE_URL, cache)
+
+        assert cache.get(TEST_FILE_URL) == downloaded_path
+        assert len(pdf_cache) == 0
+
     def test_invalid_url(self):
         """Test handling of invalid URL"""
         with pytest.raises(ValueError, match="Invalid URL"):
@@ -191,3 +211,35 @@ class TestEncodeFile:
         encoded = encode_file(path)
         decoded = base64.b64decode(encoded.encode("utf-8"))
         assert decoded == content
+
+    @pytest.mark.parametrize("chunk_size", [3, 3 * 7, 3 * 1024])
+    def test_chunked_encoding_matches(self, test_file, chunk_size):
+        """Test encoding in chunks gives the same result as encoding at once"""
+        file_path, content = test_file
+        expected = base64.b64encode(content).decode("utf-8")
+
+        assert encode_file(file_path, chunk_size=chunk_size) == expected
+
+    def test_invalid_chunk_size(self, test_file):
+        """Test chunks that would need padding are rejected"""
+        file_path, _ = test_file
+        with pytest.raises(ValueError, match="multiple of 3"):
+            encode_file(file_path, chunk_size=1000)
+
+    def test_empty_file(self, tmp_path):
+        """Test encoding an empty file"""
+        empty = tmp_path / "empty.pdf"
+        empty.write_bytes(b"")
+        assert encode_file(empty) == ""
+
+    def test_file_too_large(self, test_file, monkeypatch):
+        """Test oversized files are refused before being read"""
+        file_path, content = test_file
+
+        def mock_open(*args, **kwargs):
+            raise AssertionError("file should not be opened")
+
+        monkeypatch.setattr("builtins.open", mock_open)
+
+        with pytest.raises(FileTooLargeError):
+            encode_file(file_path, max_bytes=len(content) - 1)